@@ -1,14 +1,17 @@
 # -*- coding: utf-8 -*-
 import logging
-from io import BytesIO
+import time
 from os.path import basename
 from statistics import mean
 
+import numpy as np
+from numba import njit
+
 from iscc_bench.algos.metrics import containment
 from iscc_bench.algos.slide import sliding_window
-import matplotlib.pyplot as plt
 
 from iscc_bench.readers.mltext import mltext
+from iscc_bench.utils import READ_SIZE, is_stream, iter_cuts, map_binary
 
 logr = logging.getLogger(__name__)
 
@@ -281,25 +284,18 @@ CHUNKING_GEAR = [
 
 
 def data_chunks(data):
-
-    if isinstance(data, str):
-        data = open(data, "rb")
-
-    if not hasattr(data, "read"):
-        data = BytesIO(data)
-
-    section = data.read(GEAR2_MAX)
-    while True:
-        if len(section) < GEAR2_MAX:
-            section += data.read(GEAR2_MAX)
-        if len(section) == 0:
-            break
-        boundary = chunk_length(
+    def cut(section):
+        return chunk_length(
             section, GEAR2_NORM, GEAR2_MIN, GEAR2_MAX, GEAR2_MASK1, GEAR2_MASK2,
         )
 
-        yield section[:boundary]
-        section = section[boundary:]
+    # chunk_length never looks past GEAR2_MAX bytes
+    if is_stream(data):
+        yield from iter_cuts(data, cut, GEAR2_MAX)
+        return
+    with map_binary(data) as view:
+        for chunk in iter_cuts(view, cut, GEAR2_MAX):
+            yield bytes(chunk)
 
 
 def chunk_length(data, norm_size, min_size, max_size, mask_1, mask_2):
@@ -327,10 +323,186 @@ def chunk_length(data, norm_size, min_size, max_size, mask_1, mask_2):
     return i
 
 
+###############################################################################
+# Compiled zero-copy chunker                                                  #
+###############################################################################
+
+CHUNKING_GEAR_NP = np.array(CHUNKING_GEAR, dtype=np.uint64)
+
+
+@njit(cache=True)
+def gear_cut_offsets(data, gear, norm_size, min_size, max_size, mask_1, mask_2):
+    """Scan data once and return the end offsets of all chunks.
+
+    Produces the same boundaries as repeated `chunk_length` calls in
+    `data_chunks`. The last offset always equals len(data).
+    """
+    data_length = data.shape[0]
+    cuts = np.empty(data_length // max(min_size, 1) + 1, dtype=np.int64)
+    mask_1 = np.uint64(mask_1)
+    mask_2 = np.uint64(mask_2)
+    n = 0
+    pos = 0
+    while pos < data_length:
+        remaining = data_length - pos
+        if remaining <= min_size:
+            pos = data_length
+            cuts[n] = pos
+            n += 1
+            break
+        pattern = np.uint64(0)
+        i = min_size
+        cut = -1
+        barrier = min(norm_size, remaining)
+        while i < barrier:
+            pattern = (pattern << np.uint64(1)) + gear[data[pos + i]]
+            if not pattern & mask_1:
+                cut = i
+                break
+            i += 1
+        if cut < 0:
+            barrier = min(max_size, remaining)
+            while i < barrier:
+                pattern = (pattern << np.uint64(1)) + gear[data[pos + i]]
+                if not pattern & mask_2:
+                    cut = i
+                    break
+                i += 1
+        if cut < 0:
+            cut = i
+        pos += cut
+        cuts[n] = pos
+        n += 1
+    return cuts[:n]
+
+
+def data_chunk_offsets(data):
+    """Numpy array with the end offsets of all `data_chunks`"""
+    if is_stream(data):
+        sizes = [len(chunk) for chunk in _stream_chunks(data)]
+        return np.cumsum(sizes, dtype=np.int64)
+    with map_binary(data) as view:
+        return _chunk_offsets(view)
+
+
+def _chunk_offsets(view):
+    return gear_cut_offsets(
+        np.frombuffer(view, dtype=np.uint8),
+        CHUNKING_GEAR_NP,
+        GEAR2_NORM,
+        GEAR2_MIN,
+        GEAR2_MAX,
+        GEAR2_MASK1,
+        GEAR2_MASK2,
+    )
+
+
+def _stream_chunks(stream):
+    """Chunks of a stream read in READ_SIZE buffers.
+
+    Chunks that start less than GEAR2_MAX bytes before the end of a buffer may
+    be cut short, they are carried over to the next buffer.
+    """
+    buffer = b""
+    while True:
+        data = stream.read(READ_SIZE)
+        buffer = buffer + data if buffer else data
+        if not buffer:
+            return
+        view = memoryview(buffer)
+        start = 0
+        for end in _chunk_offsets(view).tolist():
+            if data and start + GEAR2_MAX > len(view):
+                break
+            yield view[start:end]
+            start = end
+        if not data:
+            return
+        buffer = bytes(view[start:])
+
+
+def data_chunks_mv(data):
+    """Like `data_chunks` but yields zero-copy memoryview slices.
+
+    Streams that can not be memory-mapped are read in buffers (`_stream_chunks`).
+    """
+    if is_stream(data):
+        yield from _stream_chunks(data)
+        return
+    with map_binary(data) as view:
+        start = 0
+        for end in _chunk_offsets(view).tolist():
+            yield view[start:end]
+            start = end
+
+
+def test_data_chunk_offsets():
+    import io
+    import tempfile
+
+    rand = np.random.RandomState(seed=7)
+    samples = [b"", b"a", rand.bytes(GEAR2_MIN), rand.bytes(GEAR2_MIN + 1)]
+    samples += [rand.bytes(n) for n in (GEAR2_MAX, GEAR2_MAX * 3 + 17, 200000)]
+    samples.append(bytes(100000))  # no content defined cuts
+    samples.append(rand.bytes(READ_SIZE * 2 + 17))  # stream buffer boundaries
+    for data in samples:
+        ref = [bytes(c) for c in data_chunks(data)]
+        assert [bytes(c) for c in data_chunks_mv(data)] == ref
+        assert np.cumsum([len(c) for c in ref]).tolist() == data_chunk_offsets(
+            data
+        ).tolist()
+        # BytesIO is viewed in place, other streams are read in buffers
+        for stream in (io.BytesIO, lambda d: io.BufferedReader(io.BytesIO(d))):
+            for func in (data_chunks, data_chunks_mv):
+                assert [bytes(c) for c in func(stream(data))] == ref
+            assert data_chunk_offsets(stream(data)).tolist() == (
+                data_chunk_offsets(data).tolist()
+            )
+    # file objects are read from their current position
+    data = samples[-1]
+    with tempfile.TemporaryFile() as f:
+        f.write(data)
+        for pos in (0, 100000, len(data)):
+            ref = [bytes(c) for c in data_chunks(data[pos:])]
+            for func in (data_chunks, data_chunks_mv):
+                f.seek(pos)
+                assert [bytes(c) for c in func(f)] == ref
+
+
+def benchmark_data_chunks(size=20 * 1024 * 1024):
+    """Compare MB/s of data_chunks with the compiled chunker
+
+    Results for 20 MB random data:
+        data_chunks         :     6.84 MB/s
+        data_chunks_mv      :  1296.88 MB/s
+        data_chunk_offsets  :  1425.91 MB/s
+    """
+    data = np.random.RandomState(seed=7).bytes(size)
+    mb = size / 1024 / 1024
+    data_chunk_offsets(data[:GEAR2_MAX * 2])  # exclude jit compile time
+
+    start = time.time()
+    n_ref = sum(1 for _ in data_chunks(data[: size // 20]))
+    rt_ref = (time.time() - start) * 20
+    print(f"data_chunks         : {mb / rt_ref:8.2f} MB/s ({n_ref * 20} chunks est.)")
+
+    start = time.time()
+    n_mv = sum(1 for _ in data_chunks_mv(data))
+    rt_mv = time.time() - start
+    print(f"data_chunks_mv      : {mb / rt_mv:8.2f} MB/s ({n_mv} chunks)")
+
+    start = time.time()
+    offsets = data_chunk_offsets(data)
+    rt_off = time.time() - start
+    print(f"data_chunk_offsets  : {mb / rt_off:8.2f} MB/s ({len(offsets)} chunks)")
+
+
 SAMPLES = 500
 
 
 def test_data_chunks():
+    import matplotlib.pyplot as plt
+
     fps = list(mltext())[:SAMPLES]
 
     losses = []
@@ -9,8 +9,7 @@ from iscc_bench.algos.metrics import jaccard
 from iscc_bench.algos.slide import sliding_window
 from iscc_bench.readers.mltext import mltext
 from iscc_bench.textid.normalize import text_normalize
-from iscc_bench.utils import load_text_file
-import matplotlib.pyplot as plt
+from iscc_bench.utils import iter_cuts, load_text_file
 
 logr = logging.getLogger(__name__)
 
@@ -283,18 +282,13 @@ CHUNKING_GEAR = [
 
 
 def chunk_text(stream: TextIO):
-    section = stream.read(GEAR2_MAX)
-    while True:
-        if len(section) < GEAR2_MAX:
-            section += stream.read(GEAR2_MAX)
-        if len(section) == 0:
-            break
-        boundary = chunk_length(
+    def cut(section):
+        return chunk_length(
             section, GEAR2_NORM, GEAR2_MIN, GEAR2_MAX, GEAR2_MASK1, GEAR2_MASK2,
         )
 
-        yield section[:boundary]
-        section = section[boundary:]
+    # chunk_length never looks past GEAR2_MAX characters
+    yield from iter_cuts(stream, cut, GEAR2_MAX)
 
 
 def chunk_length(text, norm_size, min_size, max_size, mask_1, mask_2):
@@ -326,6 +320,8 @@ SAMPLES = 500
 
 
 def test_text_chunks():
+    import matplotlib.pyplot as plt
+
     fps = list(mltext())
 
     losses = []
@@ -8,12 +8,10 @@ from math import log
 from pprint import pprint
 from typing import List
 from statistics import mean
-from hyperopt import hp, fmin, tpe, Trials
 from iscc_bench.algos.metrics import containment
 from iscc_bench.algos.slide import sliding_window
 from os.path import basename
 from iscc_bench.readers.mltext import mltext
-import matplotlib.pyplot as plt
 
 logr = logging.getLogger(__name__)
 
@@ -86,6 +84,8 @@ def chunk_data(data, min_size, max_size, shift) -> List[bytes]:
 
 
 def objective(space):
+    import matplotlib.pyplot as plt
+
     fps = list(mltext())[:SAMPLES]
 
     min_size = int(space["min_size"])
@@ -152,6 +152,8 @@ def objective(space):
 
 
 def optimize():
+    from hyperopt import hp, fmin, tpe, Trials
+
     space = {
         "min_size": hp.qloguniform("min_size", log(40), log(256), 1),
         "max_size": hp.qloguniform("max_size", log(512), log(8000), 1),
@@ -7,14 +7,13 @@ from typing import TextIO
 from os.path import basename
 from statistics import mean
 from xxhash import xxh64_intdigest
-from hyperopt import hp, fmin, tpe, Trials
 import math
 
 from iscc_bench.algos.metrics import jaccard
 from iscc_bench.algos.slide import sliding_window
 from iscc_bench.readers.mltext import mltext
 from iscc_bench.textid.normalize import text_normalize
-from iscc_bench.utils import load_text_file
+from iscc_bench.utils import iter_cuts, load_text_file
 
 logr = logging.getLogger(__name__)
 
@@ -62,16 +61,11 @@ def chunk_length(text, norm, gear, MASK_1, MASK_2):
 
 def chunk_text(stream: TextIO, NORM, GEAR, MASK_1, MASK_2):
     MAX = NORM * 8
-    section = stream.read(MAX)
-    while True:
-        if len(section) < MAX:
-            section += stream.read(MAX)
-        if len(section) == 0:
-            break
-        boundary = chunk_length(section, NORM, GEAR, MASK_1, MASK_2)
 
-        yield section[:boundary]
-        section = section[boundary:]
+    def cut(section):
+        return chunk_length(section, NORM, GEAR, MASK_1, MASK_2)
+
+    yield from iter_cuts(stream, cut, MAX)
 
 
 def objective(space):
@@ -137,6 +131,8 @@ def objective(space):
 
 
 def optimize():
+    from hyperopt import hp, fmin, tpe, Trials
+
     space = {
         "NORM": hp.qloguniform("NORM", math.log(1024), math.log(8192), 1),
         "SEED": hp.qloguniform("SEED", math.log(1), math.log(1000), 1),
@@ -9,6 +9,7 @@ import json
 from typing import Sequence
 from itertools import islice
 import iscc
+from iscc_bench.cache import cached
 
 SPLIT_MIN_LOWEST = 5
 HEAD_CID_A = b"\x14"
@@ -37,6 +38,7 @@ def generate_audio_id(filepath, partial=False):
     return iscc.encode(content_id_audio_digest)
 
 
+@cached("chroma_vector")
 def get_chroma_vector(filepath) -> Sequence[int]:
     """Returns 32-bit (4 byte) integers as features"""
     cmd = ["fpcalc", filepath, "-raw", "-json"]
@@ -0,0 +1,453 @@
+# -*- coding: utf-8 -*-
+"""Hamming space search for 64-bit ISCC component digests.
+
+`HammingIndex` implements multi-index hashing (Norouzi et al. 2012). The 64-bit
+codes are split into m disjoint bit-blocks with one sorted lookup table per
+block. By the pigeonhole principle two codes within Hamming radius r agree in
+at least one block up to floor(r / m) bits, so only block neighbours up to that
+radius are probed and the candidates are verified with a vectorized popcount.
+
+The number of blocks is chosen per index size and expected radius by a cost
+model of probes and candidate verifications (`best_blocks`), it matches the
+fastest m of 2..9 measured for 200k and 1M codes at r=4 and r=8.
+
+Results for random codes and 100 queries:
+
+200k codes, r=4, m=5: linear scan   23.04 ms - mih index  0.64 ms (36x)
+200k codes, r=8, m=5: linear scan   22.29 ms - mih index  1.30 ms (17x)
+1M   codes, r=4, m=3: linear scan  115.91 ms - mih index  0.55 ms (210x)
+1M   codes, r=8, m=3: linear scan  118.78 ms - mih index  1.55 ms (77x)
+10M  codes, r=4, m=3: linear scan 2427.91 ms - mih index  7.66 ms (317x)
+10M  codes, r=8, m=3: linear scan 2372.38 ms - mih index 11.06 ms (214x)
+
+Speedups of two orders of magnitude are reached from ~1M codes at r=4 and
+from ~10M codes at r=8. Below that the target is not met: at r=8 the
+pigeonhole bound leaves thousands of candidates per query on random codes
+(fewer, wider blocks need more probes instead) and the per query overhead of
+a few microseconds is a large part of a linear scan of 200k codes.
+
+Bulk distances decode lists of codes once into uint64 arrays (`decode_codes`)
+and compute one-to-many, paired and blocked many-to-many distance matrices.
+"""
+import base64
+import math
+import time
+from functools import lru_cache
+from itertools import combinations
+import numpy as np
+from numba import njit
+
+IMAGE_ID_SYMBOLS = "H9ITDKR83F4SV12PAXWBYG57JQ6OCNMLUEZ"
+ISCC_SYMBOLS = "C23456789rB1ZEFGTtYiAaVvMmHUPWXKDNbcdefghLjkSnopRqsJuQwxyz"
+ISCC_VALUES = np.zeros(256, dtype=np.uint64)
+ISCC_VALUES[np.frombuffer(ISCC_SYMBOLS.encode("ascii"), np.uint8)] = np.arange(58)
+MASK_56 = np.uint64((1 << 56) - 1)
+POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount64(x):
+    """Vectorized number of set bits for an array of uint64"""
+    x = np.ascontiguousarray(x, dtype=np.uint64)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(x)
+    return POPCOUNT_TABLE[x.view(np.uint8)].reshape(x.shape + (8,)).sum(-1)
+
+
+def decode_iscclib(code):
+    """Decode iscclib (MetaID/ImageID) string to 64-bit integer"""
+    n = len(IMAGE_ID_SYMBOLS)
+    ident = 0
+    for i, digit in enumerate(code):
+        ident += IMAGE_ID_SYMBOLS.index(digit) * (n ** i)
+    return ident & ((1 << 64) - 1)
+
+
+def decode_iscc(codes):
+    """Decode 13 char ISCC component codes (or 11 char bodies) to uint64 digests"""
+    if not len(codes):
+        return np.empty(0, dtype=np.uint64)
+    chars = np.frombuffer("".join(c[-11:] for c in codes).encode("ascii"), np.uint8)
+    values = ISCC_VALUES[chars.reshape(len(codes), 11)]
+    digests = np.zeros(len(codes), dtype=np.uint64)
+    for col in range(11):
+        digests = digests * np.uint64(58) + values[:, col]
+    return digests
+
+
+def decode_base32(codes):
+    """Decode base32 Meta-ID codes (scripts/meta.py) to their 56 bit body"""
+    raw = b"".join(base64.b32decode(c + "===") for c in codes)
+    return np.frombuffer(raw, dtype=">u8").astype(np.uint64) & MASK_56
+
+
+DECODERS = {
+    "iscc": decode_iscc,
+    "base32": decode_base32,
+    "iscclib": lambda codes: np.array(
+        [decode_iscclib(c) for c in codes], dtype=np.uint64
+    ),
+}
+
+
+def decode_codes(codes, encoding="iscc"):
+    """Decode a list of codes once into a uint64 array.
+
+    :param codes: sequence of code strings
+    :param str encoding: "iscc" (base58-iscc), "base32" (scripts/meta.py) or
+        "iscclib" (MetaID/ImageID)
+    """
+    return DECODERS[encoding](list(codes))
+
+
+def distances(codes, query):
+    """One-to-many Hamming distances of a uint64 query to all codes"""
+    return popcount64(np.asarray(codes, dtype=np.uint64) ^ np.uint64(query))
+
+
+def paired_distances(a, b):
+    """Element wise Hamming distances of two aligned uint64 arrays"""
+    return popcount64(np.asarray(a, dtype=np.uint64) ^ np.asarray(b, dtype=np.uint64))
+
+
+def iter_distance_blocks(a, b=None, block_size=4096):
+    """Yield (row offset, block) of the many-to-many distance matrix.
+
+    Each block holds at most block_size rows, so the memory per step is
+    bounded by block_size * len(b) bytes.
+    """
+    a = np.asarray(a, dtype=np.uint64)
+    b = a if b is None else np.asarray(b, dtype=np.uint64)
+    for start in range(0, len(a), block_size):
+        rows = a[start : start + block_size, None]
+        yield start, popcount64(rows ^ b[None, :]).astype(np.uint8)
+
+
+def distance_matrix(a, b=None, block_size=4096):
+    """Full (len(a) x len(b)) uint8 Hamming distance matrix"""
+    b = a if b is None else b
+    out = np.empty((len(a), len(b)), dtype=np.uint8)
+    for start, block in iter_distance_blocks(a, b, block_size):
+        out[start : start + len(block)] = block
+    return out
+
+
+def distance_histogram(a, b=None, block_size=4096):
+    """Histogram (65 bins) of all pairwise distances without the full matrix.
+
+    With b=None only the pairs i < j of a are counted.
+    """
+    hist = np.zeros(65, dtype=np.int64)
+    for start, block in iter_distance_blocks(a, b, block_size):
+        if b is None:
+            rows = np.arange(start, start + len(block))[:, None]
+            block = block[np.arange(len(a))[None, :] > rows]
+        hist += np.bincount(block.ravel(), minlength=65)
+    return hist
+
+
+def distance_stats(dists):
+    """Summary statistics of an array of distances"""
+    dists = np.asarray(dists)
+    if not len(dists):
+        return dict(n=0)
+    return dict(
+        n=len(dists),
+        mean=float(dists.mean()),
+        min=int(dists.min()),
+        max=int(dists.max()),
+        zero=int((dists == 0).sum()),
+    )
+
+
+@lru_cache(maxsize=None)
+def flip_masks(bits, radius):
+    """All bit masks of width `bits` with at most `radius` bits set"""
+    masks = [0]
+    for r in range(1, radius + 1):
+        for idxs in combinations(range(bits), r):
+            masks.append(sum(1 << i for i in idxs))
+    return np.array(masks, dtype=np.uint64)
+
+
+@njit(cache=True)
+def _popcount(x):
+    x = x - ((x >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    x = (x & np.uint64(0x3333333333333333)) + (
+        (x >> np.uint64(2)) & np.uint64(0x3333333333333333)
+    )
+    x = (x + (x >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return (x * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+
+@njit(cache=True)
+def _mih_radius(
+    codes,
+    keys,
+    orders,
+    starts,
+    shifts,
+    widths,
+    masks,
+    n_masks,
+    query,
+    radius,
+    seen,
+    stamp,
+    out_idx,
+    out_dist,
+):
+    # codes are stored per block in key order: candidates are verified with
+    # sequential reads, only matches touch `orders` and `seen` at random.
+    # Matches beyond the size of the output buffers are counted, not written
+    # (growing arrays inside the loop makes every iteration slower).
+    n = 0
+    for b in range(keys.shape[0]):
+        block_mask = (np.uint64(1) << np.uint64(widths[b])) - np.uint64(1)
+        qb = (query >> np.uint64(shifts[b])) & block_mask
+        block_keys = keys[b]
+        for j in range(n_masks[b]):
+            key = qb ^ masks[b, j]
+            if starts.shape[1]:
+                lo = starts[b, key]
+                hi = starts[b, key + np.uint64(1)]
+            else:
+                lo = np.searchsorted(block_keys, key, side="left")
+                hi = np.searchsorted(block_keys, key, side="right")
+            for p in range(lo, hi):
+                d = _popcount(codes[b, p] ^ query)
+                if d <= radius:
+                    i = orders[b, p]
+                    if seen[i] == stamp:
+                        continue
+                    seen[i] = stamp
+                    if n < out_idx.shape[0]:
+                        out_idx[n] = i
+                        out_dist[n] = d
+                    n += 1
+    return n
+
+
+def block_widths(m):
+    """Bit widths of m blocks of a 64-bit code"""
+    return [64 // m + (i < 64 % m) for i in range(m)]
+
+
+def direct_buckets(n, widths):
+    """Whether blocks of these widths use direct addressed bucket offsets"""
+    return (1 << max(widths)) <= 8 * n
+
+
+def query_cost(n, m, radius):
+    """Estimated cost of a radius query on n random codes with m blocks.
+
+    Probes (a bucket lookup or a binary search) plus expected candidates to
+    verify, in units of one candidate verification.
+    """
+    widths = block_widths(m)
+    probe = 8 if direct_buckets(n, widths) else 4 * math.log2(max(n, 2))
+    cost = 0.0
+    for w in widths:
+        probes = sum(math.comb(w, k) for k in range(min(radius // m, w) + 1))
+        cost += probes * (probe + n / 2 ** w)
+    return cost
+
+
+def best_blocks(n, radius):
+    """Number of blocks (1..16) with the lowest `query_cost`"""
+    return min(range(1, 17), key=lambda m: query_cost(n, m, radius))
+
+
+class HammingIndex:
+    """Multi-index hashing for radius and k-nearest neighbour queries"""
+
+    def __init__(self, codes, m=None, radius=8):
+        """
+        :param codes: uint64 array (or sequence of ints) of codes
+        :param int m: number of bit-blocks (default: `best_blocks` for radius)
+        :param int radius: largest expected query radius (used to choose m)
+        """
+        self.codes = np.ascontiguousarray(codes, dtype=np.uint64)
+        self.m = m or best_blocks(len(self.codes), radius)
+        self.widths = np.array(block_widths(self.m), dtype=np.int64)
+        self.shifts = np.concatenate(([0], np.cumsum(self.widths)[:-1]))
+        self.keys = np.empty((self.m, len(self.codes)), dtype=np.uint64)
+        self.orders = np.empty((self.m, len(self.codes)), dtype=np.int64)
+        self.block_codes = np.empty((self.m, len(self.codes)), dtype=np.uint64)
+        for b in range(self.m):
+            mask = np.uint64((1 << int(self.widths[b])) - 1)
+            keys = (self.codes >> np.uint64(self.shifts[b])) & mask
+            order = np.argsort(keys, kind="stable")
+            self.keys[b] = keys[order]
+            self.orders[b] = order
+            self.block_codes[b] = self.codes[order]
+        # Direct addressed bucket offsets instead of binary search on small blocks
+        n_buckets = 1 << int(self.widths.max())
+        if direct_buckets(len(self.codes), self.widths.tolist()):
+            buckets = np.arange(n_buckets + 1, dtype=np.uint64)
+            dtype = np.int32 if len(self.codes) < 2 ** 31 else np.int64
+            self.starts = np.empty((self.m, n_buckets + 1), dtype=dtype)
+            for b in range(self.m):
+                self.starts[b] = np.searchsorted(self.keys[b], buckets)
+        else:
+            self.starts = np.empty((self.m, 0), dtype=np.int64)
+        self._seen = np.zeros(len(self.codes), dtype=np.int64)
+        self._stamp = 0
+        self._out_idx = np.empty(64, dtype=np.int64)
+        self._out_dist = np.empty(64, dtype=np.int64)
+        self._masks = {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def _probe_masks(self, radius):
+        block_radius = radius // self.m
+        if block_radius in self._masks:
+            return self._masks[block_radius]
+        masks = [flip_masks(int(w), min(block_radius, int(w))) for w in self.widths]
+        n_masks = np.array([len(m) for m in masks], dtype=np.int64)
+        table = np.zeros((self.m, n_masks.max()), dtype=np.uint64)
+        for b, m in enumerate(masks):
+            table[b, : len(m)] = m
+        self._masks[block_radius] = table, n_masks
+        return table, n_masks
+
+    def radius(self, query, radius):
+        """Return (indices, distances) of all codes within Hamming radius"""
+        masks, n_masks = self._probe_masks(radius)
+        while True:
+            self._stamp += 1
+            n = _mih_radius(
+                self.block_codes,
+                self.keys,
+                self.orders,
+                self.starts,
+                self.shifts,
+                self.widths,
+                masks,
+                n_masks,
+                np.uint64(query),
+                radius,
+                self._seen,
+                self._stamp,
+                self._out_idx,
+                self._out_dist,
+            )
+            if n <= len(self._out_idx):
+                break
+            # rerun with output buffers that fit all matches
+            self._out_idx = np.empty(2 * n, dtype=np.int64)
+            self._out_dist = np.empty(2 * n, dtype=np.int64)
+        idxs, dists = self._out_idx[:n], self._out_dist[:n]
+        order = np.argsort(idxs)
+        return idxs[order], dists[order]
+
+    def nearest(self, query, k=1):
+        """Return (indices, distances) of the k nearest codes"""
+        k = min(k, len(self.codes))
+        for radius in range(0, 65):
+            idxs, dists = self.radius(query, radius)
+            if len(idxs) >= k:
+                break
+        order = np.lexsort((idxs, dists))[:k]
+        return idxs[order], dists[order]
+
+
+def linear_radius(codes, query, radius):
+    """Reference linear scan for radius queries"""
+    dists = popcount64(codes ^ np.uint64(query))
+    idxs = np.flatnonzero(dists <= radius)
+    return idxs, dists[idxs]
+
+
+def codes_from_es(index="iscc_meta_id", field="meta_id"):
+    """Load ES document ids and decoded 64-bit codes from an index.
+
+    Use index="iscc_images" with field="pHash" (or aHash/bHash/dHash/wHash)
+    for image hashes.
+    """
+    from elasticsearch import Elasticsearch, helpers
+
+    es = Elasticsearch()
+    ids, codes = [], []
+    query = {"query": {"match_all": {}}, "_source": [field]}
+    for entry in helpers.scan(es, index=index, query=query):
+        ids.append(entry["_id"])
+        codes.append(decode_iscclib(entry["_source"][field]))
+    return ids, np.array(codes, dtype=np.uint64)
+
+
+def test_hamming_index():
+    rand = np.random.RandomState(seed=64)
+    codes = rand.randint(0, 2 ** 64 - 1, 20000, dtype=np.uint64)
+    # plant near duplicates of the first 50 codes
+    flips = [
+        np.uint64(sum(1 << int(b) for b in rand.choice(64, rand.randint(0, 12), False)))
+        for _ in range(50)
+    ]
+    codes = np.concatenate([codes, codes[:50] ^ np.array(flips, dtype=np.uint64)])
+    index = HammingIndex(codes)
+    for q in codes[:50]:
+        for r in (0, 3, 8, 12):
+            a, da = index.radius(q, r)
+            b, db = linear_radius(codes, q, r)
+            assert a.tolist() == b.tolist() and da.tolist() == db.tolist()
+        idxs, dists = index.nearest(q, 3)
+        assert dists.dtype == np.int64
+        ref = sorted(zip(popcount64(codes ^ q).tolist(), range(len(codes))))[:3]
+        assert list(zip(dists.tolist(), idxs.tolist())) == ref
+    assert [best_blocks(n, 8) for n in (200000, 10 ** 6, 10 ** 7)] == [5, 3, 3]
+    assert HammingIndex(codes, radius=4).radius(codes[0], 4)[0].tolist() == (
+        linear_radius(codes, codes[0], 4)[0].tolist()
+    )
+    assert decode_iscclib("9H") == 1
+    assert popcount64(np.array([0, 1, 2 ** 64 - 1], dtype=np.uint64)).tolist() == [0, 1, 64]
+
+
+def test_distances():
+    import iscc
+
+    rand = np.random.RandomState(seed=9)
+    digests = rand.randint(0, 2 ** 64 - 1, 200, dtype=np.uint64)
+    codes = [iscc.encode(iscc.HEAD_CID_T + int(d).to_bytes(8, "big")) for d in digests]
+    assert decode_iscc(codes).tolist() == digests.tolist()
+    dists = paired_distances(decode_codes(codes[:100]), decode_codes(codes[100:]))
+    assert dists.tolist() == [iscc.distance(x, y) for x, y in zip(codes, codes[100:])]
+
+    mids = [base64.b32encode(b"\x00" + rand.bytes(7)).rstrip(b"=").decode() for _ in range(50)]
+    ints = decode_codes(mids, "base32")
+    for i, mid in enumerate(mids):
+        assert int(ints[i]) == int.from_bytes(base64.b32decode(mid + "===")[1:8], "big")
+
+    matrix = distance_matrix(digests, block_size=7)
+    ref = [[bin(int(x) ^ int(y)).count("1") for y in digests] for x in digests]
+    assert matrix.tolist() == ref
+    hist = distance_histogram(digests, block_size=7)
+    assert hist.sum() == 200 * 199 // 2
+    assert hist.tolist() == np.bincount(matrix[np.triu_indices(200, 1)], minlength=65).tolist()
+    assert distance_histogram(digests[:5], digests[5:20]).sum() == 75
+
+
+def benchmark(n=1000000, n_queries=100, radius=8):
+    rand = np.random.RandomState(seed=64)
+    codes = rand.randint(0, 2 ** 64 - 1, n, dtype=np.uint64)
+    queries = codes[rand.choice(n, n_queries)]
+    print(f"\nHamming radius {radius} search on {n} codes ({n_queries} queries):\n")
+    start = time.time()
+    index = HammingIndex(codes, radius=radius)
+    print(f"index build : {(time.time() - start) * 1000:.2f} ms (m={index.m})")
+    index.radius(queries[0], radius)  # exclude jit compile time
+    start = time.time()
+    ref = [linear_radius(codes, q, radius)[0].tolist() for q in queries]
+    rt_linear = time.time() - start
+    print(f"linear scan : {rt_linear * 1000:.2f} ms")
+    start = time.time()
+    res = [index.radius(q, radius)[0].tolist() for q in queries]
+    rt_index = time.time() - start
+    print(f"mih index   : {rt_index * 1000:.2f} ms ({rt_linear / rt_index:.0f}x)")
+    assert res == ref
+
+
+if __name__ == "__main__":
+    test_hamming_index()
+    test_distances()
+    benchmark()
@@ -12,22 +12,58 @@ minhash_ref_192   : 131.68 ms runtime
 minhash_xor       : 447.82 ms runtime
 minhash_xor_np    : 147.60 ms runtime
 minhash_xor_numba : 10.97 ms runtime
+
+Batched implementations process a ragged set of documents passed as one flat
+feature buffer plus an offsets array (``offsets[d]:offsets[d + 1]`` are the
+features of document ``d``) and return an (n_docs x n_perms) signature matrix.
+
+The numba kernels have explicit signatures and are cached on disk, so only the
+first process on a machine pays the compile time. They are compiled (or loaded
+from the cache) on their first call (`lazy_njit`), importing the module does
+not touch them. First call latency in a fresh process (1000 features, lazy jit
+-> cached signatures, the first kernel also initializes numba):
+
+minhash_ref_numba : 543.88 ms -> 128.97 ms
+minhash_xor_numba : 170.06 ms -> 2.84 ms
+minhash_xor_192   : 213.30 ms -> 4.91 ms
+minhash_ref_192   : 187.82 ms -> 3.74 ms
+import            : 212.79 ms -> 202.29 ms
 """
 import time
+from functools import wraps
 from itertools import chain
 import numpy as np
 from xxhash import xxh32_intdigest, xxh64_intdigest
-from numba import njit
+import numba
+from numba import njit, prange
 from statistics import mean, variance
 
 from iscc_bench.algos.const import MINHASH_PERMUTATIONS
 from iscc_bench.algos.metrics import jaccard
 from iscc_bench.algos.slide import sliding_window
-from iscc_bench.readers.gutenberg import gutenberg
-from iscc_bench.readers.mltext import mltext
 from iscc_bench.textid.normalize import text_normalize
 from iscc_bench.utils import load_text_file
 
+
+def lazy_njit(signature, **options):
+    """Like `njit(signature, ...)` but compiled (or loaded from the disk cache)
+    on the first call instead of at import. Other signatures are rejected."""
+
+    def decorate(func):
+        dispatcher = njit(**options)(func)
+
+        @wraps(func)
+        def kernel(*args):
+            if not dispatcher.signatures:
+                dispatcher.compile(signature)
+                dispatcher.disable_compile()
+            return dispatcher(*args)
+
+        kernel.dispatcher = dispatcher
+        return kernel
+
+    return decorate
+
 rand = np.random.RandomState(seed=28)
 
 MAX_UINT64 = (1 << 64) - 1
@@ -93,8 +129,8 @@ PERMS_NUMBA = np.array(
 )
 
 
-@njit
-def minhash_ref_numba(features_32):
+@lazy_njit("uint64[::1](uint32[::1])", cache=True)
+def minhash_ref_kernel(features_32):
     _mersenne_prime = np.uint64((1 << 61) - 1)
     _max_hash = np.uint32((1 << 32) - 1)
 
@@ -108,6 +144,11 @@ def minhash_ref_numba(features_32):
     return hashvalues
 
 
+def minhash_ref_numba(features_32):
+    """Numpy & Numba supported implementation"""
+    return minhash_ref_kernel(np.ascontiguousarray(features_32, dtype=np.uint32))
+
+
 ###############################################################################
 # Simplified implementations with XOR based random permutations               #
 ###############################################################################
@@ -126,15 +167,23 @@ def minhash_xor_np(features, masks=MASKS_64_NP):
     return hashes.tolist()
 
 
-@njit
-def minhash_xor_numba(features, masks=MASKS_64_NP):
-    """Numpy & Numba supported implementation"""
+@lazy_njit("uint64[::1](uint64[::1], uint64[::1])", cache=True)
+def minhash_xor_kernel(features, masks):
     hashes = np.full(64, MAX_UINT64, dtype=np.uint64)
     for f in features:
-        hashes = np.minimum(hashes, np.bitwise_xor(masks, f))
+        for j in range(64):
+            h = f ^ masks[j]
+            if h < hashes[j]:
+                hashes[j] = h
     return hashes
 
 
+def minhash_xor_numba(features, masks=MASKS_64_NP):
+    """Numpy & Numba supported implementation"""
+    # the kernel is compiled for contiguous uint64 only (uint32 features too)
+    return minhash_xor_kernel(np.ascontiguousarray(features, dtype=np.uint64), masks)
+
+
 ###############################################################################
 # Compare Universal Hash vs XOR at 192 permutations with 32 bit features      #
 ###############################################################################
@@ -142,22 +191,30 @@ MAX_UINT32 = 2 ** 32 - 1
 PERMS_192_NP = rand.randint(0, MAX_UINT32, 192, dtype=np.uint32)
 
 
-@njit
-def minhash_xor_192(features_32, masks=PERMS_192_NP):
-    """Numpy & Numba supported implementation"""
+@lazy_njit("uint32[::1](uint32[::1], uint32[::1])", cache=True)
+def minhash_xor_192_kernel(features_32, masks):
     hashes = np.full(192, np.uint32(MAX_UINT32))
     for f in features_32:
-        hashes = np.minimum(hashes, np.bitwise_xor(masks, f))
+        for j in range(192):
+            h = f ^ masks[j]
+            if h < hashes[j]:
+                hashes[j] = h
     return hashes
 
 
+def minhash_xor_192(features_32, masks=PERMS_192_NP):
+    """Numpy & Numba supported implementation"""
+    features_32 = np.ascontiguousarray(features_32, dtype=np.uint32)
+    return minhash_xor_192_kernel(features_32, masks)
+
+
 PERMS_192 = np.array(
     [MINHASH_PERMUTATIONS[0][:192], MINHASH_PERMUTATIONS[1][:192]], dtype=np.uint64
 )
 
 
-@njit
-def minhash_ref_192(features_32):
+@lazy_njit("uint64[::1](uint32[::1])", cache=True)
+def minhash_ref_192_kernel(features_32):
     _mersenne_prime = np.uint64((1 << 61) - 1)
     _max_hash = np.uint32((1 << 32) - 1)
 
@@ -171,6 +228,134 @@ def minhash_ref_192(features_32):
     return hashvalues
 
 
+def minhash_ref_192(features_32):
+    """Numpy & Numba supported implementation"""
+    return minhash_ref_192_kernel(np.ascontiguousarray(features_32, dtype=np.uint32))
+
+
+###############################################################################
+# Batched multi-document implementations                                      #
+###############################################################################
+
+
+SIG_REF_BATCH = (
+    "void(uint32[::1], int64[::1], uint64[::1], uint64[::1], uint64[:, ::1])"
+)
+SIG_XOR_BATCH = "void(uint64[::1], int64[::1], uint64[::1], uint64[:, ::1])"
+
+
+def _minhash_ref_batch(features_32, offsets, a, b, out):
+    _mersenne_prime = np.uint64((1 << 61) - 1)
+    _max_hash = np.uint64((1 << 32) - 1)
+    n_perms = out.shape[1]
+    for d in prange(offsets.shape[0] - 1):
+        row = out[d]
+        for i in range(offsets[d], offsets[d + 1]):
+            hv = np.uint64(features_32[i])
+            for j in range(n_perms):
+                phv = ((a[j] * hv + b[j]) % _mersenne_prime) & _max_hash
+                if phv < row[j]:
+                    row[j] = phv
+
+
+def _minhash_xor_batch(features, offsets, masks, out):
+    n_perms = out.shape[1]
+    for d in prange(offsets.shape[0] - 1):
+        row = out[d]
+        for i in range(offsets[d], offsets[d + 1]):
+            f = features[i]
+            for j in range(n_perms):
+                h = f ^ masks[j]
+                if h < row[j]:
+                    row[j] = h
+
+
+# Only the serial kernels are cached: numba keys its cache by python function
+# and signature, not by compile flags, so a cached parallel variant would
+# collide with the serial one.
+minhash_ref_batch_kernel = lazy_njit(SIG_REF_BATCH, cache=True)(_minhash_ref_batch)
+minhash_ref_batch_kernel_par = njit(parallel=True)(_minhash_ref_batch)
+minhash_xor_batch_kernel = lazy_njit(SIG_XOR_BATCH, cache=True)(_minhash_xor_batch)
+minhash_xor_batch_kernel_par = njit(parallel=True)(_minhash_xor_batch)
+
+
+def pack_features(docs, dtype=np.uint64):
+    """Pack a sequence of per document feature arrays into (features, offsets)"""
+    offsets = np.zeros(len(docs) + 1, dtype=np.int64)
+    np.cumsum([len(d) for d in docs], out=offsets[1:])
+    if len(docs):
+        features = np.concatenate([np.asarray(d, dtype=dtype) for d in docs])
+    else:
+        features = np.empty(0, dtype=dtype)
+    return features, offsets
+
+
+def _run_batch(kernel, kernel_par, threads, *args):
+    if threads == 1:
+        kernel(*args)
+        return
+    # the thread count is process wide, restore it for later calls
+    previous = numba.get_num_threads()
+    numba.set_num_threads(threads or numba.config.NUMBA_NUM_THREADS)
+    try:
+        kernel_par(*args)
+    finally:
+        numba.set_num_threads(previous)
+
+
+def minhash_ref_batch(features_32, offsets, perms=PERMS_NUMBA, threads=1):
+    """Batched universal hash minhash (bit-identical to minhash_ref_numba).
+
+    :param features_32: flat uint32 feature buffer of all documents
+    :param offsets: int64 array of n_docs + 1 document boundaries
+    :param perms: (2 x n_perms) uint64 permutation parameters
+    :param threads: 1 for serial, 0/None for all cores or number of threads
+    :return: (n_docs x n_perms) uint64 signature matrix
+    """
+    features_32 = np.ascontiguousarray(features_32, dtype=np.uint32)
+    offsets = np.ascontiguousarray(offsets, dtype=np.int64)
+    perms = np.ascontiguousarray(perms, dtype=np.uint64)
+    out = np.full(
+        (len(offsets) - 1, perms.shape[1]), MAX_UINT32, dtype=np.uint64
+    )
+    _run_batch(
+        minhash_ref_batch_kernel,
+        minhash_ref_batch_kernel_par,
+        threads,
+        features_32,
+        offsets,
+        perms[0],
+        perms[1],
+        out,
+    )
+    return out
+
+
+def minhash_xor_batch(features, offsets, masks=MASKS_64_NP, threads=1):
+    """Batched xor minhash (bit-identical to minhash_xor_numba).
+
+    :param features: flat uint64 feature buffer of all documents
+    :param offsets: int64 array of n_docs + 1 document boundaries
+    :param masks: uint64 xor masks (one per permutation)
+    :param threads: 1 for serial, 0/None for all cores or number of threads
+    :return: (n_docs x n_perms) uint64 signature matrix
+    """
+    features = np.ascontiguousarray(features, dtype=np.uint64)
+    offsets = np.ascontiguousarray(offsets, dtype=np.int64)
+    masks = np.ascontiguousarray(masks, dtype=np.uint64)
+    out = np.full((len(offsets) - 1, len(masks)), MAX_UINT64, dtype=np.uint64)
+    _run_batch(
+        minhash_xor_batch_kernel,
+        minhash_xor_batch_kernel_par,
+        threads,
+        features,
+        offsets,
+        masks,
+        out,
+    )
+    return out
+
+
 funcs_ref = (
     minhash_ref,
     minhash_ref_opt,
@@ -217,6 +402,96 @@ def compat():
         results.add(r)
     # assert len(results) == 1
 
+    print("\nTesting minhash batch compatibility:\n")
+    sizes = rand.randint(0, 300, 50)
+    sizes[3] = 0  # empty document
+    docs_32 = [rand.randint(0, MAX_UINT32, n, dtype=np.uint32) for n in sizes]
+    docs_64 = [rand.randint(0, MAX_UINT64, n, dtype=np.uint64) for n in sizes]
+    flat_32, offsets = pack_features(docs_32, np.uint32)
+    flat_64, _ = pack_features(docs_64, np.uint64)
+    for threads in (1, 0):
+        sigs_ref = minhash_ref_batch(flat_32, offsets, threads=threads)
+        sigs_xor = minhash_xor_batch(flat_64, offsets, threads=threads)
+        for d in range(len(sizes)):
+            assert np.array_equal(sigs_ref[d], minhash_ref_numba(docs_32[d]))
+            assert np.array_equal(sigs_xor[d], minhash_xor_numba(docs_64[d]))
+        print(f"threads={threads:<11}: {len(sizes)} docs identical")
+    assert numba.get_num_threads() == numba.config.NUMBA_NUM_THREADS
+    # wrappers accept uint32 and strided features like lazily compiled kernels
+    flat = flat_32.astype(np.uint64)
+    assert np.array_equal(minhash_xor_numba(flat_32), minhash_xor_numba(flat))
+    strided = minhash_ref_numba(flat_32[::2])
+    assert np.array_equal(strided, minhash_ref_numba(flat_32[::2].copy()))
+
+
+def call_latency(func, *args, repeat=3):
+    """First call and best steady state runtime of func(*args) in ms"""
+    start = time.perf_counter()
+    func(*args)
+    first = time.perf_counter() - start
+    steady = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        steady.append(time.perf_counter() - start)
+    return first * 1000, min(steady) * 1000
+
+
+LATENCY_SCRIPT = """
+import time
+start = time.perf_counter()
+import numpy as np
+from iscc_bench.algos import minhash, minhash_perms
+print("import", (time.perf_counter() - start) * 1000)
+f32 = np.arange(1000, dtype=np.uint32)
+f64 = np.arange(1000, dtype=np.uint64)
+perms = minhash_perms.get_perms()
+for name, func, args in (
+    ("minhash_ref_numba", minhash.minhash_ref_numba, (f32,)),
+    ("minhash_xor_numba", minhash.minhash_xor_numba, (f64,)),
+    ("minhash_xor_192", minhash.minhash_xor_192, (f32,)),
+    ("minhash_ref_192", minhash.minhash_ref_192, (f32,)),
+    ("minhash_perms.minhash_ref_numba", minhash_perms.minhash_ref_numba, (f32, perms)),
+):
+    print(name, *minhash.call_latency(func, *args))
+"""
+
+
+def performance_first_call():
+    """
+    First call latency of the numba kernels in fresh processes.
+
+    The kernels are compiled for explicit signatures on their first call. A
+    cold start compiles and writes the on disk cache (NUMBA_CACHE_DIR), every
+    following process only loads the cached machine code.
+    """
+    import os
+    import subprocess
+    import sys
+    import tempfile
+
+    print("\nTesting minhash first call latency in fresh processes:\n")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = dict(os.environ, NUMBA_CACHE_DIR=cache_dir)
+        for run in ("cold", "cached"):
+            out = subprocess.run(
+                [sys.executable, "-c", LATENCY_SCRIPT],
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            for line in out.stdout.splitlines():
+                name, *times = line.split()
+                times = [float(t) for t in times]
+                if name == "import":
+                    print(f"{run:<6} {name:<32}: {times[0]:8.2f} ms")
+                else:
+                    print(
+                        f"{run:<6} {name:<32}: {times[0]:8.2f} ms first - "
+                        f"{times[1]:8.2f} ms steady"
+                    )
+
 
 def performance():
     """
@@ -239,12 +514,8 @@ def performance():
         [xxh32_intdigest(rand.bytes(13)) for _ in range(nfeat)], dtype=np.uint32
     )
     for func in funcs_f32:
-        mh = func(features_32)
-        start = time.time()
-        mh = func(features_32)
-        end = time.time()
-        rt = (end - start) * 1000
-        print(f"{func.__name__:<18}: {rt:.2f} ms runtime")
+        first, steady = call_latency(func, features_32)
+        print(f"{func.__name__:<18}: {first:8.2f} ms first - {steady:8.2f} ms steady")
 
     # New versions
     features_64 = np.array(
@@ -252,15 +523,53 @@ def performance():
     )
 
     for func in funcs_xor:
-        mh = func(features_64)
+        first, steady = call_latency(func, features_64)
+        print(f"{func.__name__:<18}: {first:8.2f} ms first - {steady:8.2f} ms steady")
+
+    performance_batch()
+
+
+def performance_batch(ndocs=2000, nfeat=1000):
+    """
+    Compare per document minhash calls with the batched kernels.
+
+    Reports docs/s and features/s for the per document path and the batched
+    path (serial and multithreaded).
+    """
+    print(f"\nTesting minhash batch performance with {ndocs} docs:\n")
+    sizes = rand.randint(nfeat // 2, nfeat * 3 // 2, ndocs)
+    docs_32 = [rand.randint(0, MAX_UINT32, n, dtype=np.uint32) for n in sizes]
+    docs_64 = [rand.randint(0, MAX_UINT64, n, dtype=np.uint64) for n in sizes]
+    flat_32, offsets = pack_features(docs_32, np.uint32)
+    flat_64, _ = pack_features(docs_64, np.uint64)
+    total = int(sizes.sum())
+
+    def report(name, rt):
+        print(
+            f"{name:<24}: {rt * 1000:8.2f} ms runtime - "
+            f"{ndocs / rt:10.0f} docs/s - {total / rt:12.0f} features/s"
+        )
+
+    for func, docs in ((minhash_ref_numba, docs_32), (minhash_xor_numba, docs_64)):
+        func(docs[0])
         start = time.time()
-        mh = func(features_64)
-        end = time.time()
-        rt = (end - start) * 1000
-        print(f"{func.__name__:<18}: {rt:.2f} ms runtime")
+        for doc in docs:
+            func(doc)
+        report(func.__name__, time.time() - start)
+
+    for func, flat in ((minhash_ref_batch, flat_32), (minhash_xor_batch, flat_64)):
+        for threads in (1, 0):
+            func(flat[:1], offsets[:2], threads=threads)
+            start = time.time()
+            func(flat, offsets, threads=threads)
+            name = f"{func.__name__}[{threads or 'all'}]"
+            report(name, time.time() - start)
 
 
 def quality(seed=298):
+    from iscc_bench.readers.gutenberg import gutenberg
+    from iscc_bench.readers.mltext import mltext
+
     print("\nTesting minhash quality:\n")
 
     fps = list(chain(gutenberg(), mltext()))
@@ -362,4 +671,5 @@ def quality(seed=298):
 if __name__ == "__main__":
     compat()
     performance()
+    performance_first_call()
     quality(298)
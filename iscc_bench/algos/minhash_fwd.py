@@ -20,23 +20,19 @@ Minhash 192 bit: Error Sim Mean 0.0092 - Max 0.086 - Var 0.00027
 Minhash 64 bit:  Error Sim Mean 0.0118 - Max 0.106 - Var 0.00062
 """
 import numpy as np
-from xxhash.cpython import xxh32_intdigest
 from statistics import mean, variance
 
 from iscc_bench.algos.metrics import jaccard
 from iscc_bench.algos.minhash import minhash_ref_192
+from iscc_bench.algos.ngrams import ngram_features
 from iscc_bench.algos.slide import sliding_window
 from iscc_bench.readers.mltext import mltext
 from iscc_bench.textid.normalize import text_normalize
 from iscc_bench.utils import load_text_file
 
 
-def chunkify(text):
-    return ["".join(c) for c in sliding_window(text, 13)]
-
-
-def featurize(chunks):
-    return np.array([xxh32_intdigest(f) for f in chunks], np.uint32)
+def featurize_text(text):
+    return ngram_features(text, 13, "xxh32").astype(np.uint32)
 
 
 def bbitize(mh_sig, bits=192):
@@ -56,8 +52,7 @@ def main():
             continue
         texts = (load_text_file(t) for t in ab)
         norm_texts = (text_normalize(t) for t in texts)
-        chunked_texts = [chunkify(t) for t in norm_texts]
-        feature_texts = [featurize(f) for f in chunked_texts]
+        feature_texts = [featurize_text(t) for t in norm_texts]
         sim_sim = jaccard(feature_texts[0], feature_texts[1])
         mhashes = [minhash_ref_192(f) for f in feature_texts]
         mh_sim_sim = jaccard(mhashes[0], mhashes[1])
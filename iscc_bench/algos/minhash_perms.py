@@ -30,10 +30,9 @@ from itertools import chain
 from pprint import pprint
 from statistics import mean
 import numpy as np
-from numba import njit
-from xxhash.cpython import xxh32_intdigest
+from xxhash import xxh32_intdigest
 from iscc_bench.algos.metrics import jaccard
-from iscc_bench.algos.minhash import minhash_xor_numba
+from iscc_bench.algos.minhash import lazy_njit, minhash_xor_numba
 from iscc_bench.algos.slide import sliding_window
 from iscc_bench.readers.gutenberg import gutenberg
 from iscc_bench.readers.mltext import mltext
@@ -201,8 +200,8 @@ def get_perms_xor(seed=1):
     return perms
 
 
-@njit
-def minhash_ref_numba(features_32, perms):
+@lazy_njit("uint64[::1](uint32[::1], uint64[:, :])", cache=True)
+def minhash_ref_kernel(features_32, perms):
     _mersenne_prime = np.uint64((1 << 61) - 1)
     _max_hash = np.uint32((1 << 32) - 1)
 
@@ -216,6 +215,11 @@ def minhash_ref_numba(features_32, perms):
     return hashvalues
 
 
+def minhash_ref_numba(features_32, perms):
+    features_32 = np.ascontiguousarray(features_32, dtype=np.uint32)
+    return minhash_ref_kernel(features_32, np.asarray(perms, dtype=np.uint64))
+
+
 def get_minhash(features, a, b):
     mhashes = minhash_ref_numba(features, a, b)
     h = [(i, x & 1) for i, x in enumerate(mhashes.tolist())]
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""Vectorized character n-gram feature extraction.
+
+Replaces the `sliding_window` + `"".join` + per shingle `xxh64_intdigest`
+pattern. The text is encoded once into a code point buffer (and an utf-8 byte
+buffer for compat modes) and all window hashes are computed by a single
+compiled kernel returning a numpy array.
+
+Hashers:
+
+xxh64   : bit-identical to `xxh64_intdigest("".join(window).encode("utf8"))`
+xxh32   : bit-identical to `xxh32_intdigest("".join(window).encode("utf8"))`
+rolling : polynomial rolling hash over code points with a 64-bit finalizer
+
+Texts shorter than the window size yield a single feature for the whole text.
+
+Results for 1M characters (window 13):
+
+ngrams_ref (xxh64) : 1125.62 ms runtime
+xxh64              :   34.50 ms runtime
+xxh32              :   32.46 ms runtime
+rolling            :    4.68 ms runtime
+"""
+import time
+import numpy as np
+from numba import njit
+from xxhash import xxh32_intdigest, xxh64_intdigest
+from iscc_bench.algos.slide import sliding_window
+
+P64_1 = np.uint64(11400714785074694791)
+P64_2 = np.uint64(14029467366897019727)
+P64_3 = np.uint64(1609587929392839161)
+P64_4 = np.uint64(9650029242287828579)
+P64_5 = np.uint64(2870177450012600261)
+
+P32_1 = np.uint64(2654435761)
+P32_2 = np.uint64(2246822519)
+P32_3 = np.uint64(3266489917)
+P32_4 = np.uint64(668265263)
+P32_5 = np.uint64(374761393)
+M32 = np.uint64(0xFFFFFFFF)
+
+# Odd multiplier for the rolling polynomial hash over code points
+ROLLING_BASE = np.uint64(0x9E3779B97F4A7C15)
+
+
+###############################################################################
+# Text encoding                                                               #
+###############################################################################
+
+
+def encode_text(text):
+    """Encode text once into a uint32 code point buffer"""
+    return np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+
+
+def utf8_offsets(cps):
+    """Byte offsets of each code point (plus end) in the utf-8 encoded text"""
+    lens = np.ones(len(cps), dtype=np.int64)
+    lens += cps >= 0x80
+    lens += cps >= 0x800
+    lens += cps >= 0x10000
+    offsets = np.zeros(len(cps) + 1, dtype=np.int64)
+    np.cumsum(lens, out=offsets[1:])
+    return offsets
+
+
+###############################################################################
+# Compiled kernels                                                            #
+###############################################################################
+
+
+@njit(cache=True)
+def _rotl64(x, r):
+    return (x << np.uint64(r)) | (x >> np.uint64(64 - r))
+
+
+@njit(cache=True)
+def _rotl32(x, r):
+    return ((x << np.uint64(r)) | (x >> np.uint64(32 - r))) & M32
+
+
+@njit(cache=True)
+def _read64(buf, i):
+    v = np.uint64(0)
+    for k in range(8):
+        v |= np.uint64(buf[i + k]) << np.uint64(8 * k)
+    return v
+
+
+@njit(cache=True)
+def _read32(buf, i):
+    v = np.uint64(0)
+    for k in range(4):
+        v |= np.uint64(buf[i + k]) << np.uint64(8 * k)
+    return v
+
+
+@njit(cache=True)
+def _round64(acc, lane):
+    acc = acc + lane * P64_2
+    acc = _rotl64(acc, 31)
+    return acc * P64_1
+
+
+@njit(cache=True)
+def xxh64_buf(buf, start, end):
+    """xxHash64 (seed 0) of buf[start:end]"""
+    length = end - start
+    i = start
+    if length >= 32:
+        v1 = P64_1 + P64_2
+        v2 = P64_2
+        v3 = np.uint64(0)
+        v4 = np.uint64(0) - P64_1
+        limit = end - 32
+        while i <= limit:
+            v1 = _round64(v1, _read64(buf, i))
+            v2 = _round64(v2, _read64(buf, i + 8))
+            v3 = _round64(v3, _read64(buf, i + 16))
+            v4 = _round64(v4, _read64(buf, i + 24))
+            i += 32
+        h = _rotl64(v1, 1) + _rotl64(v2, 7) + _rotl64(v3, 12) + _rotl64(v4, 18)
+        for v in (v1, v2, v3, v4):
+            h = (h ^ _round64(np.uint64(0), v)) * P64_1 + P64_4
+    else:
+        h = P64_5
+    h += np.uint64(length)
+    while i + 8 <= end:
+        h ^= _round64(np.uint64(0), _read64(buf, i))
+        h = _rotl64(h, 27) * P64_1 + P64_4
+        i += 8
+    if i + 4 <= end:
+        h ^= _read32(buf, i) * P64_1
+        h = _rotl64(h, 23) * P64_2 + P64_3
+        i += 4
+    while i < end:
+        h ^= np.uint64(buf[i]) * P64_5
+        h = _rotl64(h, 11) * P64_1
+        i += 1
+    h ^= h >> np.uint64(33)
+    h *= P64_2
+    h ^= h >> np.uint64(29)
+    h *= P64_3
+    h ^= h >> np.uint64(32)
+    return h
+
+
+@njit(cache=True)
+def _round32(acc, lane):
+    acc = (acc + lane * P32_2) & M32
+    return (_rotl32(acc, 13) * P32_1) & M32
+
+
+@njit(cache=True)
+def xxh32_buf(buf, start, end):
+    """xxHash32 (seed 0) of buf[start:end]"""
+    length = end - start
+    i = start
+    if length >= 16:
+        v1 = (P32_1 + P32_2) & M32
+        v2 = P32_2
+        v3 = np.uint64(0)
+        v4 = (np.uint64(0) - P32_1) & M32
+        limit = end - 16
+        while i <= limit:
+            v1 = _round32(v1, _read32(buf, i))
+            v2 = _round32(v2, _read32(buf, i + 4))
+            v3 = _round32(v3, _read32(buf, i + 8))
+            v4 = _round32(v4, _read32(buf, i + 12))
+            i += 16
+        h = _rotl32(v1, 1) + _rotl32(v2, 7) + _rotl32(v3, 12) + _rotl32(v4, 18)
+    else:
+        h = P32_5
+    h = (h + np.uint64(length)) & M32
+    while i + 4 <= end:
+        h = (h + _read32(buf, i) * P32_3) & M32
+        h = (_rotl32(h, 17) * P32_4) & M32
+        i += 4
+    while i < end:
+        h = (h + np.uint64(buf[i]) * P32_5) & M32
+        h = (_rotl32(h, 11) * P32_1) & M32
+        i += 1
+    h ^= h >> np.uint64(15)
+    h = (h * P32_2) & M32
+    h ^= h >> np.uint64(13)
+    h = (h * P32_3) & M32
+    h ^= h >> np.uint64(16)
+    return h
+
+
+@njit(cache=True)
+def _xxh64_windows(buf, offsets, w, out):
+    for i in range(out.shape[0]):
+        out[i] = xxh64_buf(buf, offsets[i], offsets[i + w])
+
+
+@njit(cache=True)
+def _xxh32_windows(buf, offsets, w, out):
+    for i in range(out.shape[0]):
+        out[i] = xxh32_buf(buf, offsets[i], offsets[i + w])
+
+
+@njit(cache=True)
+def _rolling_windows(cps, w, out):
+    high = np.uint64(1)  # ROLLING_BASE ** (w - 1)
+    for _ in range(w - 1):
+        high *= ROLLING_BASE
+    h = np.uint64(0)
+    for i in range(w):
+        h = h * ROLLING_BASE + np.uint64(cps[i])
+    for i in range(out.shape[0]):
+        if i:
+            h = (h - np.uint64(cps[i - 1]) * high) * ROLLING_BASE + np.uint64(
+                cps[i + w - 1]
+            )
+        # splitmix64 finalizer to spread the polynomial hash over all bits
+        z = h ^ (h >> np.uint64(30))
+        z *= np.uint64(0xBF58476D1CE4E5B9)
+        z ^= z >> np.uint64(27)
+        z *= np.uint64(0x94D049BB133111EB)
+        out[i] = z ^ (z >> np.uint64(31))
+
+
+###############################################################################
+# Public API                                                                  #
+###############################################################################
+
+
+def ngram_features(text, w=13, hasher="xxh64"):
+    """Hash all w-character windows of text into a uint64 numpy array.
+
+    :param str text: normalized text
+    :param int w: window size in characters
+    :param str hasher: one of "xxh64", "xxh32" (compat) or "rolling"
+    :return: numpy uint64 array of len(text) - w + 1 window hashes
+    """
+    if not text:
+        return np.empty(0, dtype=np.uint64)
+    cps = encode_text(text)
+    w = min(w, len(cps))
+    out = np.empty(len(cps) - w + 1, dtype=np.uint64)
+    if hasher == "rolling":
+        _rolling_windows(cps, w, out)
+        return out
+    buf = np.frombuffer(text.encode("utf8"), dtype=np.uint8)
+    offsets = utf8_offsets(cps)
+    if hasher == "xxh64":
+        _xxh64_windows(buf, offsets, w, out)
+    elif hasher == "xxh32":
+        _xxh32_windows(buf, offsets, w, out)
+    else:
+        raise ValueError(f"Unknown hasher {hasher}")
+    return out
+
+
+def ngrams_ref(text, w=13, hasher="xxh64"):
+    """Reference implementation with per shingle strings"""
+    hfunc = {"xxh64": xxh64_intdigest, "xxh32": xxh32_intdigest}[hasher]
+    if len(text) < w:
+        return np.array([hfunc(text.encode("utf8"))] if text else [], np.uint64)
+    chunks = ("".join(c) for c in sliding_window(text, w))
+    return np.array([hfunc(c.encode("utf8")) for c in chunks], np.uint64)
+
+
+def compat():
+    """Test compatibility with the reference implementation"""
+    rand = np.random.RandomState(seed=13)
+    alphabet = "abcdefghijklmnopqrstuvwxyzäöüßéñçøæ€日本語文字😀💩"
+    for n in (0, 1, 5, 12, 13, 14, 40, 1000):
+        text = "".join(rand.choice(list(alphabet), n))
+        for w in (4, 9, 13, 32):
+            for hasher in ("xxh64", "xxh32"):
+                a = ngram_features(text, w, hasher)
+                b = ngrams_ref(text, w, hasher)
+                assert np.array_equal(a, b), (n, w, hasher)
+            rolled = ngram_features(text, w, "rolling")
+            assert len(rolled) == len(a)
+    # rolling hash is position independent
+    r = ngram_features("abcdefghijklmnopqrstuvwxyz" * 2, 13, "rolling")
+    assert r[0] == r[26]
+    print("ngram features compatible")
+
+
+def performance(n=1000000, w=13):
+    rand = np.random.RandomState(seed=13)
+    text = "".join(rand.choice(list("abcdefghijklmnopqrstuvwxyzäöü"), n))
+    print(f"\nTesting ngram feature performance with {n} chars:\n")
+    start = time.time()
+    ngrams_ref(text, w)
+    rt = (time.time() - start) * 1000
+    print(f"{'ngrams_ref (xxh64)':<19}: {rt:.2f} ms runtime")
+    for hasher in ("xxh64", "xxh32", "rolling"):
+        ngram_features(text[:100], w, hasher)
+        start = time.time()
+        ngram_features(text, w, hasher)
+        rt = (time.time() - start) * 1000
+        print(f"{hasher:<19}: {rt:.2f} ms runtime")
+
+
+if __name__ == "__main__":
+    compat()
+    performance()
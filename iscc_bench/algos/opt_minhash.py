@@ -5,6 +5,7 @@ from statistics import mean, variance
 import numpy as np
 from xxhash import xxh32_intdigest
 from iscc_bench.algos.metrics import jaccard
+from iscc_bench.algos.ngrams import ngram_features
 from iscc_bench.algos.slide import sliding_window
 from iscc_bench.readers.mltext import mltext
 from iscc_bench.utils import load_text_file
@@ -17,7 +18,7 @@ MASKS_32_NP = R.randint(0, 2 ** 32 - 1, 64, dtype=np.uint32)
 
 def minhash_xor(features):
     masks = MASKS_32_NP
-    features = np.array(hashify_32(features), np.uint32)
+    features = np.asarray(features, np.uint32)
 
     hashes = np.empty(64, dtype=np.uint32)
     hashes.fill(2 ** 32 - 1)
@@ -28,7 +29,8 @@ def minhash_xor(features):
 
 
 def minhash_xxh(features):
-    return [min([xxh32_intdigest(f, h) for f in features]) for h in range(64)]
+    data = [f.to_bytes(4, "little") for f in features]
+    return [min([xxh32_intdigest(f, h) for f in data]) for h in range(64)]
 
 
 MERSENNE_PRIME = (1 << 61) - 1
@@ -52,7 +54,7 @@ def minhash_uvh(features):
     """
     see: https://stackoverflow.com/a/40117398/51627
     """
-    features = np.array(hashify_32(features), np.uint32)
+    features = np.asarray(features, np.uint32)
     a, b = PERMUTATIONS
     hashes = np.ones(64, dtype=np.uint64) * MAX_HASH
 
@@ -63,11 +65,8 @@ def minhash_uvh(features):
 
 
 def featurize(text):
-    return ["".join(c).encode("utf8") for c in sliding_window(text, 13)]
-
-
-def hashify_32(features):
-    return [xxh32_intdigest(f) for f in features]
+    """32-bit xxh32 features of the 13 character windows of a text"""
+    return ngram_features(text, 13, "xxh32").tolist()
 
 
 funcs = (
@@ -88,11 +87,10 @@ def benchmark(mh_func):
         if abc[-1] is None:
             continue
         texts = (load_text_file(t) for t in abc)
-        n_texts = (text_normalize(t) for t in texts)
+        n_texts = [text_normalize(t) for t in texts]
         features = [featurize(t) for t in n_texts]
-        hf = [hashify_32(f) for f in features]
-        sim_sim = jaccard(hf[0], hf[1])
-        sim_dis = jaccard(hf[0], hf[2])
+        sim_sim = jaccard(features[0], features[1])
+        sim_dis = jaccard(features[0], features[2])
 
         start = time.time()
         mhashes = [mh_func(f) for f in features]
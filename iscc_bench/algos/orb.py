@@ -6,7 +6,8 @@ Notes: Requires opencv-python==3.4.0.12
 import logging
 from hashlib import sha256
 import cv2 as cv
-from iscc_bench.algos.chroma import simhash, encode
+from iscc import encode
+from iscc_bench.algos.simhash import simhash
 
 
 log = logging.getLogger(__name__)
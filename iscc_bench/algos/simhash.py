@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""Vectorized SimHash for digests of arbitrary width.
+
+Digests are handled as an (n x bytes) uint8 array. The bits are unpacked with
+numpy and summed per column, a bit of the simhash is set if it is set in at
+least half of the digests. Output is byte-identical to `iscc.similarity_hash`
+(and the pure python loops in scripts/meta and textid).
+
+Results for 10000 simhashes of 100 x 32 byte digests:
+
+iscc.similarity_hash : 20.44 s runtime
+simhash              :  0.22 s runtime
+simhash_batch        :  0.20 s runtime
+"""
+import time
+import numpy as np
+
+
+def as_digest_array(digests):
+    """(n x bytes) uint8 array of a sequence of equal sized byte digests"""
+    if isinstance(digests, np.ndarray):
+        return digests.view(np.uint8).reshape(len(digests), -1)
+    n_bytes = len(digests[0])
+    joined = b"".join(digests)
+    if len(joined) != n_bytes * len(digests):
+        raise ValueError("All digests must have the same number of bytes")
+    return np.frombuffer(joined, dtype=np.uint8).reshape(len(digests), n_bytes)
+
+
+def simhash_array(digests):
+    """Simhash of an (n x bytes) uint8 array as uint8 array of bytes"""
+    counts = np.unpackbits(digests, axis=-1).sum(axis=-2, dtype=np.int64)
+    return np.packbits(counts * 2 >= digests.shape[-2], axis=-1)
+
+
+def simhash(digests):
+    """Simhash of a sequence of equal sized byte digests (or uint8 array)"""
+    return simhash_array(as_digest_array(digests)).tobytes()
+
+
+def simhash_int64(values):
+    """Simhash of unsigned 64-bit integers as 8 bytes (big-endian)"""
+    arr = np.asarray(values, dtype=np.uint64).astype(">u8")
+    return simhash(arr.view(np.uint8).reshape(-1, 8))
+
+
+def simhash_batch(features):
+    """Many simhashes in one call.
+
+    :param features: (m x n x bytes) uint8 array or a list of m (n_i x bytes)
+        uint8 arrays / sequences of byte digests with equal digest widths
+    :return: (m x bytes) uint8 array of simhashes
+    """
+    if isinstance(features, np.ndarray) and features.ndim == 3:
+        return simhash_array(features)
+    arrays = [as_digest_array(f) for f in features]
+    if len({a.shape for a in arrays}) == 1:
+        return simhash_array(np.stack(arrays))
+    return np.stack([simhash_array(a) for a in arrays])
+
+
+def compat():
+    import iscc
+
+    rand = np.random.RandomState(seed=14)
+    for n_bytes in (1, 4, 7, 8, 9, 32):
+        for n in (1, 2, 3, 10, 101):
+            digests = [rand.bytes(n_bytes) for _ in range(n)]
+            expected = iscc.similarity_hash(digests)
+            assert simhash(digests) == expected
+            assert simhash(as_digest_array(digests)) == expected
+            values = [int.from_bytes(d, "big") for d in digests]
+            if n_bytes == 8:
+                assert simhash_int64(values) == expected
+    batch = rand.randint(0, 256, (50, 10, 32), dtype=np.uint8)
+    expected = [iscc.similarity_hash([r.tobytes() for r in f]) for f in batch]
+    assert [s.tobytes() for s in simhash_batch(batch)] == expected
+    ragged = [batch[i, : i % 10 + 1] for i in range(50)]
+    expected = [iscc.similarity_hash([r.tobytes() for r in f]) for f in ragged]
+    assert [s.tobytes() for s in simhash_batch(ragged)] == expected
+    print("simhash compatible")
+
+
+def performance(m=10000, n=100, n_bytes=32):
+    import iscc
+
+    rand = np.random.RandomState(seed=14)
+    batch = rand.randint(0, 256, (m, n, n_bytes), dtype=np.uint8)
+    lists = [[r.tobytes() for r in f] for f in batch]
+    print(f"\nTesting simhash performance with {m} x {n} x {n_bytes} bytes:\n")
+    for name, func in (
+        ("iscc.similarity_hash", lambda: [iscc.similarity_hash(d) for d in lists]),
+        ("simhash", lambda: [simhash(d) for d in lists]),
+        ("simhash_batch", lambda: simhash_batch(batch)),
+    ):
+        start = time.time()
+        func()
+        rt = time.time() - start
+        print(f"{name:<21}: {rt:.2f} s runtime")
+
+
+if __name__ == "__main__":
+    compat()
+    performance()
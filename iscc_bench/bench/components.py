@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 """Performance Benchmarking of core components of reference implementation"""
 import iscc
-from iscc_bench.bench.utils import benchmark, system_info
+from iscc_bench.bench.utils import benchmark, benchmark_parallel, system_info, mapped
 from iscc_bench.readers import caltech_256, web_video
 from iscc_cli.video_id import get_frame_vectors, content_id_video
 
@@ -20,10 +20,22 @@ def benchmark_components():
     image_files = list(caltech_256())
     video_files = list(web_video.seed_videos())
     benchmark(iscc.instance_id, image_files)
+    benchmark(mapped(iscc.instance_id), image_files)
     benchmark(iscc.data_id, image_files)
+    benchmark(mapped(iscc.data_id), image_files)
     benchmark(iscc.content_id_image, image_files)
     benchmark(vid, video_files, "content_id_video")
 
 
+def benchmark_components_parallel(workers=None, pool="process"):
+    print(system_info())
+    image_files = list(caltech_256())
+    video_files = list(web_video.seed_videos())
+    benchmark_parallel(iscc.instance_id, image_files, workers, pool)
+    benchmark_parallel(iscc.data_id, image_files, workers, pool)
+    benchmark_parallel(iscc.content_id_image, image_files, workers, pool)
+    benchmark_parallel(vid, video_files, workers, pool, "content_id_video")
+
+
 if __name__ == "__main__":
     benchmark_components()
@@ -1,11 +1,21 @@
 # -*- coding: utf-8 -*-
 import hashlib
+import os
+import time
+import iscc
+from humanize import naturalsize as nsize
 from xxhash import xxh64
-from iscc_bench.bench.utils import system_info, benchmark, list_files
+from iscc_bench.bench.utils import system_info, benchmark, list_files, mapped
 from iscc_bench.readers.harvard import HARVARD_DATA
+from iscc_bench.utils import READ_SIZE, map_binary
 from sha3 import keccak_256
 from blake3 import blake3
 
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
 
 hashers = (
     hashlib.md5,
@@ -18,26 +28,104 @@ hashers = (
     xxh64,  # Non-Cryptographic
 )
 
-READ_SIZE = 1024 * 512
-
 
 def get_hasher(hfunc):
     """Returns a hashfunc that can process paths"""
 
+    def file_hash_func(fp):
+        with map_binary(fp) as data:
+            hasher = hfunc(data)
+        return hasher.hexdigest()
+
+    return file_hash_func
+
+
+def get_hasher_read(hfunc):
+    """Returns a hashfunc that processes paths with buffered reads"""
+
     def file_hash_func(fp):
         with open(fp, "rb") as infile:
             data = infile.read(READ_SIZE)
             hasher = hfunc(data)
-            if not data:
-                hasher.update(b"")
             while data:
-                hasher.update(data)
                 data = infile.read(READ_SIZE)
+                hasher.update(data)
         return hasher.hexdigest()
 
     return file_hash_func
 
 
+def _faults():
+    if resource is None:
+        return 0
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_minflt + usage.ru_majflt
+
+
+def _io_counters():
+    """(read syscalls, bytes copied by reads) of this process or None"""
+    try:
+        with open("/proc/self/io") as infile:
+            fields = dict(line.split(": ") for line in infile.read().splitlines())
+    except OSError:  # not Linux
+        return None
+    return int(fields["syscr"]), int(fields["rchar"])
+
+
+def _measure(func, files):
+    """Runtime, read syscalls, copied bytes and page faults of func(fp) per file"""
+    before = _io_counters()
+    # reading /proc/self/io is counted itself
+    overhead = _io_counters()
+    start, faults = time.time(), _faults()
+    for fp in files:
+        func(fp)
+    seconds, faults = time.time() - start, _faults() - faults
+    after = _io_counters()
+    if before is None:
+        return seconds, None, None, faults
+    syscalls, copied = (
+        (a - o) - (o - b) for a, o, b in zip(after, overhead, before)
+    )
+    return seconds, syscalls, copied, faults
+
+
+def input_stats(files, hfunc=xxh64):
+    """Compare read() syscalls and copy volume of buffered reads vs mmap.
+
+    Syscalls and copied bytes are the syscr and rchar counters of
+    /proc/self/io (Linux only).
+    """
+    total = sum(os.path.getsize(fp) for fp in files)
+    print(f"Input stats for {len(files)} files ({nsize(total)}):\n")
+    for name, func in (
+        ("read()", get_hasher_read(hfunc)),
+        ("mmap", get_hasher(hfunc)),
+    ):
+        seconds, syscalls, copied, faults = _measure(func, files)
+        if syscalls is None:
+            io_stats = "n/a syscalls - n/a copied"
+        else:
+            io_stats = f"{syscalls} read syscalls - {nsize(copied)} copied"
+        print(
+            f"{name:<6}: {io_stats} - {faults} page faults - "
+            f"{nsize(total / seconds if seconds else 0)}/s"
+        )
+    print("=" * 74)
+
+
+def benchmark_input():
+    print(system_info())
+    files = list_files(HARVARD_DATA)
+    input_stats(files)
+    benchmark(get_hasher_read(xxh64), files, "xxh64_read")
+    benchmark(get_hasher(xxh64), files, "xxh64_mmap")
+    benchmark(iscc.instance_id, files)
+    benchmark(mapped(iscc.instance_id), files)
+    benchmark(iscc.data_id, files)
+    benchmark(mapped(iscc.data_id), files)
+
+
 def benchmark_hashes():
     print(system_info())
     files = list_files(HARVARD_DATA)
@@ -47,3 +135,4 @@ def benchmark_hashes():
 
 if __name__ == "__main__":
     benchmark_hashes()
+    benchmark_input()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""Import time report based on `python -X importtime`.
+
+Every module is imported in a fresh interpreter and the importtime log on
+stderr is parsed into (self, cumulative) microseconds per imported module. The
+report lists the total import time of each module and the direct imports it
+pulls in, ordered by their cumulative time.
+
+Results (best of 3, before -> after deferring matplotlib, hyperopt, lxml, pymarc
+and requests):
+
+iscc_bench.algos.minhash       : 292.9 ->  215.6 ms (numba 134 ms, numpy 51 ms)
+iscc_bench.algos.cdc_fast_text : 455.9 ->  114.1 ms
+iscc_bench.algos.cdc_fast_data : 601.8 ->  244.7 ms
+iscc_bench.readers             : 106.9 ->  109.1 ms (isbnlib, numpy)
+
+The readers package binds all reader functions on import, modules that use
+`iscc_bench.readers.utils` (mltext) pay for that.
+"""
+import subprocess
+import sys
+from tabulate import tabulate
+
+MODULES = (
+    "iscc_bench.algos.minhash",
+    "iscc_bench.algos.ngrams",
+    "iscc_bench.algos.hamming",
+    "iscc_bench.textid.normalize",
+    "iscc_bench.scripts.meta_fast",
+    "iscc_bench.algos.cdc_fast_text",
+    "iscc_bench.algos.cdc_fast_data",
+    "iscc_bench.readers",
+)
+
+
+def parse_importtime(log):
+    """Parse `-X importtime` output.
+
+    :return: list of (name, depth, self us, cumulative us) in log order
+    """
+    entries = []
+    for line in log.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        entries.append((name.strip(), depth, int(self_us), int(cumulative)))
+    return entries
+
+
+def import_profile(module, runs=3):
+    """Importtime entries of the fastest of `runs` fresh imports of a module"""
+    best = None
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        entries = parse_importtime(out.stderr)
+        if best is None or total_us(entries, module) < total_us(best, module):
+            best = entries
+    return best
+
+
+def total_us(entries, module):
+    """Cumulative import time of a module in microseconds"""
+    for name, depth, self_us, cumulative in entries:
+        if name == module:
+            return cumulative
+    return 0
+
+
+def heaviest(entries, module, top=3):
+    """Direct imports of a module ordered by cumulative time (us).
+
+    Dependencies that were already imported by an earlier import are not
+    logged by importtime and do not show up.
+    """
+    end = [n for n, e in enumerate(entries) if e[0] == module and e[1] == 0][-1]
+    children = []
+    for name, depth, self_us, cumulative in reversed(entries[:end]):
+        if depth == 0:
+            break
+        if depth == 1:
+            children.append((name, cumulative))
+    return sorted(children, key=lambda kv: -kv[1])[:top]
+
+
+def import_report(modules=MODULES, runs=3, top=3):
+    """Print total and heaviest dependency import times of modules"""
+    rows = []
+    for module in modules:
+        entries = import_profile(module, runs)
+        deps = heaviest(entries, module, top)
+        deps = ", ".join(f"{name} {us / 1000:.1f}" for name, us in deps)
+        rows.append([module, total_us(entries, module) / 1000, deps])
+    headers = ["Module", "Total ms", "Heaviest imports (cumulative ms)"]
+    print(tabulate(rows, headers=headers, floatfmt=".1f"))
+    return rows
+
+
+def test_parse_importtime():
+    log = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:        10 |         10 |     b.c\n"
+        "import time:        20 |         30 |   b\n"
+        "import time:         5 |          5 |   d\n"
+        "import time:       100 |        135 | a\n"
+    )
+    entries = parse_importtime(log)
+    assert entries[0] == ("b.c", 2, 10, 10)
+    assert entries[-1] == ("a", 0, 100, 135)
+    assert total_us(entries, "a") == 135
+    assert heaviest(entries, "a") == [("b", 30), ("d", 5)]
+
+
+if __name__ == "__main__":
+    test_parse_importtime()
+    import_report()
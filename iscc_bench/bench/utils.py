@@ -1,11 +1,17 @@
 # -*- coding: utf-8 -*-
+import math
 import os
 import platform
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 import iscc
 import cpuinfo
 from codetiming import Timer
+from tabulate import tabulate
 from tqdm import tqdm
 from humanize import naturalsize as nsize
+from iscc_bench.utils import map_file
 
 
 def system_info():
@@ -49,6 +55,114 @@ def benchmark(func, files, timer_name=None):
     print("=" * 74)
 
 
+def _timed_call(func, fp):
+    """Run func on file and return (latency in seconds, file size)"""
+    start = time.perf_counter()
+    func(fp)
+    return time.perf_counter() - start, os.path.getsize(fp)
+
+
+def _noop(_):
+    return None
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of an unsorted sequence"""
+    values = sorted(values)
+    rank = max(math.ceil(p / 100.0 * len(values)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def worker_counts(max_workers=None):
+    """Powers of two up to max_workers (default: number of cpus) plus max_workers"""
+    max_workers = max_workers or os.cpu_count()
+    counts = []
+    n = 1
+    while n < max_workers:
+        counts.append(n)
+        n *= 2
+    counts.append(max_workers)
+    return counts
+
+
+def benchmark_parallel(func, files, workers=None, pool="process", timer_name=None):
+    """
+    Benchmark func over files with a process or thread pool of 1..N workers.
+
+    Reports throughput per worker count, per file latency percentiles
+    (p50/p95/p99) and bytes/s per core. Process pools require a picklable
+    (module level) func.
+
+    :param func: function that processes a file path
+    :param list files: file paths
+    :param workers: iterable of worker counts (default: `worker_counts()`)
+    :param str pool: "process" or "thread"
+    :param str timer_name: name to report (default: func.__name__)
+    :return list: one result dict per worker count
+    """
+    timer_name = timer_name or func.__name__
+    executor_cls = {"process": ProcessPoolExecutor, "thread": ThreadPoolExecutor}[pool]
+    workers = list(workers or worker_counts())
+    print(
+        "Benchmarking {} with {} files on {} pool ({} workers):\n".format(
+            timer_name, len(files), pool, workers
+        )
+    )
+    call = partial(_timed_call, func)
+    results = []
+    for n in workers:
+        with executor_cls(max_workers=n) as executor:
+            # Spin up all workers before timing
+            list(executor.map(_noop, range(n)))
+            start = time.perf_counter()
+            timings = list(executor.map(call, files, chunksize=1))
+            wall = time.perf_counter() - start
+        latencies = [t for t, _ in timings]
+        total_bytes = sum(size for _, size in timings)
+        results.append(
+            dict(
+                workers=n,
+                seconds=wall,
+                files_per_s=len(files) / wall,
+                bytes_per_s=total_bytes / wall,
+                bytes_per_s_core=total_bytes / wall / n,
+                p50=percentile(latencies, 50),
+                p95=percentile(latencies, 95),
+                p99=percentile(latencies, 99),
+            )
+        )
+    rows = [
+        (
+            r["workers"],
+            "{:.2f}".format(r["files_per_s"]),
+            "{}/s".format(nsize(r["bytes_per_s"])),
+            "{}/s".format(nsize(r["bytes_per_s_core"])),
+            "{:.2f}".format(r["p50"] * 1000),
+            "{:.2f}".format(r["p95"] * 1000),
+            "{:.2f}".format(r["p99"] * 1000),
+            "{:.2f}".format(r["bytes_per_s"] / results[0]["bytes_per_s"]),
+        )
+        for r in results
+    ]
+    headers = ["Workers", "Files/s", "Bytes/s", "Per Core", "p50 ms", "p95 ms"]
+    headers += ["p99 ms", "Speedup"]
+    print(tabulate(rows, headers=headers))
+    print("=" * 74)
+    return results
+
+
+def _mapped_call(func, fp):
+    with map_file(fp) as mm:
+        return func(mm)
+
+
+def mapped(func):
+    """Wrap func to process a read-only mmap of the file instead of its path"""
+    mapped_func = partial(_mapped_call, func)
+    mapped_func.__name__ = f"{func.__name__}_mmap"
+    return mapped_func
+
+
 def list_files(path):
     """List absolute path to files in directory"""
     path = os.path.abspath(path)
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""Content addressed on-disk cache for intermediate artifacts of experiments.
+
+Artifacts (normalized text, feature arrays, minhash vectors, MPEG-7 segment
+vectors, chroma vectors ...) are keyed by the xxh64 of the input file bytes plus
+the artifact name, its version and its parameters. Entries are pickled into
+`CACHE_DIR` and evicted least recently used first once the cache grows beyond
+`max_size`.
+
+Usage:
+
+    @cached("mp7v2_segments", version=1)
+    def get_segments(file):
+        ...
+"""
+import functools
+import os
+import pickle
+import tempfile
+from xxhash import xxh64
+from iscc_bench import DATA_DIR
+from iscc_bench.utils import iter_binary
+
+CACHE_DIR = os.path.join(DATA_DIR, "cache")
+CACHE_MAX_SIZE = 10 * 1024 ** 3
+
+
+class FeatureCache:
+    """Size bounded LRU cache of pickled values in a directory"""
+
+    def __init__(self, path=CACHE_DIR, max_size=CACHE_MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self._hashes = {}  # (path, size, mtime) -> content hash
+        os.makedirs(path, exist_ok=True)
+        self.size = sum(os.path.getsize(fp) for fp in self._entries())
+
+    def _entries(self):
+        for root, folders, files in os.walk(self.path):
+            for f in files:
+                if not f.endswith(".tmp"):
+                    yield os.path.join(root, f)
+
+    def _path(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def content_hash(self, fp):
+        """Hex xxh64 of the file bytes (memoized per path, size and mtime)"""
+        st = os.stat(fp)
+        memo_key = (os.path.abspath(fp), st.st_size, st.st_mtime_ns)
+        if memo_key not in self._hashes:
+            hasher = xxh64()
+            for chunk in iter_binary(fp):
+                hasher.update(chunk)
+            self._hashes[memo_key] = hasher.hexdigest()
+        return self._hashes[memo_key]
+
+    def key(self, fp, name, *args, **params):
+        """Cache key for artifact `name` of file `fp` with parameters"""
+        params = repr((name, args, sorted(params.items())))
+        return self.content_hash(fp) + xxh64(params.encode("utf-8")).hexdigest()
+
+    def get(self, key, default=None):
+        fp = self._path(key)
+        try:
+            with open(fp, "rb") as infile:
+                value = pickle.load(infile)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return default
+        os.utime(fp)  # mark as recently used
+        return value
+
+    def set(self, key, value):
+        fp = self._path(key)
+        os.makedirs(os.path.dirname(fp), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(fp))
+        with os.fdopen(fd, "wb") as outfile:
+            pickle.dump(value, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+        old_size = os.path.getsize(fp) if os.path.exists(fp) else 0
+        os.replace(tmp, fp)
+        self.size += os.path.getsize(fp) - old_size
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self, target=None):
+        """Delete least recently used entries until size is below target"""
+        target = self.max_size * 0.9 if target is None else target
+        entries = []
+        for fp in self._entries():
+            st = os.stat(fp)
+            entries.append((st.st_mtime, st.st_size, fp))
+        entries.sort()
+        self.size = sum(e[1] for e in entries)
+        for mtime, size, fp in entries:
+            if self.size <= target:
+                break
+            os.remove(fp)
+            self.size -= size
+
+    def clear(self):
+        self.evict(target=0)
+
+    def get_or_compute(self, fp, name, func, *args, **params):
+        """Return cached artifact or compute it with func(fp, *args, **params)"""
+        key = self.key(fp, name, *args, **params)
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = func(fp, *args, **params)
+            self.set(key, value)
+        return value
+
+
+_default_cache = None
+
+
+def default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = FeatureCache()
+    return _default_cache
+
+
+def cached(name, cache=None, version=0):
+    """Decorator to cache results of a function that takes a file path first.
+
+    The version is part of the cache key. Bump it when the function or the code
+    it calls returns different results, stale entries are then evicted by age.
+    """
+    artifact = f"{name}:v{version}"
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(fp, *args, **params):
+            return (cache or default_cache()).get_or_compute(
+                fp, artifact, func, *args, **params
+            )
+
+        wrapper.uncached = func
+        wrapper.version = version
+        return wrapper
+
+    return decorator
+
+
+def test_cache():
+    import numpy as np
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = FeatureCache(os.path.join(tmp, "cache"), max_size=4096)
+        data_fp = os.path.join(tmp, "data.bin")
+        with open(data_fp, "wb") as outfile:
+            outfile.write(b"hello world")
+        calls = []
+
+        @cached("features", cache)
+        def features(fp, n=8):
+            calls.append(n)
+            return np.arange(n, dtype=np.uint64)
+
+        assert features(data_fp).tolist() == list(range(8))
+        assert features(data_fp).tolist() == list(range(8))
+        assert features(data_fp, n=4).tolist() == list(range(4))
+        assert calls == [8, 4]
+        features_v1 = cached("features", cache, version=1)(features.uncached)
+        assert features_v1(data_fp).tolist() == list(range(8))
+        assert calls == [8, 4, 8]
+        assert cache.key(data_fp, "x") != cache.key(data_fp, "y")
+
+        for n in range(100):
+            cache.set(f"{n:032x}", bytes(256))
+        assert cache.size <= 4096
+
+
+if __name__ == "__main__":
+    test_cache()
@@ -1,9 +1,20 @@
 import click
 from iscc_bench.readers import ALL_READERS
-from iscc_bench.elastic_search.fill_elasticsearch import populate_elastic
-from iscc_bench.elastic_search.new_index import new_data_index, new_id_index
-from iscc_bench.elastic_search.generate_meta_ids import generate_ids
-from iscc_bench.elastic_search.evaluate import evaluate
+from iscc_bench.storage import (
+    BACKENDS,
+    VARIANTS,
+    compare_variants,
+    get_backend,
+    print_variants,
+)
+
+backend_option = click.option(
+    "--backend",
+    "-b",
+    type=click.Choice(sorted(BACKENDS)),
+    help="Storage backend (elastic or embedded sqlite)",
+    default="elastic",
+)
 
 
 @click.group()
@@ -23,20 +34,32 @@ def main():
 @click.option(
     "--kill", "-k", required=False, type=bool, help="Reset old index", default=False
 )
-def load(reader, kill):
-    """Populate ElasticSearch with given reader."""
-
+@click.option(
+    "--cached",
+    is_flag=True,
+    help="Read from columnar caches (converted on first use)",
+    default=False,
+)
+@backend_option
+def load(reader, kill, cached, backend):
+    """Populate storage backend with given reader."""
+    store = get_backend(backend)
     if kill:
-        new_data_index()
+        store.reset_data()
+    readers = ALL_READERS
+    if cached:
+        from iscc_bench.readers.columnar import cached_readers
+
+        readers = cached_readers(readers)
     if not reader:
-        for reader in ALL_READERS:
-            populate_elastic(reader)
+        for reader in readers:
+            store.load(reader)
     else:
-        reader_names = {r.__name__: r for r in ALL_READERS}
+        reader_names = {r.__name__: r for r in readers}
         if not reader in reader_names:
             pass
         else:
-            populate_elastic(reader_names[reader])
+            store.load(reader_names[reader])
 
 
 main.add_command(load)
@@ -45,21 +68,64 @@ main.add_command(load)
 @click.command()
 @click.option("--id_bits", type=int, help="Length of generated Meta-IDs", default=64)
 @click.option("--shingle_size", type=int, help="Shingle Size", default=4)
-def build(id_bits, shingle_size):
+@click.option(
+    "--workers", type=int, help="Worker processes (default all cpus)", default=None
+)
+@click.option("--batch_size", type=int, help="Records per worker batch", default=1000)
+@click.option(
+    "--variant",
+    type=click.Choice(VARIANTS),
+    help="Meta-ID implementation",
+    default="iscclib",
+)
+@backend_option
+def build(id_bits, shingle_size, workers, batch_size, variant, backend):
     """Generate Meta-IDs for the Meta-Data."""
 
-    new_id_index()
-    generate_ids(id_bits, shinglesize=shingle_size)
+    get_backend(backend).build(
+        id_bits,
+        shinglesize=shingle_size,
+        workers=workers,
+        batch_size=batch_size,
+        variant=variant,
+    )
 
 
 main.add_command(build)
 
 
 @click.command()
-def run():
+@backend_option
+def run(backend):
     """Run Evaluation"""
 
-    evaluate()
+    get_backend(backend).evaluate()
 
 
 main.add_command(run)
+
+
+@click.command()
+@click.option(
+    "--variant",
+    "variants",
+    type=click.Choice(VARIANTS),
+    multiple=True,
+    help="Meta-ID implementation (repeatable, default all)",
+)
+@click.option("--id_bits", type=int, help="Length of generated Meta-IDs", default=64)
+@click.option("--shingle_size", type=int, help="Shingle Size", default=4)
+@click.option(
+    "--workers", type=int, help="Worker processes (default all cpus)", default=None
+)
+@backend_option
+def compare(variants, id_bits, shingle_size, workers, backend):
+    """Build and evaluate Meta-ID variants on the loaded Meta-Data."""
+
+    rows = compare_variants(
+        get_backend(backend), variants or VARIANTS, id_bits, shingle_size, workers
+    )
+    print_variants(rows)
+
+
+main.add_command(compare)
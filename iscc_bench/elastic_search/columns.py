@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""Single pass Meta-ID evaluation on local columnar dumps.
+
+Streams `iscc_meta_data` and `iscc_meta_id` once each into flat binary columns
+(uint64 xxh64 hashes of ids, isbns and meta ids plus a small source code) under
+`EVAL_DIR`. The two tables are joined locally with a sort-merge on the
+meta_data id and the TP/TN/FP/FN group statistics are computed with sorted
+group reductions instead of one `helpers.scan` plus one `es.get` per hit.
+
+Raw isbn and meta_id strings are kept in line files next to the columns and are
+only read back for the (few) colliding groups.
+"""
+import os
+import numpy as np
+from xxhash import xxh64_intdigest
+from iscc_bench import DATA_DIR
+
+EVAL_DIR = os.path.join(DATA_DIR, "evaluate")
+SCAN_SIZE = 10000
+WRITE_BATCH = 100000
+MISSING = np.uint64(0)  # hash value for missing isbn / meta_data references
+
+
+def hash_str(value):
+    """Stable uint64 hash of a string field (0 for missing values)"""
+    if value is None:
+        return 0
+    return xxh64_intdigest(value.encode("utf-8")) or 1
+
+
+class ColumnWriter:
+    """Append only writer for a set of uint64 columns and string line files"""
+
+    def __init__(self, path, columns, texts=()):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.columns = {c: [] for c in columns}
+        self.files = {c: open(os.path.join(path, c + ".u64"), "wb") for c in columns}
+        self.texts = {
+            t: open(os.path.join(path, t + ".txt"), "w", encoding="utf-8")
+            for t in texts
+        }
+        self.rows = 0
+
+    def append(self, values, texts=()):
+        for col, value in zip(self.columns.values(), values):
+            col.append(value)
+        for outfile, text in zip(self.texts.values(), texts):
+            outfile.write((text or "").replace("\n", " ") + "\n")
+        self.rows += 1
+        if self.rows % WRITE_BATCH == 0:
+            self.flush()
+
+    def flush(self):
+        for name, values in self.columns.items():
+            np.array(values, dtype=np.uint64).tofile(self.files[name])
+            values.clear()
+
+    def close(self):
+        self.flush()
+        for outfile in list(self.files.values()) + list(self.texts.values()):
+            outfile.close()
+
+
+def load_column(path, name):
+    return np.memmap(os.path.join(path, name + ".u64"), dtype=np.uint64, mode="r")
+
+
+def read_lines(path, name, rows):
+    """Read the lines at the given row numbers of a line file"""
+    wanted = set(int(r) for r in rows)
+    found = {}
+    with open(os.path.join(path, name + ".txt"), encoding="utf-8") as infile:
+        for n, line in enumerate(infile):
+            if n in wanted:
+                found[n] = line.rstrip("\n")
+                if len(found) == len(wanted):
+                    break
+    return [found[int(r)] for r in rows]
+
+
+def dump_meta_data(es, path=EVAL_DIR):
+    """Stream iscc_meta_data once into id, isbn and source columns"""
+    from elasticsearch import helpers
+
+    writer = ColumnWriter(path, ("data_id", "data_isbn", "data_source"), ("isbn",))
+    sources = {}
+    query = {"query": {"match_all": {}}, "_source": ["isbn", "source"]}
+    for entry in helpers.scan(
+        es, index="iscc_meta_data", query=query, size=SCAN_SIZE, scroll="10m"
+    ):
+        isbn = entry["_source"].get("isbn")
+        source = sources.setdefault(entry["_source"].get("source"), len(sources))
+        writer.append((hash_str(entry["_id"]), hash_str(isbn), source), (isbn,))
+    writer.close()
+    return [name for name, code in sorted(sources.items(), key=lambda kv: kv[1])]
+
+
+def dump_meta_ids(es, path=EVAL_DIR):
+    """Stream iscc_meta_id once into meta_id and meta_data reference columns"""
+    from elasticsearch import helpers
+
+    writer = ColumnWriter(path, ("mid_code", "mid_data"), ("meta_id",))
+    query = {"query": {"match_all": {}}, "_source": ["meta_id", "meta_data"]}
+    for entry in helpers.scan(
+        es, index="iscc_meta_id", query=query, size=SCAN_SIZE, scroll="10m"
+    ):
+        mid = entry["_source"].get("meta_id")
+        writer.append((hash_str(mid), hash_str(entry["_source"].get("meta_data"))), (mid,))
+    writer.close()
+
+
+def join(left_keys, right_keys):
+    """Sort-merge join: row of right_keys for every left key (-1 if missing)"""
+    if not len(right_keys):
+        return np.full(len(left_keys), -1, dtype=np.int64)
+    order = np.argsort(right_keys, kind="stable")
+    sorted_keys = right_keys[order]
+    pos = np.searchsorted(sorted_keys, left_keys)
+    pos[pos == len(sorted_keys)] = 0
+    rows = order[pos]
+    rows[sorted_keys[pos] != left_keys] = -1
+    return rows
+
+
+def group_distinct(keys, *values):
+    """Group rows by key and count distinct values per group.
+
+    :return: (first row, group size, distinct counts per values array)
+    """
+    if not len(keys):
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, [empty for _ in values]
+    first, sizes, counts = None, None, []
+    for vals in values:
+        order = np.lexsort((vals, keys))
+        k, v = keys[order], vals[order]
+        new_group = np.empty(len(k), dtype=bool)
+        new_group[0] = True
+        new_group[1:] = k[1:] != k[:-1]
+        new_value = new_group.copy()
+        new_value[1:] |= v[1:] != v[:-1]
+        gid = np.cumsum(new_group) - 1
+        if first is None:
+            first = order[new_group]
+            sizes = np.bincount(gid)
+        counts.append(np.bincount(gid, weights=new_value).astype(np.int64))
+    return first, sizes, counts
+
+
+def group_stats(distinct_sources, distinct_targets, first):
+    """Groups with more than one source, split by distinct target count"""
+    relevant = distinct_sources > 1
+    collisions = relevant & (distinct_targets > 1)
+    all_same = int((relevant & (distinct_targets == 1)).sum())
+    return all_same, int(collisions.sum()), first[collisions]
+
+
+def evaluate_columns(path=EVAL_DIR, sources=None):
+    """Compute all evaluation statistics from the local column dumps.
+
+    :return: dict with the iscc_result fields plus the collision keys
+    """
+    data_id = np.asarray(load_column(path, "data_id"))
+    data_isbn = np.asarray(load_column(path, "data_isbn"))
+    data_source = np.asarray(load_column(path, "data_source"))
+    mid_code = np.asarray(load_column(path, "mid_code"))
+    mid_data = np.asarray(load_column(path, "mid_data"))
+
+    # Every meta id entry references one meta data entry (and vice versa)
+    data_rows = join(mid_data, data_id)
+    valid = data_rows >= 0
+    mid_rows = np.flatnonzero(valid)
+    data_rows = data_rows[valid]
+
+    # Positives: groups of equal meta_id with entries from more than one source
+    first, sizes, (n_sources, n_isbns) = group_distinct(
+        mid_code[mid_rows], data_source[data_rows], data_isbn[data_rows]
+    )
+    multi = sizes > 1
+    same_isbn, diff_isbn, collide = group_stats(
+        n_sources[multi], n_isbns[multi], first[multi]
+    )
+    collision_mids = read_lines(path, "meta_id", mid_rows[collide])
+
+    # Negatives: groups of equal isbn with entries from more than one source
+    meta_of_data = np.zeros(len(data_id), dtype=np.uint64)
+    meta_of_data[data_rows] = mid_code[mid_rows]
+    has_isbn = np.flatnonzero(data_isbn != MISSING)
+    first, sizes, (n_sources, n_mids) = group_distinct(
+        data_isbn[has_isbn], data_source[has_isbn], meta_of_data[has_isbn]
+    )
+    multi = sizes > 1
+    same_mid, diff_mid, collide = group_stats(
+        n_sources[multi], n_mids[multi], first[multi]
+    )
+    collision_isbns = read_lines(path, "isbn", has_isbn[collide])
+
+    counts = np.bincount(data_source.astype(np.int64)) if len(data_source) else []
+    names = sources or [str(n) for n in range(len(counts))]
+    return dict(
+        total=len(data_id),
+        entry_sources={names[n]: int(c) for n, c in enumerate(counts) if c},
+        mid_groups=same_isbn + diff_isbn,
+        same_isbn=same_isbn,
+        isbn_groups=same_mid + diff_mid,
+        same_mid=same_mid,
+        collision_meta_ids=collision_mids,
+        collision_isbns=collision_isbns,
+    )
+
+
+def evaluate_index(es, path=EVAL_DIR):
+    """Dump both indices once and evaluate them locally"""
+    sources = dump_meta_data(es, path)
+    dump_meta_ids(es, path)
+    return evaluate_columns(path, sources)
+
+
+def evaluate_ref(data, mids):
+    """Reference implementation of the per bucket evaluation on python dicts.
+
+    :param data: {data_id: (isbn, source)}
+    :param mids: [(meta_id, data_id)]
+    """
+    by_mid, by_isbn, mid_of = {}, {}, {}
+    for mid, data_id in mids:
+        by_mid.setdefault(mid, []).append(data[data_id])
+        mid_of[data_id] = mid
+    for data_id, (isbn, source) in data.items():
+        if isbn is not None:
+            by_isbn.setdefault(isbn, []).append((mid_of.get(data_id), source))
+    same_isbn = diff_isbn = same_mid = diff_mid = 0
+    for entries in by_mid.values():
+        if len(entries) > 1 and len({s for i, s in entries}) > 1:
+            if len({i for i, s in entries}) > 1:
+                diff_isbn += 1
+            else:
+                same_isbn += 1
+    for entries in by_isbn.values():
+        if len(entries) > 1 and len({s for m, s in entries}) > 1:
+            if len({m for m, s in entries}) > 1:
+                diff_mid += 1
+            else:
+                same_mid += 1
+    return dict(
+        mid_groups=same_isbn + diff_isbn,
+        same_isbn=same_isbn,
+        isbn_groups=same_mid + diff_mid,
+        same_mid=same_mid,
+    )
+
+
+def test_evaluate_columns():
+    import random
+    import tempfile
+
+    rand = random.Random(10)
+    data, mids = {}, []
+    for n in range(5000):
+        data_id = f"d{n}"
+        isbn = None if n % 97 == 0 else f"isbn{rand.randint(0, 2000)}"
+        data[data_id] = (isbn, rand.choice(["bxbooks", "dnbrdf", "harvard"]))
+        mids.append((f"mid{rand.randint(0, 2500)}", data_id))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = ColumnWriter(tmp, ("data_id", "data_isbn", "data_source"), ("isbn",))
+        sources = {}
+        for data_id, (isbn, source) in data.items():
+            code = sources.setdefault(source, len(sources))
+            writer.append((hash_str(data_id), hash_str(isbn), code), (isbn,))
+        writer.close()
+        writer = ColumnWriter(tmp, ("mid_code", "mid_data"), ("meta_id",))
+        for mid, data_id in mids:
+            writer.append((hash_str(mid), hash_str(data_id)), (mid,))
+        writer.close()
+        result = evaluate_columns(tmp, list(sources))
+
+    expected = evaluate_ref(data, mids)
+    for key, value in expected.items():
+        assert result[key] == value, (key, result[key], value)
+    assert result["total"] == len(data)
+    assert sum(result["entry_sources"].values()) == len(data)
+    assert len(result["collision_meta_ids"]) == expected["mid_groups"] - expected["same_isbn"]
+    assert all(m.startswith("mid") for m in result["collision_meta_ids"])
+    assert all(i.startswith("isbn") for i in result["collision_isbns"])
+
+
+if __name__ == "__main__":
+    test_evaluate_columns()
@@ -1,15 +1,13 @@
 # -*- coding: utf-8 -*-
 import json
-import os
 
 from elasticsearch import Elasticsearch
 from elasticsearch import helpers
-from iscc_bench import PACKAGE_DIR
+from iscc_bench.elastic_search.columns import evaluate_index
+from iscc_bench.storage import COLLISION_ISBN, COLLISION_MID, write_collisions
 
 es = Elasticsearch()
 
-COLLISION_MID = os.path.join(PACKAGE_DIR, "collision_meta_ids.txt")
-COLLISION_ISBN = os.path.join(PACKAGE_DIR, "collision_isbns.txt")
 total = es.count(index="iscc_meta_data")
 
 group_by_meta_id = (
@@ -134,14 +132,41 @@ def negatives(id):
         collision_file.write("\n".join(collision_objects))
 
 
-def evaluate():
+def single_pass(id):
+    """Compute entry_groups, positives and negatives from one scan per index"""
+    stats = evaluate_index(es)
+
+    write_collisions(stats["collision_meta_ids"], stats["collision_isbns"])
+
+    results = {
+        "doc": {
+            "total": stats["total"],
+            "entry_sources": json.dumps(stats["entry_sources"]),
+            "mid_groups": stats["mid_groups"],
+            "same_isbn": stats["same_isbn"],
+            "isbn_groups": stats["isbn_groups"],
+            "same_mid": stats["same_mid"],
+        }
+    }
+    es.update(index="iscc_result", id=id, doc_type="default", body=results)
+
+
+def evaluate(per_bucket=False):
+    """Evaluate the latest Meta-ID generation run.
+
+    :param bool per_bucket: use the original per bucket queries (slow, one
+        request per hit) instead of the local single pass evaluation
+    """
     no_total_query = '{"query": {"bool": {"must_not": {"exists": {"field": "total"}}}}}'
     empty_results = es.search(index="iscc_result", body=no_total_query)["hits"]["hits"]
     if len(empty_results) > 0:
         id = empty_results[0]["_id"]
-        entry_groups(id)
-        positives(id)
-        negatives(id)
+        if per_bucket:
+            entry_groups(id)
+            positives(id)
+            negatives(id)
+        else:
+            single_pass(id)
     else:
         print("ID´s already tested.")
 
@@ -1,41 +1,93 @@
 # -*- coding: utf-8 -*-
+import os
+from itertools import islice
+
+from iscc_bench import DATA_DIR
 from iscc_bench.readers import ALL_READERS
+from iscc_bench.readers.shards import Checkpoint, iter_sharded, reader_shards
 
 from elasticsearch import Elasticsearch
 from elasticsearch import helpers
 
 es = Elasticsearch()
 
+CHECKPOINT_FILE = os.path.join(DATA_DIR, "fill_elasticsearch.ckpt")
+
+
+def action(entry, source):
+    return {
+        "_index": "iscc_meta_data",
+        "_type": "default",
+        "_id": entry.key,
+        "_source": {
+            "isbn": entry.isbn,
+            "title": entry.title,
+            "creator": entry.author,
+            "source": source,
+        },
+    }
+
 
 def action_generator(reader):
     for entry in reader():
-        yield {
-            "_index": "iscc_meta_data",
-            "_type": "default",
-            "_id": entry.key,
-            "_source": {
-                "isbn": entry.isbn,
-                "title": entry.title,
-                "creator": entry.author,
-                "source": reader.__name__,
-            },
-        }
-
-
-def populate_elastic(reader):
+        yield action(entry, reader.__name__)
+
+
+def iter_chunks(readers, workers=None, checkpoint=None, chunk_size=10000):
+    """Iterate over (source, [MetaData, ...]) chunks of readers.
+
+    Cached readers (see readers/columnar) are read directly, other readers
+    are parsed in shards on all cpus (see readers/shards). dnbrdf is a single
+    shard and runs on one core.
+    """
+    sharded = []
+    for reader in readers:
+        if not hasattr(reader, "cache_dir"):
+            sharded.append(reader)
+            continue
+        entries = reader()
+        for chunk in iter(lambda: list(islice(entries, chunk_size)), []):
+            yield reader.__name__, chunk
+    for shard, metas in iter_sharded(
+        reader_shards(sharded), workers, checkpoint, chunk_size
+    ):
+        yield shard.source, metas
+
+
+def populate_elastic(reader, workers=None, checkpoint_file=None):
+    """Index one or more readers with shards parsed on all cpus (dnbrdf on one).
+
+    Every chunk of records is sent with one bulk call before the next chunk is
+    requested, so the checkpoint only covers indexed records. Resumed runs may
+    index some records again (under the same `_id`). Cached readers are not
+    checkpointed. The checkpoint file is removed after a complete run, so the
+    next run indexes everything again.
+
+    :param reader: reader function or list of reader functions
+    :param int workers: number of reader processes (None: all cpus)
+    :param str checkpoint_file: resume from / save progress to this file
+    :return: (success, failed) number of indexed entries
+    """
+    readers = reader if isinstance(reader, (list, tuple)) else [reader]
+    checkpoint = Checkpoint(checkpoint_file)
     success = 0
     failed = 0
-    for ok, item in helpers.streaming_bulk(
-        es, action_generator(reader), chunk_size=10000
-    ):
-        if ok:
-            success += 1
-        else:
-            failed += 1
+    for source, metas in iter_chunks(readers, workers, checkpoint):
+        ok, errors = helpers.bulk(
+            es,
+            (action(entry, source) for entry in metas),
+            chunk_size=10000,
+            stats_only=True,
+            raise_on_error=False,
+        )
+        success += ok
+        failed += errors
     print("Successful: {}".format(success))
     print("Failed: {}".format(failed))
+    if checkpoint_file and os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+    return success, failed
 
 
 if __name__ == "__main__":
-    for reader in ALL_READERS:
-        populate_elastic(reader)
+    populate_elastic(ALL_READERS, checkpoint_file=CHECKPOINT_FILE)
@@ -11,6 +11,7 @@ from PIL import Image
 from elasticsearch import Elasticsearch
 from elasticsearch import helpers
 from iscc_bench import DATA_DIR
+from iscc_bench.algos.hamming import decode_codes, distances as dist_bulk
 from iscc_bench.readers.blockhash import blockhash
 from iscclib.image import ImageID
 from tabulate import tabulate
@@ -346,9 +347,14 @@ def get_hamming(hash):
             for entry in helpers.scan(es, index="iscc_images", query=get_by_key):
                 if entry["_source"]["errorType"] == "original":
                     value = entry["_source"][hash]
-            for entry in helpers.scan(es, index="iscc_images", query=get_by_key):
-                hamming_dist = hamming_distance(value, entry["_source"][hash])
-                errorType = entry["_source"]["errorType"]
+            entries = [
+                entry["_source"]
+                for entry in helpers.scan(es, index="iscc_images", query=get_by_key)
+            ]
+            codes = decode_codes([e[hash] for e in entries], "iscclib")
+            query = decode_codes([value], "iscclib")[0]
+            for entry, hamming_dist in zip(entries, dist_bulk(codes, query).tolist()):
+                errorType = entry["errorType"]
                 if not errorType in distances:
                     distances[errorType] = [hamming_dist]
                 else:
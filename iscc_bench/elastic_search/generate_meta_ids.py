@@ -1,36 +1,46 @@
 # -*- coding: utf-8 -*-
-from iscclib.meta import MetaID
-
 from elasticsearch import Elasticsearch
 from elasticsearch import helpers
+from iscc_bench.pipeline import PipelineStats, batch_pipeline
+from iscc_bench.storage import variant_func
 
 es = Elasticsearch()
 
 
-def action_generator(id_bits, shinglesize):
+def iter_records():
     for data in helpers.scan(
         es, index="iscc_meta_data", query={"query": {"match_all": {}}}
     ):
-        mid = MetaID.from_meta(
-            data["_source"]["title"],
-            data["_source"]["creator"],
-            bits=id_bits,
-            shinglesize=shinglesize,
-        )
+        yield data["_id"], data["_source"]["title"], data["_source"]["creator"]
+
+
+def action_generator(
+    id_bits, shinglesize, workers=None, batch_size=1000, stats=None, variant="iscclib"
+):
+    func = variant_func(variant, id_bits, shinglesize)
+    for data_id, mid in batch_pipeline(
+        iter_records(), func, workers, batch_size, stats=stats
+    ):
         query = {
             "_index": "iscc_meta_id",
-            "_id": "meta_{}".format(data["_id"]),
+            "_id": "meta_{}".format(data_id),
             "_type": "default",
-            "_source": {"meta_id": "{}".format(mid), "meta_data": data["_id"]},
+            "_source": {"meta_id": mid, "meta_data": data_id},
         }
         yield query
 
 
-def generate_ids(id_bits, shinglesize):
+def generate_ids(
+    id_bits, shinglesize, workers=None, batch_size=1000, variant="iscclib"
+):
     success = 0
     failed = 0
+    stats = PipelineStats()
+    actions = action_generator(
+        id_bits, shinglesize, workers, batch_size, stats, variant
+    )
     for ok, item in helpers.streaming_bulk(
-        es, action_generator(id_bits, shinglesize), chunk_size=50000, request_timeout=50
+        es, actions, chunk_size=50000, request_timeout=50
     ):
         if ok:
             success += 1
@@ -39,9 +49,12 @@ def generate_ids(id_bits, shinglesize):
 
     print("Successful: {}".format(success))
     print("Failed: {}".format(failed))
+    stats.report()
     no_total_query = '{"query": {"bool": {"must_not": {"exists": {"field": "total"}}}}}'
     es.delete_by_query(index="iscc_result", body=no_total_query)
     results = {"bit_length": id_bits, "shingle_size": shinglesize}
+    if variant != "iscclib":  # result indices created before variants are strict
+        results["variant"] = variant
     es.index(index="iscc_result", doc_type="default", body=results)
 
 
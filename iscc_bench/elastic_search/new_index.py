@@ -91,6 +91,10 @@ mapping_result = """
         "entry_sources": {
           "type": "keyword",
           "index": "true"
+        },
+        "variant": {
+          "type": "keyword",
+          "index": "true"
         }
       }
     }
@@ -25,6 +25,7 @@ import time
 from collections import defaultdict
 import cv2 as cv
 from tqdm import tqdm
+from iscc_bench.cache import cached
 from iscc_bench.readers.ukbench import ukbench
 import itertools
 from statistics import *
@@ -54,6 +55,13 @@ def speed():
         print(f"Runtime {end - start} for {hfunc.__name__}")
 
 
+@cached("cv_img_hash")
+def image_hash(img_path, hfunc_name):
+    """Image hash as tuple of ints (cached per image and hash function)"""
+    hfunc = getattr(cv.img_hash, hfunc_name)
+    return tuple(hfunc(cv.imread(img_path)).flatten().tolist())
+
+
 def collisions():
     """Test number of collisions in ukbench image set"""
 
@@ -61,8 +69,7 @@ def collisions():
         img_hashes = defaultdict(list)
 
         for img_path in tqdm(ukbench(), total=10200, leave=False):
-            img = cv.imread(img_path)
-            img_hash = tuple(hfunc(img).flatten())
+            img_hash = image_hash(img_path, hfunc.__name__)
             img_hashes[img_hash].append(os.path.basename(img_path))
         print()
         matches = 0
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""Batched read -> compute -> write pipeline for record streams.
+
+A reader thread pulls records from an iterator and groups them into batches, a
+process pool maps a function over the batches and the consumer receives the
+results in input order (or in completion order with `ordered=False`). Bounded
+queues between the stages provide backpressure:
+the reader blocks once `max_pending` batches wait for a worker and no new batch
+is submitted while the consumer (writer) is busy.
+
+Workers are started with forkserver (spawn where it is not available) so that
+they are never forked from a process that runs the reader thread. A consumer
+that stops early signals the reader to stop and close its input.
+
+Usage:
+
+    stats = PipelineStats()
+    for result in batch_pipeline(records, func, workers=8, stats=stats):
+        write(result)
+    stats.report()
+"""
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from tabulate import tabulate
+
+_DONE = object()
+
+
+class PipelineStats:
+    """Records and busy seconds per pipeline stage"""
+
+    def __init__(self):
+        self.records = dict(read=0, compute=0, write=0)
+        self.seconds = dict(read=0.0, compute=0.0, write=0.0)
+        self.start = time.perf_counter()
+        self.end = None
+
+    def add(self, stage, records, seconds):
+        self.records[stage] += records
+        self.seconds[stage] += seconds
+
+    def rows(self):
+        wall = (self.end or time.perf_counter()) - self.start
+        rows = []
+        for stage in self.records:
+            n, busy = self.records[stage], self.seconds[stage]
+            rows.append([stage, n, busy, n / busy if busy else 0.0])
+        total = self.records["write"]
+        rows.append(["pipeline", total, wall, total / wall if wall else 0.0])
+        return rows
+
+    def report(self):
+        headers = ["Stage", "Records", "Busy s", "Records/s"]
+        print(tabulate(self.rows(), headers=headers, floatfmt=".2f"))
+
+
+def _timed_batch(func, batch):
+    start = time.perf_counter()
+    results = func(batch)
+    return results, time.perf_counter() - start
+
+
+def _mp_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context(
+        "forkserver" if "forkserver" in methods else "spawn"
+    )
+
+
+def _read_batches(records, batch_size, out, stats, errors, stop):
+    batch = []
+    it = iter(records)
+    try:
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                record = next(it)
+            except StopIteration:
+                stats.add("read", 0, time.perf_counter() - start)
+                break
+            stats.add("read", 1, time.perf_counter() - start)
+            batch.append(record)
+            if len(batch) == batch_size:
+                out.put(batch)
+                batch = []
+        if batch and not stop.is_set():
+            out.put(batch)
+    except BaseException as e:
+        errors.append(e)
+    finally:
+        if hasattr(it, "close"):
+            it.close()
+        out.put(_DONE)
+
+
+def batch_pipeline(
+    records,
+    func,
+    workers=None,
+    batch_size=1000,
+    max_pending=None,
+    stats=None,
+    ordered=True,
+):
+    """Map func over batches of records in a process pool, yield results in order.
+
+    :param records: iterable of (picklable) records
+    :param func: picklable function mapping a list of records to a list of results
+    :param int workers: number of worker processes (None: all cpus, 0: inline)
+    :param int batch_size: records per batch
+    :param int max_pending: batches in flight (default: 2 * workers)
+    :param PipelineStats stats: optional stage statistics
+    :param bool ordered: yield the results of a batch as soon as it is done
+        instead of in input order if False (order within a batch is kept)
+    """
+    stats = stats or PipelineStats()
+    workers = os.cpu_count() if workers is None else workers
+    max_pending = max_pending or 2 * max(workers, 1)
+    batches = queue.Queue(maxsize=max_pending)
+    errors = []
+    stop = threading.Event()
+    reader = threading.Thread(
+        target=_read_batches,
+        args=(records, batch_size, batches, stats, errors, stop),
+        daemon=True,
+    )
+    reader.start()
+
+    def consume(results):
+        start = time.perf_counter()
+        for result in results:
+            yield result
+        stats.add("write", len(results), time.perf_counter() - start)
+
+    try:
+        if workers == 0:
+            for batch in iter(batches.get, _DONE):
+                results, seconds = _timed_batch(func, batch)
+                stats.add("compute", len(batch), seconds)
+                yield from consume(results)
+        elif not ordered:
+            with ProcessPoolExecutor(workers, mp_context=_mp_context()) as pool:
+                pending = {}
+                for batch in iter(batches.get, _DONE):
+                    pending[pool.submit(_timed_batch, func, batch)] = len(batch)
+                    if len(pending) >= max_pending:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            results, seconds = future.result()
+                            stats.add("compute", pending.pop(future), seconds)
+                            yield from consume(results)
+                for future in list(pending):
+                    results, seconds = future.result()
+                    stats.add("compute", pending.pop(future), seconds)
+                    yield from consume(results)
+        else:
+            with ProcessPoolExecutor(workers, mp_context=_mp_context()) as pool:
+                pending = deque()
+                for batch in iter(batches.get, _DONE):
+                    pending.append((len(batch), pool.submit(_timed_batch, func, batch)))
+                    if len(pending) >= max_pending:
+                        n, future = pending.popleft()
+                        results, seconds = future.result()
+                        stats.add("compute", n, seconds)
+                        yield from consume(results)
+                while pending:
+                    n, future = pending.popleft()
+                    results, seconds = future.result()
+                    stats.add("compute", n, seconds)
+                    yield from consume(results)
+    finally:
+        stats.end = time.perf_counter()
+        # unblock a reader waiting to put a batch if the consumer stopped early
+        stop.set()
+        while reader.is_alive():
+            try:
+                batches.get(timeout=0.1)
+            except queue.Empty:
+                pass
+    if errors:
+        raise errors[0]
+
+
+def _square_all(batch):
+    return [x * x for x in batch]
+
+
+def test_batch_pipeline():
+    for workers in (0, 2):
+        stats = PipelineStats()
+        results = list(
+            batch_pipeline(
+                range(10007), _square_all, workers, batch_size=100, stats=stats
+            )
+        )
+        assert results == [x * x for x in range(10007)]
+        assert stats.records == dict(read=10007, compute=10007, write=10007)
+        results = batch_pipeline(
+            range(10007), _square_all, workers, batch_size=100, ordered=False
+        )
+        assert sorted(results) == [x * x for x in range(10007)]
+
+        # an early stop closes the input of the reader
+        closed = []
+
+        def endless():
+            try:
+                yield from iter(int, 1)
+            finally:
+                closed.append(True)
+
+        results = batch_pipeline(endless(), _square_all, workers, batch_size=10)
+        assert next(results) == 0
+        results.close()
+        assert closed == [True]
+
+    def failing():
+        yield 1
+        raise ValueError("reader failed")
+
+    try:
+        list(batch_pipeline(failing(), _square_all, 0))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("reader error not raised")
+
+
+if __name__ == "__main__":
+    test_batch_pipeline()
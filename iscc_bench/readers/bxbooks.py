@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 import os
 import csv
+import locale
 from iscc_bench import DATA_DIR, MetaData
+from iscc_bench.readers.shards import SHARD_SIZE, byte_shards, iter_delimited
 import isbnlib
 import logging
 
@@ -22,16 +24,42 @@ def bxbooks(path=BXBOOKS_DATA):
     with open(path) as csv_file:
         reader = csv.DictReader(csv_file, delimiter=";")
         for row in reader:
+            meta = parse_row(row)
+            if meta is not None:
+                yield meta
 
-            if isbnlib.notisbn(row["ISBN"]):
-                log.info("Skip row with invalid ISBN {}".format(row["ISBN"]))
-                continue
 
-            yield MetaData(
-                isbn=isbnlib.to_isbn13(row["ISBN"]),
-                title=row["Book-Title"].split(" : ")[0],
-                author=row["Book-Author"],
-            )
+def parse_row(row):
+    """Return :class:`MetaData` of a bxbooks csv row (dict) or None"""
+
+    if isbnlib.notisbn(row["ISBN"]):
+        log.info("Skip row with invalid ISBN {}".format(row["ISBN"]))
+        return None
+
+    return MetaData(
+        isbn=isbnlib.to_isbn13(row["ISBN"]),
+        title=row["Book-Title"].split(" : ")[0],
+        author=row["Book-Author"],
+    )
+
+
+def shards(path=BXBOOKS_DATA, shard_size=SHARD_SIZE):
+    """Byte range shards aligned to lines after the csv header (see readers/shards)"""
+    with open(path, "rb") as infile:
+        start = len(infile.readline())
+    return byte_shards("bxbooks", path, b"\n", shard_size, start)
+
+
+def read_shard(shard, position=None):
+    """Iterate over (position, [MetaData]) per csv line of a shard"""
+    encoding = locale.getpreferredencoding(False)  # like `open` in `bxbooks`
+    with open(shard.path, "rb") as infile:
+        header = infile.readline().decode(encoding)
+    fields = next(csv.reader([header], delimiter=";"))
+    for position, line in iter_delimited(shard, b"\n", position):
+        values = next(csv.reader([line.decode(encoding)], delimiter=";"), None)
+        meta = parse_row(dict(zip(fields, values))) if values else None
+        yield position, [] if meta is None else [meta]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,538 @@
+# -*- coding: utf-8 -*-
+"""Columnar cache of the normalized `MetaData` records of a reader.
+
+A reader is converted once into a directory of columns that are memory-mapped
+when read back:
+
+isbn.npy                : uint64 isbn13 (0 for isbns that are not 13 digits)
+title.npy, author.npy   : uint32 codes into the title / author dictionaries
+title.bin, author.bin   : utf-8 dictionary strings in code order, zlib compressed
+                          in blocks of about BLOCK_SIZE bytes
+title.off, author.off   : (n + 1) uint64 offsets of the strings in the
+                          uncompressed dictionary (.npy format)
+title.blk, author.blk   : (blocks + 1, 2) uint64 uncompressed / compressed
+                          block offsets (.npy format)
+irregular.npy           : rows with isbns that are not 13 digits ...
+irregular.bin/.off/.blk : ... and their raw isbn strings
+meta.json               : source (reader name), number of records, cache format
+                          and the source stats the cache was built from
+
+Only the string dictionaries, the bulk of a cache, are compressed. The integer
+columns stay raw so the isbn predicate and row lookups can work on memory maps.
+
+`build_cache` does not keep the dictionaries in memory. Strings are spilled to
+disk with two xxh64 hashes per row and deduplicated with numpy in partitions of
+the first hash (a collision of the first hash is resolved by the second). Codes
+number distinct strings in order of first occurrence, which keeps the
+dictionary blocks of a sequential scan together.
+
+`ColumnarCache.iter_records(isbns)` pushes an isbn predicate down to the isbn
+column and only decodes matching rows. `cached(reader)` wraps a reader function
+so that the first call converts and later calls read from the cache. The cache
+is rebuilt when the size or mtime of the reader's data files (the path defaults
+of its signature) or the source code of its module change.
+
+Results for 100000 synthetic records per reader (records/s, compression ratio
+of the title and author dictionaries, synthetic strings compress well):
+
+libgen  : reader   64969 - cache build   48139 - cache read  853990 - dict 5.4x
+bxbooks : reader   66600 - cache build   47412 - cache read  701472 - dict 5.0x
+harvard : reader   42191 - cache build   34094 - cache read  720718 - dict 5.5x
+
+Peak anonymous memory of `build_cache` for 6M records with distinct titles is
+235 MB (about 1.2 GB with python dictionaries and per row arrays).
+"""
+import inspect
+import json
+import mmap
+import os
+import shutil
+import time
+import zlib
+from array import array
+from functools import lru_cache, wraps
+
+import numpy as np
+import xxhash
+
+from iscc_bench import DATA_DIR, MetaData
+
+CACHE_DIR = os.path.join(DATA_DIR, "columnar")
+CACHE_FORMAT = 2
+BLOCK_SIZE = 1 << 16
+COMPRESS_LEVEL = 6
+SPILL_ROWS = 1 << 16
+PARTITION_ROWS = 1 << 20
+
+hash_bytes = xxhash.xxh64_intdigest
+
+
+class StringColumn:
+    """Memory-mapped, block compressed dictionary strings, see `write_strings`"""
+
+    def __init__(self, path, name, cached_blocks=64):
+        self.offsets = np.load(os.path.join(path, name + ".off"), mmap_mode="r")
+        blocks = np.load(os.path.join(path, name + ".blk"))
+        self.block_starts = blocks[:-1, 0]
+        self.block_spans = blocks[:, 1].tolist()
+        self._file = open(os.path.join(path, name + ".bin"), "rb")
+        if os.fstat(self._file.fileno()).st_size:
+            self.blob = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.blob = b""
+        self.block = lru_cache(maxsize=cached_blocks)(self._read_block)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, code):
+        return self.decode(np.array([code], dtype=np.int64))[0]
+
+    def _read_block(self, number):
+        start, end = self.block_spans[number : number + 2]
+        return zlib.decompress(self.blob[start:end])
+
+    def decode(self, codes):
+        """Strings of an array of codes (each distinct code is decoded once)"""
+        uniques, inverse = np.unique(codes, return_inverse=True)
+        starts = np.asarray(self.offsets[uniques], dtype=np.int64)
+        ends = np.asarray(self.offsets[uniques + 1], dtype=np.int64)
+        if not len(self.block_starts):
+            return [""] * len(inverse)
+        numbers = np.searchsorted(self.block_starts, starts, side="right") - 1
+        bases = self.block_starts[numbers].astype(np.int64)
+        strings = []
+        for number, start, end in zip(
+            numbers.tolist(), (starts - bases).tolist(), (ends - bases).tolist()
+        ):
+            strings.append(self.block(number)[start:end].decode("utf-8"))
+        return [strings[i] for i in inverse.tolist()]
+
+    def close(self):
+        self.block.cache_clear()
+        if isinstance(self.blob, mmap.mmap):
+            self.blob.close()
+        self._file.close()
+
+
+def write_strings(strings, path, name, block_size=None):
+    """Write a sequence of strings (or utf-8 bytes) as dictionary column files.
+
+    Strings are never split across blocks, a block is closed as soon as it
+    holds at least `block_size` bytes.
+    """
+    block_size = block_size or BLOCK_SIZE
+    offsets = array("Q", [0])
+    blocks = array("Q", [0, 0])
+    pending = []
+    with open(os.path.join(path, name + ".bin"), "wb") as outfile:
+
+        def flush():
+            data = zlib.compress(b"".join(pending), COMPRESS_LEVEL)
+            outfile.write(data)
+            blocks.extend((offsets[-1], blocks[-1] + len(data)))
+            pending.clear()
+
+        for s in strings:
+            data = s.encode("utf-8") if isinstance(s, str) else s
+            pending.append(data)
+            offsets.append(offsets[-1] + len(data))
+            if offsets[-1] - blocks[-2] >= block_size:
+                flush()
+        if pending:
+            flush()
+    with open(os.path.join(path, name + ".off"), "wb") as outfile:
+        np.save(outfile, np.frombuffer(offsets, dtype=np.uint64))
+    with open(os.path.join(path, name + ".blk"), "wb") as outfile:
+        np.save(outfile, np.frombuffer(blocks, dtype=np.uint64).reshape(-1, 2))
+
+
+class SpilledStrings:
+    """Per row strings of a column spilled to disk, see `build_cache`"""
+
+    def __init__(self, path, name):
+        self.prefix = os.path.join(path, name)
+        self.files = {
+            ext: open(self.prefix + "." + ext, "wb")
+            for ext in ("raw", "h1", "h2", "end")
+        }
+        self.h1, self.h2, self.ends = array("Q"), array("Q"), array("Q")
+        self.size = 0
+
+    def append(self, string):
+        data = string.encode("utf-8")
+        self.files["raw"].write(data)
+        self.size += len(data)
+        self.h1.append(hash_bytes(data))
+        self.h2.append(hash_bytes(data, 1))
+        self.ends.append(self.size)
+        if len(self.ends) >= SPILL_ROWS:
+            self.flush()
+
+    def flush(self):
+        for ext, values in (("h1", self.h1), ("h2", self.h2), ("end", self.ends)):
+            values.tofile(self.files[ext])
+            del values[:]
+
+    def load(self, ext):
+        dtype = np.uint8 if ext == "raw" else np.uint64
+        if not os.path.getsize(self.prefix + "." + ext):
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(self.prefix + "." + ext, dtype=dtype, mode="r")
+
+    def iter_rows(self, rows):
+        """Spilled utf-8 strings of sorted row numbers"""
+        raw, ends = self.load("raw"), self.load("end")
+        for i in range(0, len(rows), SPILL_ROWS):
+            chunk = rows[i : i + SPILL_ROWS]
+            stops = np.asarray(ends[chunk], dtype=np.int64)
+            starts = np.asarray(ends[np.maximum(chunk - 1, 0)], dtype=np.int64)
+            starts[chunk == 0] = 0
+            for start, stop in zip(starts.tolist(), stops.tolist()):
+                yield raw[start:stop].tobytes()
+
+    def finish(self, path, name):
+        """Write the code column `name`.npy and the dictionary of distinct strings.
+
+        Rows are deduplicated by their first hash in partitions of about
+        PARTITION_ROWS rows, across partitions only the first row of each
+        distinct string is kept in memory.
+        """
+        self.flush()
+        for file in self.files.values():
+            file.close()
+        h1, h2 = self.load("h1"), self.load("h2")
+        parts = max(1, -(-len(h1) // PARTITION_ROWS))
+        groups = np.lib.format.open_memmap(
+            self.prefix + ".grp", mode="w+", dtype=np.uint32, shape=(len(h1),)
+        )
+        firsts = []
+        for part in range(parts):
+            rows = np.concatenate(
+                [np.zeros(0, dtype=np.int64)]
+                + [
+                    np.flatnonzero(h1[i : i + SPILL_ROWS] % parts == part) + i
+                    for i in range(0, len(h1), SPILL_ROWS)
+                ]
+            )
+            keys = h1[rows]
+            _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+            if np.any(h2[rows] != h2[rows[first]][inverse]):
+                keys = np.stack([keys, h2[rows]], axis=1)
+                _, first, inverse = np.unique(
+                    keys, axis=0, return_index=True, return_inverse=True
+                )
+            offset = sum(len(f) for f in firsts)
+            groups[rows] = inverse.reshape(-1) + offset
+            firsts.append(rows[first])
+        firsts = np.concatenate(firsts)
+        order = np.argsort(firsts)
+        ranks = np.empty(len(order), dtype=np.uint32)
+        ranks[order] = np.arange(len(order), dtype=np.uint32)
+        codes = np.lib.format.open_memmap(
+            os.path.join(path, name + ".npy"),
+            mode="w+",
+            dtype=np.uint32,
+            shape=(len(h1),),
+        )
+        for i in range(0, len(h1), SPILL_ROWS):
+            codes[i : i + SPILL_ROWS] = ranks[groups[i : i + SPILL_ROWS]]
+        codes.flush()
+        rows = firsts[order]
+        del codes, groups, ranks, firsts, order, h1, h2
+        write_strings(self.iter_rows(rows), path, name)
+        for ext in list(self.files) + ["grp"]:
+            os.remove(self.prefix + "." + ext)
+
+
+class ColumnarCache:
+    """Memory-mapped columnar records, see `build_cache`"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as infile:
+            meta = json.load(infile)
+        self.source = meta["source"]
+        self.isbn = np.load(os.path.join(path, "isbn.npy"), mmap_mode="r")
+        self.title = np.load(os.path.join(path, "title.npy"), mmap_mode="r")
+        self.author = np.load(os.path.join(path, "author.npy"), mmap_mode="r")
+        self.titles = StringColumn(path, "title")
+        self.authors = StringColumn(path, "author")
+        self.irregular = np.load(os.path.join(path, "irregular.npy"))
+        self.irregular_isbns = StringColumn(path, "irregular")
+
+    def __len__(self):
+        return len(self.isbn)
+
+    def __iter__(self):
+        return self.iter_records()
+
+    def rows(self, isbns=None):
+        """Row numbers of records with one of the isbns (all rows if None).
+
+        :param isbns: isbn13 integers or strings
+        :return: sorted int64 array of row numbers
+        """
+        if isbns is None:
+            return np.arange(len(self), dtype=np.int64)
+        wanted = np.unique(np.fromiter((int(i) for i in isbns), dtype=np.uint64))
+        return np.flatnonzero(np.isin(self.isbn, wanted))
+
+    def iter_records(self, isbns=None, chunk_size=100000):
+        """Iterate over :class:`MetaData` in reader order.
+
+        :param isbns: only records with one of these isbn13 (integers or strings)
+        :param int chunk_size: rows decoded at once
+        """
+        rows = self.rows(isbns)
+        for i in range(0, len(rows), chunk_size):
+            chunk = rows[i : i + chunk_size]
+            values = [f"{v:013d}" for v in np.asarray(self.isbn[chunk]).tolist()]
+            for n in np.flatnonzero(np.isin(chunk, self.irregular)).tolist():
+                code = int(np.searchsorted(self.irregular, chunk[n]))
+                values[n] = self.irregular_isbns[code]
+            titles = self.titles.decode(np.asarray(self.title[chunk]))
+            authors = self.authors.decode(np.asarray(self.author[chunk]))
+            yield from map(MetaData, values, titles, authors)
+
+    def close(self):
+        for column in (self.titles, self.authors, self.irregular_isbns):
+            column.close()
+
+
+def build_cache(source, metas, path, stats=None):
+    """Convert a stream of :class:`MetaData` into a `ColumnarCache`.
+
+    :param str source: reader name
+    :param metas: iterable of :class:`MetaData`
+    :param str path: cache directory (replaced if it exists)
+    :param stats: callable returning the source stats for meta.json, called
+        after conversion (readers may create derived files like indexes)
+    :return: ColumnarCache
+    """
+    tmp = path + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    isbns = array("Q")  # little-endian platforms, like the rest of the caches
+    titles, authors = SpilledStrings(tmp, "title"), SpilledStrings(tmp, "author")
+    irregular, irregular_isbns = [], []
+    records = 0
+    with open(os.path.join(tmp, "isbn.raw"), "wb") as isbn_file:
+        for row, meta in enumerate(metas):
+            isbn = meta.isbn
+            if len(isbn) == 13 and isbn.isdigit() and isbn.isascii() and int(isbn):
+                isbns.append(int(isbn))
+            else:
+                isbns.append(0)
+                irregular.append(row)
+                irregular_isbns.append(isbn)
+            titles.append(meta.title)
+            authors.append(meta.author)
+            if len(isbns) >= SPILL_ROWS:
+                records += len(isbns)
+                isbns.tofile(isbn_file)
+                del isbns[:]
+        records += len(isbns)
+        isbns.tofile(isbn_file)
+    with open(os.path.join(tmp, "isbn.npy"), "wb") as outfile:
+        header = dict(descr="<u8", fortran_order=False, shape=(records,))
+        np.lib.format.write_array_header_1_0(outfile, header)
+        with open(os.path.join(tmp, "isbn.raw"), "rb") as infile:
+            shutil.copyfileobj(infile, outfile)
+    os.remove(os.path.join(tmp, "isbn.raw"))
+    titles.finish(tmp, "title")
+    authors.finish(tmp, "author")
+    np.save(os.path.join(tmp, "irregular.npy"), np.array(irregular, dtype=np.int64))
+    write_strings(irregular_isbns, tmp, "irregular")
+    with open(os.path.join(tmp, "meta.json"), "w") as outfile:
+        meta = dict(source=source, records=records, format=CACHE_FORMAT)
+        if stats is not None:
+            meta["stats"] = stats()
+        json.dump(meta, outfile)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+    return ColumnarCache(path)
+
+
+def cache_path(source, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, source)
+
+
+def source_stats(reader):
+    """Size and mtime of the data files and source code hash of a reader.
+
+    Data files are the existing paths among the string defaults of the reader's
+    signature (directories are walked).
+    """
+    files = []
+    for param in inspect.signature(reader).parameters.values():
+        if not isinstance(param.default, str):
+            continue
+        if os.path.isdir(param.default):
+            for root, dirs, names in os.walk(param.default):
+                dirs.sort()
+                files.extend(os.path.join(root, name) for name in sorted(names))
+        elif os.path.isfile(param.default):
+            files.append(param.default)
+    sizes = []
+    for file in files:
+        stat = os.stat(file)
+        sizes.append([file, stat.st_size, stat.st_mtime_ns])
+    with open(inspect.getsourcefile(reader), "rb") as infile:
+        code = xxhash.xxh64(infile.read()).hexdigest()
+    return dict(files=sizes, code=code)
+
+
+def is_current(reader, path):
+    """Whether the cache at path was built from the current reader sources"""
+    try:
+        with open(os.path.join(path, "meta.json")) as infile:
+            meta = json.load(infile)
+    except FileNotFoundError:
+        return False
+    if meta.get("format") != CACHE_FORMAT:
+        return False
+    return meta.get("stats") == source_stats(reader)
+
+
+def get_or_build_cache(reader, cache_dir=CACHE_DIR, rebuild=False):
+    """Return the `ColumnarCache` of a reader function.
+
+    The cache is converted on first use and rebuilt if it is stale.
+    """
+    path = cache_path(reader.__name__, cache_dir)
+    if not rebuild and is_current(reader, path):
+        return ColumnarCache(path)
+    return build_cache(reader.__name__, reader(), path, lambda: source_stats(reader))
+
+
+def cached(reader, cache_dir=CACHE_DIR):
+    """Wrap a reader function to read from its columnar cache.
+
+    The wrapper keeps the reader name and takes an optional isbn predicate:
+    `cached(harvard)(isbns=[9780306406157])`.
+    """
+
+    @wraps(reader)
+    def cached_reader(isbns=None):
+        cache = get_or_build_cache(reader, cache_dir)
+        try:
+            yield from cache.iter_records(isbns)
+        finally:
+            cache.close()
+
+    cached_reader.cache_dir = cache_dir
+    return cached_reader
+
+
+def cached_readers(readers=None, cache_dir=CACHE_DIR):
+    """Cached versions of readers (default `ALL_READERS`)"""
+    if readers is None:
+        from iscc_bench.readers import ALL_READERS
+
+        readers = ALL_READERS
+    return [cached(reader, cache_dir) for reader in readers]
+
+
+def test_columnar_cache():
+    import tempfile
+
+    metas = [
+        MetaData("9780306406157", "Title Ä", "Müller, Hans"),
+        MetaData("978-3-16-148410-0", "Title Ä", "Smith"),
+        MetaData("9783161484100", "李白", "Müller, Hans"),
+        MetaData("", "", ""),
+        MetaData("0000000000000", "Zero", "Smith"),
+        MetaData("9780306406157", "Other", "Smith"),
+    ]
+
+    def sample():
+        return iter(metas)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        reader = cached(sample, tmp)
+        assert reader.__name__ == "sample"
+        assert list(reader()) == metas
+        assert list(reader(isbns=["9780306406157"])) == [metas[0], metas[5]]
+        assert list(reader(isbns=np.array([9783161484100], np.uint64))) == metas[2:3]
+        cache = ColumnarCache(cache_path("sample", tmp))
+        assert cache.source == "sample" and len(cache) == len(metas)
+        assert len(cache.titles) == 5 and len(cache.authors) == 3
+        assert list(cache.iter_records(chunk_size=4)) == metas
+        cache.close()
+        empty = build_cache("empty", [], os.path.join(tmp, "empty"))
+        assert list(empty) == [] and list(empty.iter_records([1])) == []
+        empty.close()
+
+        # small spill chunks, partitions and blocks, colliding first hashes
+        global SPILL_ROWS, PARTITION_ROWS, BLOCK_SIZE, hash_bytes
+        saved = SPILL_ROWS, PARTITION_ROWS, BLOCK_SIZE, hash_bytes
+        SPILL_ROWS, PARTITION_ROWS, BLOCK_SIZE = 3, 4, 8
+        hash_bytes = lambda data, seed=0: xxhash.xxh64_intdigest(data, seed) >> 62 * (
+            not seed
+        )
+        try:
+            many = [MetaData("", f"Title {i % 7}", f"Auth {i % 3}") for i in range(20)]
+            cache = build_cache("many", many, os.path.join(tmp, "many"))
+        finally:
+            SPILL_ROWS, PARTITION_ROWS, BLOCK_SIZE, hash_bytes = saved
+        assert list(cache) == many and len(cache.titles) == 7
+        assert cache.titles.decode(np.arange(7)) == [f"Title {i}" for i in range(7)]
+        assert len(cache.titles.block_starts) == 4 and cache.authors[2] == "Auth 2"
+        spilled = (".raw", ".h1", ".h2", ".end")
+        assert not [f for f in os.listdir(cache.path) if f.endswith(spilled)]
+        cache.close()
+
+        source = os.path.join(tmp, "source.txt")
+        with open(source, "w") as outfile:
+            outfile.write("a\nb\n")
+
+        def lines(path=source):
+            with open(path) as infile:
+                yield from (MetaData(line.strip(), "", "") for line in infile)
+
+        reader = cached(lines, tmp)
+        assert [m.isbn for m in reader()] == ["a", "b"]
+        assert is_current(lines, cache_path("lines", tmp))
+        with open(source, "a") as outfile:
+            outfile.write("c\n")
+        assert not is_current(lines, cache_path("lines", tmp))
+        assert [m.isbn for m in reader()] == ["a", "b", "c"]
+
+
+def benchmark_cache(n=100000):
+    """Records/s of the readers against building and reading their caches.
+
+    Also prints the compression ratio of the title and author dictionaries.
+    """
+    import tempfile
+    from iscc_bench.readers.shards import reader_module, write_sample_sources
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index_file = os.path.join(tmp, "ol_dump_authors.idx")
+        paths = write_sample_sources(tmp, n=n, index_file=index_file)
+        for name in ("libgen", "bxbooks", "harvard"):
+            reader = getattr(reader_module(name), name)
+            path = cache_path(name, tmp)
+            rates = []
+            for func in (
+                lambda: sum(1 for _ in reader(paths[name])),
+                lambda: len(build_cache(name, reader(paths[name]), path)),
+                lambda: sum(1 for _ in ColumnarCache(path)),
+            ):
+                start = time.time()
+                records = func()
+                rates.append(records / (time.time() - start))
+            cache = ColumnarCache(path)
+            raw = sum(int(c.offsets[-1]) for c in (cache.titles, cache.authors))
+            packed = sum(len(c.blob) for c in (cache.titles, cache.authors))
+            cache.close()
+            print(
+                f"{name:<8}: reader {rates[0]:7.0f} - cache build {rates[1]:7.0f} - "
+                f"cache read {rates[2]:7.0f} - dict {raw / packed:.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    test_columnar_cache()
+    benchmark_cache()
@@ -14,17 +14,18 @@ Instructions:
     ./data/GND.rdf.gz
 
 Notes:
-    First run will automatically index authors.
+    First run will automatically index authors into a compact memory-mapped
+    `StringIndex` (see readers/strindex).
 """
 import os
 import gzip
 import logging
-from lxml import etree
 
 import isbnlib
-from sqlitedict import SqliteDict
 
 from iscc_bench import DATA_DIR, MetaData
+from iscc_bench.readers.shards import Shard, iter_skip
+from iscc_bench.readers.strindex import StringIndex, build_string_index
 
 
 log = logging.getLogger(__name__)
@@ -32,15 +33,36 @@ log = logging.getLogger(__name__)
 
 DATA_FILE = os.path.join(DATA_DIR, "DNBtitel.rdf.gz")
 DATA_FILE_AUTHORS = os.path.join(DATA_DIR, "GND.rdf.gz")
-INDEX_FILE_AUTHORS = os.path.join(DATA_DIR, "gnd.sqlite")
+INDEX_FILE_AUTHORS = os.path.join(DATA_DIR, "gnd.idx")
 
 
-def dnbrdf(path=DATA_FILE):
+def dnbrdf(path=DATA_FILE, index_file=INDEX_FILE_AUTHORS):
     """Return a generator that iterates over all metadata.
 
     :param str path: path to directory with DNBtitel.rdf.gz file
+    :param str index_file: path to author index directory
     :return: Generator[:class:`MetaData`] (filtered for records that have all metadata)
     """
+    authors = get_or_build_author_index(index_file)
+    for entries in iter_entries(path, authors):
+        yield from entries
+
+
+def shards(path=DATA_FILE, shard_size=None, index_file=INDEX_FILE_AUTHORS):
+    """A single shard, shard_size is not used (see readers/shards)"""
+    return [Shard("dnbrdf", path, 0, os.path.getsize(path), index_file)]
+
+
+def read_shard(shard, position=None):
+    """Iterate over (position, [MetaData, ...]) per title, position counts titles"""
+    authors = get_or_build_author_index(shard.index or INDEX_FILE_AUTHORS)
+    yield from iter_skip(iter_entries(shard.path, authors), position)
+
+
+def iter_entries(path, authors):
+    """Iterate over the list of :class:`MetaData` of every title with isbns"""
+    from lxml import etree
+
     context = etree.iterparse(
         gzip.open(path),
         tag=(
@@ -50,8 +72,6 @@ def dnbrdf(path=DATA_FILE):
     )
     parent = None
 
-    authors = get_or_build_author_index(INDEX_FILE_AUTHORS)
-
     # loop over every isbn10 or isbn13 element
     for event, elem in context:
         if (
@@ -61,8 +81,7 @@ def dnbrdf(path=DATA_FILE):
         else:
             parent = elem.getparent()
 
-        for entry in process_entry(parent, authors):
-            yield entry
+        yield list(process_entry(parent, authors))
         # It's safe to call clear() here because no descendants will be
         # accessed
         elem.clear()
@@ -76,13 +95,13 @@ def dnbrdf(path=DATA_FILE):
 def get_or_build_author_index(index_file=INDEX_FILE_AUTHORS):
     """Return a dict like object that maps author_ids to author names.
 
-    :param str index_file: path to persistent index file (sqlite)
-    :return: SqliteDict
+    :param str index_file: path to persistent index directory
+    :return: StringIndex
     """
     return (
-        SqliteDict(index_file, flag="r")
-        if os.path.exists(INDEX_FILE_AUTHORS)
-        else index_authors()
+        StringIndex(index_file)
+        if os.path.exists(index_file)
+        else index_authors(index_file=index_file)
     )
 
 
@@ -101,8 +120,9 @@ def process_entry(elem, authors):
             )
             if resource is not None:
                 creator_id = str(resource).split("http://d-nb.info/gnd/")[1]
-                if authors.get(creator_id) is not None:
-                    creators.append(authors[creator_id])
+                creator = authors.get(creator_id)
+                if creator is not None:
+                    creators.append(creator)
             else:
                 for description_tag in child.iterchildren():
                     if (
@@ -153,16 +173,23 @@ def process_entry(elem, authors):
 
 
 def index_authors(data_file=DATA_FILE_AUTHORS, index_file=INDEX_FILE_AUTHORS):
-    """extract creators from gnd and save memory while iterating"""
+    """Index creators from gnd into a `StringIndex`"""
+    log.info("Indexing GND authors (~13.6 Million)")
+    authors_idx = build_string_index(iter_authors(data_file), index_file)
+    log.info("Indexed {:,} authors".format(len(authors_idx)))
+    return authors_idx
+
+
+def iter_authors(data_file=DATA_FILE_AUTHORS):
+    """extract (creator_id, name) pairs from gnd and save memory while iterating"""
+    from lxml import etree
+
     context = etree.iterparse(
         gzip.open(data_file),
         tag="{http://www.w3.org/1999/02/22-rdf-syntax-ns#}Description",
     )
 
     indexed = 0
-    authors_idx = SqliteDict(index_file, autocommit=False)
-
-    log.info("Indexing GND authors (~13.6 Million)")
 
     for event, elem in context:
         if not elem.attrib.get("{http://www.w3.org/1999/02/22-rdf-syntax-ns#}about"):
@@ -178,7 +205,7 @@ def index_authors(data_file=DATA_FILE_AUTHORS, index_file=INDEX_FILE_AUTHORS):
             creator_id = str(
                 elem.attrib.get("{http://www.w3.org/1999/02/22-rdf-syntax-ns#}about")
             ).split("http://d-nb.info/gnd/")[1]
-            authors_idx[creator_id] = name
+            yield creator_id, name
             log.debug("Indexing GND Author {} -> {}".format(creator_id, name))
 
             indexed += 1
@@ -193,11 +220,7 @@ def index_authors(data_file=DATA_FILE_AUTHORS, index_file=INDEX_FILE_AUTHORS):
             while ancestor.getprevious() is not None:
                 del ancestor.getparent()[0]
 
-    authors_idx.commit()
-    log.info("Indexed {:,} authors".format(len(authors_idx)))
-
     del context
-    return authors_idx
 
 
 def extract_creator(elem):
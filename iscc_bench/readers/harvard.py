@@ -10,49 +10,102 @@ Instructions:
     Download datafile and run `tar xvf harvard.tar.gz` to extract marc21 files.
     After moving the .mrc files to the /data/harvard folder you should be able
     to run this script and see log output of parsed data.
+
+Notes:
+    Records are parsed with the lean reader in readers/marc21 (only isbn,
+    title and author fields are decoded). `harvard(use_pymarc=True)` reads with
+    pymarc for validation. With `workers` the .mrc files are read in shards on
+    a process pool (records are not in file order then).
 """
 import os
 import logging
 
 import isbnlib
-from pymarc import MARCReader
 
 from iscc_bench import DATA_DIR, MetaData
+from iscc_bench.readers.marc21 import iter_file, parse_record, record_meta
+from iscc_bench.readers.shards import (
+    SHARD_SIZE,
+    byte_shards,
+    iter_delimited,
+    iter_sharded,
+)
 
 
 log = logging.getLogger(__name__)
 
 
 HARVARD_DATA = os.path.join(DATA_DIR, "harvard")
+END_OF_RECORD = b"\x1d"
 
 
-def harvard(path=HARVARD_DATA):
+def harvard(path=HARVARD_DATA, workers=0, use_pymarc=False):
     """Return a generator that iterates over all harvard records with complete metadata.
 
     :param str path: path to directory with harvard .mrc files
+    :param int workers: number of reader processes (None: all cpus, 0: inline)
+    :param bool use_pymarc: parse with pymarc instead of the lean reader (inline)
     :return: Generator[:class:`MetaData`] (filtered for records that have ISBNs)
     """
 
-    for meta in marc21_dir_reader(path):
-        if all((meta.isbn, meta.title, meta.author)) and not isbnlib.notisbn(meta.isbn):
-            # Basic cleanup
-            try:
-                isbn = isbnlib.to_isbn13(meta.isbn)
-                title = meta.title.strip("/").strip().split(" : ")[0]
-                cleaned = MetaData(isbn, title, meta.author)
-            except Exception:
-                log.exception("Error parsing data")
-                continue
+    if workers != 0 and not use_pymarc:
+        for shard, metas in iter_sharded(shards(path), workers):
+            yield from metas
+        return
 
-            log.debug(cleaned)
+    file_reader = pymarc_file_reader if use_pymarc else marc21_file_reader
+    for meta in marc21_dir_reader(path, file_reader):
+        cleaned = clean(meta)
+        if cleaned is not None:
             yield cleaned
 
 
-def marc21_dir_reader(path=HARVARD_DATA):
+def clean(meta):
+    """Return cleaned up :class:`MetaData` or None if metadata is incomplete"""
+    if all((meta.isbn, meta.title, meta.author)) and not isbnlib.notisbn(meta.isbn):
+        # Basic cleanup
+        try:
+            isbn = isbnlib.to_isbn13(meta.isbn)
+            title = meta.title.strip("/").strip().split(" : ")[0]
+            cleaned = MetaData(isbn, title, meta.author)
+        except Exception:
+            log.exception("Error parsing data")
+            return None
+
+        log.debug(cleaned)
+        return cleaned
+    return None
+
+
+def shards(path=HARVARD_DATA, shard_size=SHARD_SIZE):
+    """Byte range shards of all .mrc files aligned to records (see readers/shards)"""
+    return [
+        shard
+        for name in sorted(os.listdir(path))
+        for shard in byte_shards(
+            "harvard", os.path.join(path, name), END_OF_RECORD, shard_size
+        )
+    ]
+
+
+def read_shard(shard, position=None):
+    """Iterate over (position, [MetaData]) per marc21 record of a shard"""
+    for position, chunk in iter_delimited(shard, END_OF_RECORD, position):
+        try:
+            meta = clean(parse_record(chunk + END_OF_RECORD))
+        except Exception as e:
+            log.error(e)
+            meta = None
+        yield position, [] if meta is None else [meta]
+
+
+def marc21_dir_reader(path=HARVARD_DATA, file_reader=None):
     """Return a generator that iterates over all harvard marc21 files in a
     directory and yields parsed MetaData objects from those files.
 
     :param str path: path to directory with harvard .mrc files
+    :param file_reader: function from file path to MetaData records
+        (default `marc21_file_reader`)
     :return: Generator[:class:`MetaData`]
     """
 
@@ -61,7 +114,7 @@ def marc21_dir_reader(path=HARVARD_DATA):
         marc21_file_path = os.path.join(path, marc21_file_name)
         log.info("Reading harvard marc21 file: {}".format(marc21_file_name))
 
-        for meta_record in marc21_file_reader(marc21_file_path):
+        for meta_record in (file_reader or marc21_file_reader)(marc21_file_path):
             yield meta_record
 
 
@@ -72,6 +125,13 @@ def marc21_file_reader(file_path):
     :return: Generator[:class:`MetaData`]
     """
 
+    return iter_file(file_path)
+
+
+def pymarc_file_reader(file_path):
+    """Like `marc21_file_reader` but with pymarc (for validation)."""
+    from pymarc import MARCReader
+
     with open(file_path, "rb") as mf:
 
         reader = MARCReader(mf, utf8_handling="ignore")
@@ -79,7 +139,10 @@ def marc21_file_reader(file_path):
         while True:
             try:
                 record = next(reader)
-                yield MetaData(record.isbn(), record.title(), record.author())
+                if record is None:  # pymarc >= 4 returns None for bad records
+                    log.error(reader.current_exception)
+                    continue
+                yield record_meta(record)
             except UnicodeDecodeError as e:
                 log.error(e)
                 continue
@@ -87,6 +150,21 @@ def marc21_file_reader(file_path):
                 break
 
 
+def test_harvard():
+    import tempfile
+    from iscc_bench.readers.marc21 import sample_records
+
+    records = sample_records(3000)
+    with tempfile.TemporaryDirectory() as tmp:
+        for part in range(3):
+            with open(os.path.join(tmp, f"part{part}.mrc"), "wb") as outfile:
+                outfile.write(b"".join(records[part::3]))
+        expected = list(harvard(tmp, use_pymarc=True))
+        assert len(expected) > 500
+        assert list(harvard(tmp)) == expected
+        assert sorted(harvard(tmp, workers=1)) == sorted(expected)
+
+
 if __name__ == "__main__":
     """Demo usage."""
 
@@ -15,6 +15,7 @@ import csv
 import logging
 import isbnlib
 from iscc_bench import DATA_DIR, MetaData
+from iscc_bench.readers.shards import SHARD_SIZE, byte_shards, iter_delimited
 
 
 log = logging.getLogger(__name__)
@@ -28,21 +29,41 @@ def libgen(path=LIBGEN_DATA):
     with open(path, "r", encoding="utf-8") as infile:
         reader = csv.reader(infile, delimiter=",")
         for row in reader:
+            meta = parse_row(row)
+            if meta is not None:
+                yield meta
 
-            title, creators, isbns = row[1].strip(), row[5].strip(), row[16].strip()
 
-            if not all((title, creators, isbns)):
-                log.info("Skip incomplete record {}".format(row[0]))
-                continue
+def parse_row(row):
+    """Return :class:`MetaData` of a libgen csv row or None for incomplete rows"""
 
-            title = title.split(" : ")[0]
-            creators = ";".join(creators.split(","))
+    title, creators, isbns = row[1].strip(), row[5].strip(), row[16].strip()
 
-            for s in isbns.split(","):
-                if not isbnlib.notisbn(s.strip()):
-                    isbn = isbnlib.to_isbn13(s.strip())
-                    yield MetaData(isbn, title, creators)
-                    break
+    if not all((title, creators, isbns)):
+        log.info("Skip incomplete record {}".format(row[0]))
+        return None
+
+    title = title.split(" : ")[0]
+    creators = ";".join(creators.split(","))
+
+    for s in isbns.split(","):
+        if not isbnlib.notisbn(s.strip()):
+            isbn = isbnlib.to_isbn13(s.strip())
+            return MetaData(isbn, title, creators)
+    return None
+
+
+def shards(path=LIBGEN_DATA, shard_size=SHARD_SIZE):
+    """Byte range shards aligned to lines (see readers/shards)"""
+    return byte_shards("libgen", path, b"\n", shard_size)
+
+
+def read_shard(shard, position=None):
+    """Iterate over (position, [MetaData]) per csv line of a shard"""
+    for position, line in iter_delimited(shard, b"\n", position):
+        row = next(csv.reader([line.decode("utf-8")], delimiter=","), None)
+        meta = parse_row(row) if row else None
+        yield position, [] if meta is None else [meta]
 
 
 if __name__ == "__main__":
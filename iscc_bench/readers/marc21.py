@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""Lean MARC21 reader for isbn, title and author.
+
+Instead of building a pymarc `Record` with every field, `parse_record` reads
+the leader and directory and decodes only the subfields of the first 020, 245
+and 100/110/111 fields. Results are the same as pymarc's `isbn`, `title` and
+`author` of `Record(data, utf8_handling="ignore")`: records that are not utf-8
+(MARC-8) or that pymarc could reject for other fields are handed to pymarc.
+
+`iter_file` reads records from a memory-mapped file by their length prefix and
+stops at the same errors as `pymarc.MARCReader`.
+
+Results for 20000 synthetic records with 5 - 30 fields (2% MARC-8):
+
+pymarc : 12749 records/s
+lean   : 44859 records/s
+"""
+import logging
+import mmap
+import re
+import time
+
+from iscc_bench import MetaData
+
+log = logging.getLogger(__name__)
+
+END_OF_RECORD = b"\x1d"
+SUBFIELD_INDICATOR = b"\x1f"
+ISBN_REGEX = re.compile(r"([0-9\-xX]+)")
+WANTED = (b"020", b"245", b"100", b"110", b"111")
+
+
+class _Fallback(Exception):
+    """Record needs the full pymarc decoder"""
+
+
+def pymarc_meta(data):
+    """:class:`MetaData` of a raw record decoded by pymarc (raises like pymarc)"""
+    from pymarc import Record
+
+    return record_meta(Record(data, utf8_handling="ignore"))
+
+
+def record_meta(record):
+    """:class:`MetaData` of a pymarc record (accessors are properties in pymarc 5)"""
+    values = (record.isbn, record.title, record.author)
+    return MetaData(*(v() if callable(v) else v for v in values))
+
+
+def parse_record(data):
+    """Return :class:`MetaData` (raw isbn, title, author) of a marc21 record.
+
+    :param bytes data: record in transmission format (with record terminator)
+    """
+    try:
+        return _parse_record(data)
+    except _Fallback:
+        return pymarc_meta(data)
+
+
+def _parse_record(data):
+    leader = data[:24]
+    if len(leader) != 24 or leader[9:10] != b"a" or not leader.isascii():
+        raise _Fallback
+    base = int(data[12:17])
+    if base <= 0 or base >= len(data) or len(data) < int(leader[:5]):
+        raise _Fallback
+    directory = data[24 : base - 1]
+    if not directory or len(directory) % 12 or not directory.isascii():
+        raise _Fallback
+    # non-ascii bytes may fail pymarc's strict decoding of other fields
+    check = not data.isascii()
+    fields = {}
+    for i in range(0, len(directory), 12):
+        tag = directory[i : i + 3]
+        start = base + int(directory[i + 7 : i + 12])
+        field = data[start : start + int(directory[i + 3 : i + 7]) - 1]
+        if tag in WANTED and tag not in fields:
+            fields[tag] = _subfields(field)
+        elif check:
+            if tag < b"010" and tag.isdigit():
+                field.decode("utf-8")
+            elif not field.split(SUBFIELD_INDICATOR, 1)[0].isascii():
+                raise _Fallback
+
+    isbn = None
+    if b"020" in fields:
+        number = _first(fields[b"020"], "a")
+        match = ISBN_REGEX.search(number) if number else None
+        if match:
+            isbn = match.group(1).replace("-", "")
+
+    title = None
+    if b"245" in fields:
+        title = _first(fields[b"245"], "a")
+        if title:
+            subtitle = _first(fields[b"245"], "b")
+            if subtitle:
+                title += f" {subtitle}"
+
+    author = None
+    for tag in (b"100", b"110", b"111"):
+        if tag in fields:
+            author = "".join(f" {v}" for c, v in fields[tag] if c != "6").strip()
+            break
+    return MetaData(isbn, title, author)
+
+
+def _subfields(field):
+    """[(code, value), ...] of a data field"""
+    subs = field.split(SUBFIELD_INDICATOR)
+    if not subs[0].isascii():
+        raise _Fallback
+    subfields = []
+    for sub in subs[1:]:
+        if not sub:
+            continue
+        if sub[0] >= 0x80:
+            raise _Fallback
+        subfields.append((chr(sub[0]), sub[1:].decode("utf-8", "ignore")))
+    return subfields
+
+
+def _first(subfields, code):
+    for c, value in subfields:
+        if c == code:
+            return value
+    return None
+
+
+def iter_records(buffer):
+    """Iterate over raw records of a buffer by their length prefix.
+
+    Stops (with an error log) where `pymarc.MARCReader` raises a fatal error.
+    """
+    pos, size = 0, len(buffer)
+    while pos < size:
+        first5 = buffer[pos : pos + 5]
+        try:
+            length = int(first5)
+        except ValueError:
+            log.error("Invalid record length {!r} at {}".format(first5, pos))
+            return
+        record = buffer[pos : pos + max(length, 5)]
+        if len(record) < length or len(first5) < 5:
+            log.error("Truncated record at {}".format(pos))
+            return
+        if record[-1:] != END_OF_RECORD:
+            log.error("End of record not found at {}".format(pos))
+            return
+        pos += len(record)
+        yield record
+
+
+def iter_file(file_path):
+    """Iterate over raw :class:`MetaData` of a memory-mapped marc21 file."""
+    with open(file_path, "rb") as infile:
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            for record in iter_records(buffer):
+                try:
+                    yield parse_record(record)
+                except Exception as e:
+                    log.error(e)
+
+
+def sample_records(n=1000, seed=25):
+    """Synthetic raw marc21 records with edge cases for isbn, title and author"""
+    import random
+    from pymarc import Field, Record, Subfield
+
+    rand = random.Random(seed)
+    isbns = ["978-0-306-40615-7 (pbk.)", "0306406152", "", "(invalid)", "03064X"]
+    words = ["Über", "die", "Ökonomie", "李白", "Title", "of", "Ørsted", "naïve"]
+    records = []
+    for i in range(n):
+        marc8 = rand.random() < 0.02
+        record = Record(to_unicode=not marc8)
+        for tag in ("001", "005", "008"):
+            record.add_field(Field(tag, data=f"{tag}-{i}"))
+        if rand.random() > 0.1:
+            code = rand.choice("aaaz")
+            isbn = Subfield(code, rand.choice(isbns))
+            record.add_field(Field("020", subfields=[isbn]))
+        title = [Subfield("a", " ".join(rand.sample(words, 3)) + " :")]
+        if rand.random() > 0.5:
+            title.append(Subfield("b", rand.choice(words)))
+        if rand.random() > 0.05:
+            record.add_field(Field("245", ["1", "0"], title))
+        author = rand.choice(["100", "110", "111", "700"])
+        record.add_field(
+            Field(
+                author,
+                ["1", " "],
+                [
+                    Subfield("6", "880-01"),
+                    Subfield("a", rand.choice(words) + ","),
+                    Subfield("d", "1900-"),
+                ],
+            )
+        )
+        for tag in range(500, 500 + rand.randint(0, 25)):
+            note = [Subfield("a", rand.choice(words))]
+            record.add_field(Field(str(tag), subfields=note))
+        if marc8:
+            # MARC-8 records (ascii only here)
+            for field in record.fields:
+                if not field.control_field:
+                    field.subfields = [
+                        Subfield(s.code, s.value.encode("ascii", "ignore").decode())
+                        for s in field.subfields
+                    ]
+        records.append(record.as_marc())
+    return records
+
+
+def test_parse_record():
+    import os
+    import tempfile
+
+    records = sample_records()
+    broken = [
+        records[0][:12] + b"99999" + records[0][17:],  # invalid base address
+        records[1].replace(b"\x1f", b"\x1f\xff", 1),  # non-ascii subfield code
+        records[2][:24] + b"\xff" + records[2][25:],  # non-ascii directory
+    ]
+    for data in records + broken:
+        try:
+            expected = pymarc_meta(data)
+        except Exception:
+            expected = Exception
+        try:
+            meta = parse_record(data)
+        except Exception:
+            meta = Exception
+        assert meta == expected, (meta, expected)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sample.mrc")
+        with open(path, "wb") as outfile:
+            outfile.write(b"".join(records) + records[0][:100])
+        assert len(list(iter_file(path))) == len(records)
+
+
+def benchmark_marc21(n=20000):
+    records = sample_records(n)
+    for name, func in (("pymarc", pymarc_meta), ("lean", parse_record)):
+        start = time.time()
+        for data in records:
+            func(data)
+        print(f"{name:<6} : {n / (time.time() - start):.0f} records/s")
+
+
+if __name__ == "__main__":
+    test_parse_record()
+    benchmark_marc21()
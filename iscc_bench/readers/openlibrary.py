@@ -15,21 +15,41 @@ Instructions:
     ./data/ol_dump_editions.txt.gz
 
 Notes:
-    First run will automatically index authors.
+    First run will automatically index authors into a compact memory-mapped
+    `StringIndex` (see readers/strindex).
 
     There is also a `ol_dump_works_latest.txt.gz` file available that
     that might be usefull for futher research. It contains abstract
     works without isbns. Some editions link to these works.
+
+    `openlibrary_parallel` splits decompression (reader thread, isal/pigz if
+    available) from parsing (process pool, orjson if available). Parsing only
+    touches the title, isbn and author fields and looks up the authors of a
+    whole batch with one `StringIndex.get_many` call.
+
+Results for 200000 synthetic editions (1 cpu, zlib, orjson):
+
+openlibrary                           :  25821 records/s
+openlibrary_parallel workers=0        :  43402 records/s
+openlibrary_parallel workers=1        :  37916 records/s
+openlibrary_parallel workers=1 (fast) :  38351 records/s
 """
 import os
 import gzip
 import json
 import logging
+import shutil
+import subprocess
+import time
+from contextlib import contextmanager
+from functools import lru_cache, partial
 
 import isbnlib
-from sqlitedict import SqliteDict
 
 from iscc_bench import DATA_DIR, MetaData
+from iscc_bench.pipeline import PipelineStats, batch_pipeline
+from iscc_bench.readers.shards import gzip_shards, iter_gzip_lines
+from iscc_bench.readers.strindex import StringIndex, build_string_index
 
 
 log = logging.getLogger(__name__)
@@ -37,19 +57,19 @@ log = logging.getLogger(__name__)
 
 DATA_FILE = os.path.join(DATA_DIR, "ol_dump_editions.txt.gz")
 DATA_FILE_AUTHORS = os.path.join(DATA_DIR, "ol_dump_authors.txt.gz")
-INDEX_FILE_AUTHORS = os.path.join(DATA_DIR, "ol_dump_authors.sqlite")
+INDEX_FILE_AUTHORS = os.path.join(DATA_DIR, "ol_dump_authors.idx")
 
 
-def openlibrary(path=DATA_FILE):
+def openlibrary(path=DATA_FILE, index_file=INDEX_FILE_AUTHORS):
     """Return a generator that iterates over all open library that have ISBN data.
 
     :param str path: path to directory with ol_dump_editions.txt.gz file
+    :param str index_file: path to author index directory
     :return: Generator[:class:`MetaData`] (filtered for records that have ISBNs)
     """
 
     skipped = 0
-    authors = get_or_build_author_index(INDEX_FILE_AUTHORS)
-    get_author_name = lambda ar: authors.get(ar["key"].split("/")[-1], "").strip()
+    authors = get_or_build_author_index(index_file)
 
     for line in iter_gz_lines(path, filter="isbn"):
         data = json.loads(line.split("\t")[4])
@@ -62,7 +82,8 @@ def openlibrary(path=DATA_FILE):
                 skipped += 1
                 continue
 
-            author = ";".join([get_author_name(ar) for ar in data.get("authors", [])])
+            author_keys = [ar["key"].split("/")[-1] for ar in data.get("authors", [])]
+            author = ";".join(authors.get_many(author_keys, ""))
 
             if not author.strip():
                 log.debug("Skip entry (no author): {}".format(data))
@@ -78,32 +99,170 @@ def openlibrary(path=DATA_FILE):
     log.info("Openlibrary skipped {} entries.".format(skipped))
 
 
+def openlibrary_parallel(
+    path=DATA_FILE,
+    workers=None,
+    batch_size=5000,
+    ordered=True,
+    stats=None,
+    index_file=INDEX_FILE_AUTHORS,
+):
+    """Like `openlibrary` but with parsing spread across a process pool.
+
+    :param str path: path to ol_dump_editions.txt.gz file
+    :param int workers: number of parser processes (None: all cpus, 0: inline)
+    :param int batch_size: lines per parser batch
+    :param bool ordered: yield in file order (False: as batches complete)
+    :param PipelineStats stats: optional stage statistics (records are lines)
+    :param str index_file: path to author index directory
+    :return: Generator[:class:`MetaData`] (filtered for records that have ISBNs)
+    """
+    get_or_build_author_index(index_file).close()
+    stats = PipelineStats() if stats is None else stats
+    func = partial(parse_editions, index_file=index_file)
+    lines = iter_gz_raw_lines(path, filter=b"isbn")
+    skipped = records = 0
+    start = time.perf_counter()
+    for metas in batch_pipeline(
+        lines, func, workers, batch_size, stats=stats, ordered=ordered
+    ):
+        if metas is None:
+            skipped += 1
+            continue
+        records += len(metas)
+        yield from metas
+    seconds = time.perf_counter() - start
+    log.info("Openlibrary skipped {} entries.".format(skipped))
+    log.info(
+        "Openlibrary read {:,} records ({:.0f} records/s)".format(
+            records, records / seconds if seconds else 0.0
+        )
+    )
+
+
+def shards(path=DATA_FILE, shard_size=None, index_file=INDEX_FILE_AUTHORS):
+    """One shard per gzip member (see readers/shards), shard_size is not used"""
+    return gzip_shards("openlibrary", path, index=index_file)
+
+
+def read_shard(shard, position=None, batch_size=1000, workers=None):
+    """Iterate over (position, [MetaData, ...]) per dump line of a shard.
+
+    The official dumps are a single gzip member and thus a single shard. Such a
+    shard is decompressed in a reader thread and parsed by `workers` processes
+    (None: all cpus) like `openlibrary_parallel`, shards of multi member dumps
+    are parsed inline.
+    """
+    index_file = shard.index or INDEX_FILE_AUTHORS
+    get_or_build_author_index(index_file).close()
+    if shard.start != 0 or shard.end != os.path.getsize(shard.path):
+        workers = 0
+    func = partial(_parse_positioned, index_file=index_file)
+    lines = iter_gzip_lines(shard, position)
+    yield from batch_pipeline(lines, func, workers, batch_size)
+
+
+def _parse_positioned(batch, index_file):
+    """(position, [MetaData, ...]) of a batch of (position, line)"""
+    lines = [line for position, line in batch if b"isbn" in line]
+    parsed = iter(parse_editions(lines, index_file))
+    return [
+        (position, (next(parsed) if b"isbn" in line else None) or [])
+        for position, line in batch
+    ]
+
+
+@lru_cache(maxsize=None)
+def json_loads():
+    """Fastest available json parser (orjson if installed)"""
+    try:
+        from orjson import loads
+    except ImportError:
+        from json import loads
+    return loads
+
+
+@lru_cache(maxsize=4)
+def _author_index(index_file):
+    # opened once per worker process, the mmap is shared by the page cache
+    return StringIndex(index_file)
+
+
+def parse_editions(lines, index_file=INDEX_FILE_AUTHORS):
+    """Parse a batch of raw editions dump lines.
+
+    :param list lines: undecoded dump lines
+    :param str index_file: path to author index directory
+    :return: per line a list of :class:`MetaData` or None for skipped entries
+    """
+    loads = json_loads()
+    parsed, keys = [], []
+    for line in lines:
+        data = loads(line.split(b"\t", 4)[4])
+        raw_isbns = data.get("isbn_13") or data.get("isbn_10")
+        if not raw_isbns:
+            parsed.append(())
+            continue
+        title = data.get("title")
+        if title is None:
+            log.debug("Skip entry (no title): {}".format(data))
+            parsed.append(None)
+            continue
+        author_keys = [ar["key"].split("/")[-1] for ar in data.get("authors", [])]
+        parsed.append((title.split(" : ")[0], raw_isbns, len(author_keys), data))
+        keys.extend(author_keys)
+
+    names = iter(_author_index(index_file).get_many(keys, ""))
+    results = []
+    for entry in parsed:
+        if not entry:
+            results.append(entry if entry is None else [])
+            continue
+        title, raw_isbns, n_authors, data = entry
+        author = ";".join([next(names) for _ in range(n_authors)])
+        if not author.strip():
+            log.debug("Skip entry (no author): {}".format(data))
+            results.append(None)
+            continue
+        results.append(
+            [
+                MetaData(isbnlib.to_isbn13(isbn), title, author)
+                for isbn in raw_isbns
+                if not isbnlib.notisbn(isbn)
+            ]
+        )
+    return results
+
+
 def get_or_build_author_index(index_file=INDEX_FILE_AUTHORS):
     """Return a dict like object that maps openlibrary author_ids to author names.
 
-    :param str index_file: path to persistent index file (sqlite)
-    :return: SqliteDict
+    :param str index_file: path to persistent index directory
+    :return: StringIndex
     """
     return (
-        SqliteDict(index_file, flag="r")
-        if os.path.exists(INDEX_FILE_AUTHORS)
-        else index_authors()
+        StringIndex(index_file)
+        if os.path.exists(index_file)
+        else index_authors(index_file=index_file)
     )
 
 
 def index_authors(data_file=DATA_FILE_AUTHORS, index_file=INDEX_FILE_AUTHORS):
-    """Index author data from ol_dump_authors.txt.gz into a sqlite database.
+    """Index author data from ol_dump_authors.txt.gz into a `StringIndex`.
 
     :param str data_file: path to open library authors dump file
-    :param str index_file: path to sqlite index file
-    :return SqliteDict: dict like object that maps openlibrary author_ids to author names
+    :param str index_file: path to index directory
+    :return StringIndex: dict like object that maps openlibrary author_ids to author names
     """
-
-    indexed = 0
-    authors_idx = SqliteDict(index_file, autocommit=False)
-
     log.info("Indexing authors (~6 Million)")
+    authors_idx = build_string_index(iter_authors(data_file), index_file)
+    log.info("Indexed {:,} authors".format(len(authors_idx)))
+    return authors_idx
 
+
+def iter_authors(data_file=DATA_FILE_AUTHORS):
+    """Iterate over (author_id, author name) pairs of the authors dump file."""
+    indexed = 0
     for line in iter_gz_lines(data_file):
 
         data = json.loads(line.split("\t")[4])
@@ -119,17 +278,12 @@ def index_authors(data_file=DATA_FILE_AUTHORS, index_file=INDEX_FILE_AUTHORS):
             log.debug("No author name: {}".format(data))
             continue
 
-        authors_idx[key] = author_name.strip()
+        yield key, author_name.strip()
 
         indexed += 1
         if not indexed % 1000000:
             log.info("Indexed {:,} authors".format(indexed))
 
-    authors_idx.commit()
-    log.info("Indexed {:,} authors".format(len(authors_idx)))
-
-    return authors_idx
-
 
 def iter_gz_lines(path=DATA_FILE, encoding="utf-8", filter=None):
     """Iterate over lines from .gz compressed textfile.
@@ -145,6 +299,54 @@ def iter_gz_lines(path=DATA_FILE, encoding="utf-8", filter=None):
                 yield line
 
 
+@contextmanager
+def open_gz(path):
+    """Open a .gz file for binary reading with the fastest available decompressor.
+
+    Prefers isal (igzip), then a `pigz -dc` subprocess and falls back to zlib.
+    """
+    try:
+        from isal import igzip
+    except ImportError:
+        igzip = None
+    pigz = shutil.which("pigz")
+    if igzip is not None:
+        with igzip.open(path, "rb") as gzfile:
+            yield gzfile
+    elif pigz:
+        proc = subprocess.Popen([pigz, "-dc", path], stdout=subprocess.PIPE)
+        try:
+            yield proc.stdout
+        finally:
+            proc.stdout.close()
+            code = proc.wait()
+        # negative codes are signals (SIGPIPE if we stopped reading early)
+        if code > 0:
+            raise OSError("pigz failed to decompress {} ({})".format(path, code))
+    else:
+        with gzip.open(path, "rb") as gzfile:
+            yield gzfile
+
+
+def iter_gz_raw_lines(path=DATA_FILE, filter=None, block_size=1 << 22):
+    """Iterate over undecoded lines of a .gz file, decompressed in large blocks.
+
+    :param bytes filter: Only yield lines that contain these bytes
+    :return: Generator[bytes] (without line endings)
+    """
+    with open_gz(path) as gzfile:
+        tail = b""
+        for block in iter(partial(gzfile.read, block_size), b""):
+            lines = (tail + block).split(b"\n")
+            tail = lines.pop()
+            if filter:
+                yield from (line for line in lines if filter in line)
+            else:
+                yield from lines
+        if tail and (not filter or filter in tail):
+            yield tail
+
+
 def count_records():
     """Count the number of records in data file."""
     with gzip.open(DATA_FILE) as f:
@@ -153,6 +355,88 @@ def count_records():
     return i + 1
 
 
+def write_sample_dump(path, index_file, n=1000, seed=21):
+    """Write a synthetic editions dump and author index for tests and benchmarks"""
+    import random
+
+    rand = random.Random(seed)
+    names = ["Müller, Hans", "Smith, John", "Dostoevsky, Fyodor", "李白", " "]
+    build_string_index(
+        ((f"OL{i}A", rand.choice(names)) for i in range(100)), index_file
+    ).close()
+    with gzip.open(path, "wt", encoding="utf-8") as outfile:
+        for i in range(n):
+            data = {"key": f"/books/OL{i}M", "title": f"Title {i} : Subtitle"}
+            kind = rand.random()
+            if kind < 0.05:
+                del data["title"]
+            if kind < 0.1 or kind > 0.2:
+                digits = f"978{rand.randint(0, 10**9 - 1):09d}"
+                check = -sum(int(d) * (3 if j % 2 else 1) for j, d in enumerate(digits))
+                data["isbn_13"] = [digits + str(check % 10)]
+            else:
+                data["isbn_10"] = ["0306406152", "invalid"]
+            data["authors"] = [
+                {"key": f"/authors/OL{rand.randint(0, 120)}A"}
+                for _ in range(rand.randint(0, 3))
+            ]
+            outfile.write(
+                f"/type/edition\t/books/OL{i}M\t1\t2010\t{json.dumps(data)}\n"
+            )
+        # last line without newline and title
+        outfile.write('/type/edition\t/books/OLxM\t1\t2010\t{"isbn_10": ["x"]}')
+
+
+def test_openlibrary_parallel():
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "editions.txt.gz")
+        index_file = os.path.join(tmp, "authors.idx")
+        write_sample_dump(path, index_file, n=3000)
+        expected = list(openlibrary(path, index_file))
+        assert len(expected) > 1000
+        for workers in (0, 1):
+            kwargs = dict(workers=workers, batch_size=100, index_file=index_file)
+            assert list(openlibrary_parallel(path, **kwargs)) == expected
+            fast = openlibrary_parallel(path, ordered=False, **kwargs)
+            assert sorted(fast) == sorted(expected)
+        # a single member dump is one shard, parsed by a process pool
+        (shard,) = shards(path, index_file=index_file)
+        items = list(read_shard(shard, batch_size=100, workers=1))
+        assert [m for position, metas in items for m in metas] == expected
+        position = items[len(items) // 2][0]
+        resumed = read_shard(shard, position, batch_size=100, workers=1)
+        assert [p for p, metas in resumed] == [p for p, m in items if p > position]
+
+
+def benchmark_parallel(n=200000, workers=None):
+    """Records/s of the sequential and parallel readers on a synthetic dump"""
+    import tempfile
+
+    workers = os.cpu_count() if workers is None else workers
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "editions.txt.gz")
+        index_file = os.path.join(tmp, "authors.idx")
+        write_sample_dump(path, index_file, n=n)
+        readers = [("openlibrary", partial(openlibrary, path, index_file))]
+        for w, ordered in ((0, True), (workers, True), (workers, False)):
+            name = f"openlibrary_parallel workers={w}" + ("" if ordered else " (fast)")
+            func = partial(
+                openlibrary_parallel,
+                path,
+                workers=w,
+                ordered=ordered,
+                index_file=index_file,
+            )
+            readers.append((name, func))
+        for name, func in readers:
+            start = time.perf_counter()
+            records = sum(1 for _ in func())
+            seconds = time.perf_counter() - start
+            print(f"{name:<38}: {records / seconds:6.0f} records/s")
+
+
 if __name__ == "__main__":
     # log_format = '%(asctime)s - %(levelname)s - %(message)s'
     # logging.basicConfig(level=logging.DEBUG, format=log_format)
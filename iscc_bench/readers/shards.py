@@ -0,0 +1,463 @@
+# -*- coding: utf-8 -*-
+"""Sharded, resumable and parallel reading of the metadata readers.
+
+A reader module supports sharding with two functions:
+
+shards(path)                : list of `Shard` (independent slices of the source)
+read_shard(shard, position) : Generator[(position, [MetaData, ...])] per record
+
+Everything a worker needs travels with the `Shard` (including the author index
+of openlibrary and dnbrdf), so workers do not depend on module globals of the
+parent process.
+
+`position` is the resume point after a record. It is an absolute byte offset
+for plain files, the decompressed byte offset within a gzip member, or a record
+count for sources that can only be skipped forward.
+
+Shards per reader:
+
+bxbooks, libgen : byte ranges aligned to newlines (records without raw newlines)
+harvard         : byte ranges of the .mrc files aligned to record terminators
+openlibrary     : gzip members (a single member dump is one shard that is
+                  parsed by its own process pool, see openlibrary.read_shard)
+dnbrdf          : one shard per file (one streaming xml parse, a single core)
+
+`iter_sharded` reads shards in a process pool and streams chunks of records to
+the consumer. The position of a chunk is committed to the `Checkpoint` when the
+consumer asks for the next chunk, so delivery is at-least-once: after a crash
+the records after the last saved position are read again. Consumer state that
+must match the positions (e.g. the size of an output file) is staged with
+`Checkpoint.stage` and saved with the next commit.
+
+Usage:
+
+    checkpoint = Checkpoint("libgen.ckpt")
+    for shard, metas in iter_sharded(reader_shards([libgen]), checkpoint=checkpoint):
+        write(metas)
+    checkpoint.save()
+"""
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import time
+import zlib
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from importlib import import_module
+
+from iscc_bench.utils import READ_SIZE
+
+log = logging.getLogger(__name__)
+
+SHARD_SIZE = 1 << 26
+
+# index: author index path of readers that need one (openlibrary, dnbrdf)
+Shard = namedtuple("Shard", "source path start end index", defaults=(None,))
+
+
+def reader_module(source):
+    """Module of a reader (by name or reader function)"""
+    from iscc_bench import readers
+
+    name = source if isinstance(source, str) else source.__name__
+    return import_module(getattr(readers, name).__module__)
+
+
+def reader_shards(readers):
+    """Shards of the default data files of readers (names or functions)"""
+    return [shard for reader in readers for shard in reader_module(reader).shards()]
+
+
+def read_shard(shard, position=None):
+    """Iterate over (position, [MetaData, ...]) per record of a shard"""
+    return reader_module(shard.source).read_shard(shard, position)
+
+
+def byte_shards(source, path, delimiter=b"\n", shard_size=SHARD_SIZE, start=0):
+    """Split a file into byte ranges that end right after a delimiter.
+
+    :param str source: reader name
+    :param str path: file path
+    :param bytes delimiter: record delimiter
+    :param int shard_size: approximate bytes per shard
+    :param int start: offset of the first record (e.g. after a header)
+    :return: list of :class:`Shard`
+    """
+    size = os.path.getsize(path)
+    bounds = [start]
+    with open(path, "rb") as infile:
+        while bounds[-1] + shard_size < size:
+            infile.seek(bounds[-1] + shard_size - 1)
+            end = _after_delimiter(infile, delimiter)
+            if end is None or end >= size:
+                break
+            bounds.append(end)
+    if bounds[-1] < size:
+        bounds.append(size)
+    return [Shard(source, path, a, b) for a, b in zip(bounds, bounds[1:])]
+
+
+def _after_delimiter(infile, delimiter):
+    offset = infile.tell()
+    for block in iter(lambda: infile.read(1 << 16), b""):
+        i = block.find(delimiter)
+        if i >= 0:
+            return offset + i + len(delimiter)
+        offset += len(block)
+    return None
+
+
+def iter_delimited(shard, delimiter=b"\n", position=None):
+    """Iterate over (position, record) of a byte range shard.
+
+    :param Shard shard: byte range shard (see `byte_shards`)
+    :param bytes delimiter: record delimiter (not included in the records)
+    :param int position: resume from this byte offset
+    :return: Generator[(int, bytes)]
+    """
+    offset = shard.start if position is None else position
+    with open(shard.path, "rb") as infile:
+        infile.seek(offset)
+        remaining = shard.end - offset
+        tail = b""
+        while remaining > 0:
+            block = infile.read(min(READ_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            records = (tail + block).split(delimiter)
+            tail = records.pop()
+            for record in records:
+                offset += len(record) + len(delimiter)
+                yield offset, record
+        if tail:
+            yield offset + len(tail), tail
+
+
+def gzip_shards(source, path, index=None):
+    """One shard per gzip member.
+
+    Finding member boundaries takes one decompression pass, the offsets are
+    cached next to the file (`<path>.members`).
+    """
+    cache = path + ".members"
+    stat = os.stat(path)
+    key = [stat.st_size, stat.st_mtime]
+    offsets = None
+    if os.path.exists(cache):
+        with open(cache) as infile:
+            data = json.load(infile)
+        if data["key"] == key:
+            offsets = data["offsets"]
+    if offsets is None:
+        offsets = gzip_members(path)
+        with open(cache, "w") as outfile:
+            json.dump(dict(key=key, offsets=offsets), outfile)
+    return [Shard(source, path, a, b, index) for a, b in zip(offsets, offsets[1:])]
+
+
+def gzip_members(path):
+    """Byte offsets of the gzip members of a file (and the end of the last one)"""
+    offsets = [0]
+    offset = 0
+    decomp = zlib.decompressobj(31)
+    with open(path, "rb") as infile:
+        for block in iter(lambda: infile.read(READ_SIZE), b""):
+            while block:
+                decomp.decompress(block)
+                if not decomp.eof:
+                    offset += len(block)
+                    break
+                offset += len(block) - len(decomp.unused_data)
+                offsets.append(offset)
+                block = decomp.unused_data
+                decomp = zlib.decompressobj(31)
+    return offsets
+
+
+def iter_gzip_lines(shard, position=None):
+    """Iterate over (position, line) of a gzip member shard.
+
+    Positions are decompressed byte offsets within the member, resuming has to
+    decompress (but not parse) the skipped lines.
+    """
+    skip = position or 0
+    offset = 0
+    decomp = zlib.decompressobj(31)
+    tail = b""
+    with open(shard.path, "rb") as infile:
+        infile.seek(shard.start)
+        remaining = shard.end - shard.start
+        while remaining > 0 and not decomp.eof:
+            block = infile.read(min(READ_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            data = decomp.decompress(block)
+            if skip:
+                cut = min(skip, len(data))
+                data, skip, offset = data[cut:], skip - cut, offset + cut
+            lines = (tail + data).split(b"\n")
+            tail = lines.pop()
+            for line in lines:
+                offset += len(line) + 1
+                yield offset, line
+    if tail:
+        yield offset + len(tail), tail
+
+
+def iter_skip(records, position=None):
+    """Iterate over (position, item) with position as a record count"""
+    for n, item in enumerate(records, 1):
+        if position is None or n > position:
+            yield n, item
+
+
+class Checkpoint:
+    """Resume positions of shards and consumer state, saved as json (None: in
+    memory only)"""
+
+    def __init__(self, path=None, interval=10.0):
+        self.path = path
+        self.interval = interval
+        self.positions = {}
+        self.done = set()
+        self.state = {}
+        self._staged = {}
+        if path and os.path.exists(path):
+            with open(path) as infile:
+                data = json.load(infile)
+            self.positions, self.done = data["positions"], set(data["done"])
+            self.state = data.get("state", {})
+        self.saved = time.time()
+
+    @staticmethod
+    def key(shard):
+        return "{}:{}:{}-{}".format(*shard)
+
+    def position(self, shard):
+        return self.positions.get(self.key(shard))
+
+    def is_done(self, shard):
+        return self.key(shard) in self.done
+
+    def stage(self, key, value):
+        """Set consumer state that becomes part of `state` with the next commit"""
+        self._staged[key] = value
+
+    def commit(self, shard, position):
+        if position is not None:
+            self.positions[self.key(shard)] = position
+        self.state.update(self._staged)
+        self._staged.clear()
+        self._autosave()
+
+    def finish(self, shard):
+        key = self.key(shard)
+        self.done.add(key)
+        self.positions.pop(key, None)
+        self._autosave()
+
+    def _autosave(self):
+        if time.time() - self.saved >= self.interval:
+            self.save()
+
+    def save(self):
+        self.saved = time.time()
+        if not self.path:
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as outfile:
+            data = dict(positions=self.positions, done=sorted(self.done))
+            json.dump(dict(data, state=self.state), outfile)
+        os.replace(tmp, self.path)
+
+
+def _read_chunks(shard, position, chunk_size):
+    """(position, metas) chunks of up to chunk_size records of a shard"""
+    metas, records = [], 0
+    for position, record_metas in read_shard(shard, position):
+        metas.extend(record_metas)
+        records += 1
+        if records >= chunk_size:
+            yield position, metas
+            metas, records = [], 0
+    if records:
+        yield position, metas
+
+
+_chunks = None
+_stop = None
+
+
+def _init_worker(chunks, stop):
+    global _chunks, _stop
+    _chunks, _stop = chunks, stop
+
+
+def _shard_worker(shard, position, chunk_size):
+    for position, metas in _read_chunks(shard, position, chunk_size):
+        if _stop.is_set():
+            return
+        _chunks.put((shard, position, metas, False))
+    _chunks.put((shard, None, [], True))
+
+
+def iter_sharded(
+    shards, workers=None, checkpoint=None, chunk_size=1000, max_pending=None
+):
+    """Read shards in a process pool and yield (shard, [MetaData, ...]) chunks.
+
+    Chunks of a shard are yielded in order, chunks of different shards
+    interleave. Finished shards and positions come from / go to `checkpoint`.
+
+    :param shards: list of :class:`Shard` (see `reader_shards`)
+    :param int workers: number of worker processes (None: all cpus, 0: inline)
+    :param Checkpoint checkpoint: resume state (updated while consuming)
+    :param int chunk_size: records per chunk
+    :param int max_pending: chunks buffered between workers and the consumer
+    """
+    checkpoint = Checkpoint() if checkpoint is None else checkpoint
+    todo = [s for s in shards if not checkpoint.is_done(s)]
+    workers = os.cpu_count() if workers is None else workers
+    if not workers:
+        for shard in todo:
+            for position, metas in _read_chunks(
+                shard, checkpoint.position(shard), chunk_size
+            ):
+                yield shard, metas
+                checkpoint.commit(shard, position)
+            checkpoint.finish(shard)
+        checkpoint.save()
+        return
+
+    chunks = multiprocessing.Queue(max_pending or 2 * workers)
+    stop = multiprocessing.Event()
+    with ProcessPoolExecutor(
+        workers, initializer=_init_worker, initargs=(chunks, stop)
+    ) as pool:
+        futures = [
+            pool.submit(_shard_worker, s, checkpoint.position(s), chunk_size)
+            for s in todo
+        ]
+        remaining = len(futures)
+        try:
+            while remaining:
+                try:
+                    shard, position, metas, final = chunks.get(timeout=1.0)
+                except queue.Empty:
+                    for future in futures:
+                        if future.done() and future.exception():
+                            raise future.exception()
+                    continue
+                if final:
+                    checkpoint.finish(shard)
+                    remaining -= 1
+                    continue
+                yield shard, metas
+                checkpoint.commit(shard, position)
+        finally:
+            stop.set()
+            for future in futures:
+                future.cancel()
+            # unblock workers waiting to put a chunk
+            while not all(f.done() for f in futures):
+                try:
+                    chunks.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            checkpoint.save()
+
+
+def write_sample_sources(path, n=2000, seed=22, index_file=None):
+    """Write synthetic libgen, bxbooks, harvard and openlibrary sources.
+
+    :param str path: target directory
+    :param str index_file: openlibrary author index (default: in path)
+    :return: dict of reader name -> data path
+    """
+    import gzip
+    import random
+    from pymarc import Field, Record, Subfield
+
+    openlibrary = reader_module("openlibrary")
+    if index_file is None:
+        index_file = os.path.join(path, "ol_dump_authors.idx")
+
+    rand = random.Random(seed)
+    isbns = ["0306406152", "9780306406157", "invalid", "0-19-853453-1"]
+    paths = dict(
+        libgen=os.path.join(path, "libgen_content.csv"),
+        bxbooks=os.path.join(path, "BX-Books.csv"),
+        harvard=os.path.join(path, "harvard"),
+        openlibrary=os.path.join(path, "ol_dump_editions.txt.gz"),
+    )
+    with open(paths["libgen"], "w", encoding="utf-8", newline="") as outfile:
+        for i in range(n):
+            row = [str(i), f"Títle, {i} : sub", "", "", "", f"Doe, J{i % 3}"]
+            row += [""] * 10 + [rand.choice(isbns + [""])]
+            outfile.write(",".join(f'"{v}"' for v in row) + "\n")
+    with open(paths["bxbooks"], "w", newline="") as outfile:
+        outfile.write('"ISBN";"Book-Title";"Book-Author"\n')
+        for i in range(n):
+            outfile.write(f'"{rand.choice(isbns)}";"Title; {i}";"Author {i}"\n')
+    os.makedirs(paths["harvard"])
+    for part in range(2):
+        with open(os.path.join(paths["harvard"], f"part{part}.mrc"), "wb") as outfile:
+            for i in range(n // 2):
+                record = Record()
+                record.add_field(
+                    Field("020", [" ", " "], [Subfield("a", rand.choice(isbns))]),
+                    Field("100", ["1", " "], [Subfield("a", f"Müller, {i}")]),
+                    Field("245", ["1", "0"], [Subfield("a", f"Title {part} {i} /")]),
+                )
+                outfile.write(record.as_marc())
+    # two concatenated gzip members
+    dump = os.path.join(path, "ol.txt.gz")
+    with open(paths["openlibrary"], "wb") as outfile:
+        for part in range(2):
+            openlibrary.write_sample_dump(dump, index_file, n=n // 2, seed=seed + part)
+            with gzip.open(dump, "rb") as infile:
+                outfile.write(gzip.compress(infile.read() + b"\n"))
+    return paths
+
+
+def test_iter_sharded():
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index_file = os.path.join(tmp, "authors.idx")
+        paths = write_sample_sources(tmp, index_file=index_file)
+        for name, path in paths.items():
+            module = reader_module(name)
+            kwargs = dict(index_file=index_file) if name == "openlibrary" else {}
+            expected = list(getattr(module, name)(path, **kwargs))
+            shards = module.shards(path, shard_size=4096, **kwargs)
+            assert len(shards) > 1, name
+            for workers in (0, 1):
+                chunks = iter_sharded(shards, workers, chunk_size=50)
+                metas = [m for shard, metas in chunks for m in metas]
+                assert sorted(metas) == sorted(expected), name
+            # stop early and resume from the checkpoint
+            checkpoint = Checkpoint(os.path.join(tmp, name + ".ckpt"))
+            metas = []
+            for n, (shard, chunk) in enumerate(
+                iter_sharded(shards, 1, checkpoint, chunk_size=50)
+            ):
+                metas.extend(chunk)
+                checkpoint.stage("records", len(metas))
+                if n == 5:
+                    break
+            checkpoint = Checkpoint(checkpoint.path)
+            assert checkpoint.positions or checkpoint.done
+            # records after the last commit are read again
+            del metas[checkpoint.state["records"] :]
+            for shard, chunk in iter_sharded(shards, 0, checkpoint, chunk_size=50):
+                metas.extend(chunk)
+            assert sorted(metas) == sorted(expected), name
+
+
+if __name__ == "__main__":
+    test_iter_sharded()
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""Compact read-only string -> string index (author lookups of the readers).
+
+The index is a directory with three files, built once and memory-mapped:
+
+hashes.npy  : sorted uint64 xxh64 hashes of the keys
+spans.npy   : (n x 3) uint64 record start, key end and value end offsets
+records.bin : utf-8 key + value records in insertion order
+
+Lookups hash the key, binary search the sorted hashes (`np.searchsorted`,
+vectorized for batch lookups) and compare the stored key, so lookups are exact
+even for colliding hashes. Later values of the same key overwrite earlier ones
+(like dict assignment).
+
+Results for 1M keys (6M random lookups):
+
+SqliteDict   : build 32.62 s -  71.0 MB - get  17429/s
+StringIndex  : build  0.97 s -  58.8 MB - get 241436/s - get_many 469025/s
+"""
+import mmap
+import os
+import shutil
+import time
+from array import array
+import numpy as np
+from xxhash import xxh64_intdigest
+
+
+def hash_key(key):
+    return xxh64_intdigest(key)
+
+
+class StringIndex:
+    """Memory-mapped string index, see `build_string_index`"""
+
+    def __init__(self, path):
+        self.path = path
+        self.hashes = np.load(os.path.join(path, "hashes.npy"), mmap_mode="r")
+        self.spans = np.load(os.path.join(path, "spans.npy"), mmap_mode="r")
+        self._file = open(os.path.join(path, "records.bin"), "rb")
+        if os.fstat(self._file.fileno()).st_size:
+            self.records = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.records = b""
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def _scan(self, i, key, h):
+        """Value of key in the run of equal hashes starting at row i"""
+        while i < len(self.hashes) and self.hashes[i] == h:
+            start, key_end, end = self.spans[i].tolist()
+            if self.records[start:key_end] == key:
+                return self.records[key_end:end].decode("utf-8")
+            i += 1
+        return None
+
+    def get(self, key, default=None):
+        key = key.encode("utf-8")
+        h = hash_key(key)
+        value = self._scan(int(np.searchsorted(self.hashes, np.uint64(h))), key, h)
+        return default if value is None else value
+
+    def get_many(self, keys, default=None):
+        """Look up a batch of keys with one vectorized search"""
+        if not len(self.hashes):
+            return [default] * len(keys)
+        keys = [k.encode("utf-8") for k in keys]
+        hashes = np.fromiter((hash_key(k) for k in keys), np.uint64, len(keys))
+        pos = np.searchsorted(self.hashes, hashes)
+        pos[pos == len(self.hashes)] = 0
+        found = (np.asarray(self.hashes[pos]) == hashes).tolist()
+        spans = np.asarray(self.spans[pos]).tolist()
+        records = self.records
+        values = []
+        for key, (start, key_end, end), ok, i, h in zip(
+            keys, spans, found, pos.tolist(), hashes.tolist()
+        ):
+            if not ok:
+                values.append(default)
+            elif records[start:key_end] == key:
+                values.append(records[key_end:end].decode("utf-8"))
+            else:
+                value = self._scan(i + 1, key, h)
+                values.append(default if value is None else value)
+        return values
+
+    def close(self):
+        if isinstance(self.records, mmap.mmap):
+            self.records.close()
+        self._file.close()
+
+
+def build_string_index(items, path):
+    """Build a `StringIndex` from (key, value) string pairs.
+
+    Records are streamed to disk while only hashes and offsets (32 bytes per
+    key) are kept in memory.
+
+    :param items: iterable of (key, value) pairs
+    :param str path: index directory (replaced if it exists)
+    :return: StringIndex
+    """
+    tmp = path + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    hashes, offsets = array("Q"), array("Q")
+    offset = 0
+    with open(os.path.join(tmp, "records.bin"), "wb") as outfile:
+        for key, value in items:
+            key, value = key.encode("utf-8"), value.encode("utf-8")
+            hashes.append(hash_key(key))
+            offsets.extend((offset, offset + len(key), offset + len(key) + len(value)))
+            outfile.write(key)
+            outfile.write(value)
+            offset += len(key) + len(value)
+    hashes = np.frombuffer(hashes, dtype=np.uint64)
+    spans = np.frombuffer(offsets, dtype=np.uint64).reshape(-1, 3)
+    order = np.argsort(hashes, kind="stable")
+    hashes, spans = hashes[order], spans[order]
+    keep = np.ones(len(hashes), dtype=bool)
+    runs = np.flatnonzero(hashes[1:] == hashes[:-1])
+    if len(runs):
+        # drop all but the last value of duplicate keys (equal hash runs are rare)
+        with open(os.path.join(tmp, "records.bin"), "rb") as infile:
+            for i in runs.tolist():
+                j = i + 1
+                while j < len(hashes) and hashes[j] == hashes[i]:
+                    infile.seek(int(spans[i, 0]))
+                    a = infile.read(int(spans[i, 1] - spans[i, 0]))
+                    infile.seek(int(spans[j, 0]))
+                    if a == infile.read(int(spans[j, 1] - spans[j, 0])):
+                        keep[i] = False
+                        break
+                    j += 1
+    np.save(os.path.join(tmp, "hashes.npy"), hashes[keep])
+    np.save(os.path.join(tmp, "spans.npy"), spans[keep])
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+    return StringIndex(path)
+
+
+def _check_index(items, path):
+    expected = dict(items)
+    index = build_string_index(items, path)
+    assert len(index) == len(expected)
+    for key, value in expected.items():
+        assert index[key] == value and key in index
+    missing = [f"OL{n}B" for n in range(100)]
+    assert all(index.get(k) is None for k in missing)
+    keys = list(expected) + missing
+    assert index.get_many(keys, "") == [expected.get(k, "") for k in keys]
+    index.close()
+
+
+def test_string_index():
+    import random
+    import tempfile
+
+    global hash_key
+    rand = random.Random(20)
+    items = [
+        (f"OL{rand.randint(0, 5000)}A", f"Ä{i} {'x' * (i % 7)}") for i in range(3000)
+    ]
+    items.append(("", "empty key"))
+    with tempfile.TemporaryDirectory() as tmp:
+        _check_index(items, os.path.join(tmp, "authors.idx"))
+        empty = build_string_index([], os.path.join(tmp, "empty.idx"))
+        assert empty.get("a", "-") == "-" and empty.get_many(["a"]) == [None]
+        empty.close()
+        # Colliding hashes are resolved by the stored keys
+        xxh64 = hash_key
+        hash_key = lambda key: len(key) % 3
+        try:
+            _check_index(items, os.path.join(tmp, "collisions.idx"))
+        finally:
+            hash_key = xxh64
+
+
+def benchmark_string_index(n=1000000):
+    """Build time, size and lookup throughput against SqliteDict"""
+    import random
+    import tempfile
+    from sqlitedict import SqliteDict
+
+    rand = random.Random(21)
+    names = ["Müller, Hans", "Smith, John", "Dostoevsky, Fyodor", "李白", "Ørsted"]
+    items = [(f"OL{i}A", f"{rand.choice(names)} {i}") for i in range(n)]
+    keys = [f"OL{rand.randint(0, n * 2)}A" for _ in range(6 * n)]
+
+    def size(path):
+        if os.path.isdir(path):
+            return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+        return os.path.getsize(path)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fp = os.path.join(tmp, "authors.sqlite")
+        start = time.time()
+        sqlite_idx = SqliteDict(fp, autocommit=False)
+        for key, value in items:
+            sqlite_idx[key] = value
+        sqlite_idx.commit()
+        sqlite_idx.close()
+        build = time.time() - start
+        sqlite_idx = SqliteDict(fp, flag="r")
+        start = time.time()
+        for key in keys[:n]:
+            sqlite_idx.get(key, "")
+        rate = n / (time.time() - start)
+        sqlite_idx.close()
+        print(
+            f"{'SqliteDict':<13}: build {build:5.2f} s - {size(fp) / 1e6:5.1f} MB - "
+            f"get {rate:6.0f}/s"
+        )
+
+        path = os.path.join(tmp, "authors.idx")
+        start = time.time()
+        index = build_string_index(items, path)
+        build = time.time() - start
+        start = time.time()
+        for key in keys:
+            index.get(key, "")
+        rate = len(keys) / (time.time() - start)
+        start = time.time()
+        for i in range(0, len(keys), 10000):
+            index.get_many(keys[i : i + 10000], "")
+        batch_rate = len(keys) / (time.time() - start)
+        index.close()
+        print(
+            f"{'StringIndex':<13}: build {build:5.2f} s - {size(path) / 1e6:5.1f} MB - "
+            f"get {rate:6.0f}/s - get_many {batch_rate:6.0f}/s"
+        )
+
+
+if __name__ == "__main__":
+    test_string_index()
+    benchmark_string_index()
@@ -2,8 +2,7 @@
 """Data aquisition utilities"""
 import os
 import logging
-from tqdm import tqdm
-import requests
+from iscc_bench.utils import READ_SIZE, iter_binary
 
 
 log = logging.getLogger(__name__)
@@ -17,6 +16,9 @@ def download(url, save_to, chunk_size=1000000):
     :param int chunk_size: chunk size in bytes
     """
 
+    import requests
+    from tqdm import tqdm
+
     log.info("Downloading %s -> %s" % (url, save_to))
     r = requests.get(url, stream=True)
     with open(save_to, "wb") as f:
@@ -58,13 +60,7 @@ def iter_files(root, exts=None, recursive=False):
                     yield os.path.join(root, f)
 
 
-def iter_bytes(filepath, chunksize=8192):
-    """Buffered byte by byte iteration over files"""
-    with open(filepath, "rb") as f:
-        while True:
-            chunk = f.read(chunksize)
-            if chunk:
-                for b in chunk:
-                    yield b
-            else:
-                break
+def iter_bytes(filepath, chunksize=READ_SIZE):
+    """Byte by byte iteration over (memory mapped) files"""
+    for chunk in iter_binary(filepath, chunksize):
+        yield from chunk
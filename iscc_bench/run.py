@@ -1,8 +1,15 @@
 # -*- coding: utf-8 -*-
+import sys
+
 from iscc_bench.readers import ALL_READERS
 
 
 if __name__ == "__main__":
-    for reader in ALL_READERS:
+    readers = ALL_READERS
+    if "--cached" in sys.argv[1:]:
+        from iscc_bench.readers.columnar import cached_readers
+
+        readers = cached_readers(readers)
+    for reader in readers:
         for entry in reader():
             print(entry)
@@ -1,49 +1,148 @@
-"""Collect ISBN intersections between different data_sources"""
+"""Collect ISBN intersections between different data_sources
+
+ISBNs of a reader are stored as a sorted uint64 array (`<reader>.isbns.npy`,
+8 bytes per ISBN) and loaded memory-mapped. Intersections of the sorted unique
+arrays run vectorized (`intersect_sorted`).
+
+Results for 5 readers with 2M ISBNs each (all 10 pairwise intersections):
+
+python sets : 71.5 bytes/isbn - 1.18 s
+uint64      :  8.0 bytes/isbn - 0.42 s
+"""
 import os
+import time
+from array import array
+from functools import reduce
+from itertools import combinations
+
+import numpy as np
+
 import iscc_bench
 from iscc_bench.readers import ALL_READERS
-from itertools import combinations
+from iscc_bench.readers.columnar import cached_readers
+from iscc_bench.readers.shards import Checkpoint, iter_sharded, reader_shards
 
 
 def print_data_source_intersections():
-    for combo in [c for c in combinations(ALL_READERS, 2)]:
-        a_isbns = set(load_isbns(combo[0]))
-        b_isbns = set(load_isbns(combo[1]))
-        matches = a_isbns.intersection(b_isbns)
-        print(
-            "{} identical isbns in {}/{}".format(
-                len(matches), combo[0].__name__, combo[1].__name__
-            )
-        )
-
-
-def dump_isbns(rebuild=False):
-    """Dump isbns for all readers to disk"""
-    readers = [r() for r in ALL_READERS]
-    for reader in readers:
-        name = reader.__name__
-        fp = os.path.join(iscc_bench.DATA_DIR, name + ".isbns")
+    uniques = {r.__name__: unique_isbns(r) for r in ALL_READERS}
+    for a, b in combinations(uniques, 2):
+        matches = intersect_sorted(uniques[a], uniques[b])
+        print("{} identical isbns in {}/{}".format(len(matches), a, b))
+
+
+def dump_isbns(rebuild=False, workers=None):
+    """Dump isbns for all readers to disk (resumable, shards read on all cpus).
+
+    dnbrdf is a single shard (one streaming xml parse) and runs on one core.
+    """
+    names = {r.__name__: r for r in ALL_READERS}
+    fps = {n: isbns_path(n) for n in names}
+    checkpoint_file = os.path.join(iscc_bench.DATA_DIR, "isbns.ckpt")
+    todo = []
+    for name, fp in fps.items():
         if not rebuild and os.path.exists(fp):
-            print("Skip existing {}.isbns".format(name))
+            print("Skip existing {}".format(os.path.basename(fp)))
             continue
+        todo.append(name)
+    if not todo:
+        return
+    if rebuild and os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+    checkpoint = Checkpoint(checkpoint_file)
+    # partial dumps (raw uint64) are cut back to the sizes saved with the positions
+    outfiles = {}
+    for name in todo:
+        outfiles[name] = open(fps[name] + ".part", "ab")
+        outfiles[name].truncate(checkpoint.state.get(name, 0))
+    print("######### Dumping {}".format(", ".join(n + ".isbns" for n in todo)))
+    try:
+        for shard, metas in iter_sharded(
+            reader_shards([names[n] for n in todo]), workers, checkpoint, 10000
+        ):
+            outf = outfiles[shard.source]
+            outf.write(isbn_array(e.isbn for e in metas if e.isbn).tobytes())
+            outf.flush()
+            checkpoint.stage(shard.source, outf.tell())
+    finally:
+        for outf in outfiles.values():
+            outf.close()
+    for name in todo:
+        save_isbns(np.fromfile(fps[name] + ".part", dtype=np.uint64), fps[name])
+        os.remove(fps[name] + ".part")
+    os.remove(checkpoint_file)
+
+
+def isbns_path(reader, data_dir=None):
+    name = reader.__name__ if hasattr(reader, "__name__") else reader
+    return os.path.join(data_dir or iscc_bench.DATA_DIR, name + ".isbns.npy")
+
+
+def isbn_array(isbns):
+    """uint64 array("Q") of isbn strings (without hyphens, others are dropped)"""
+    values = array("Q")
+    for isbn in isbns:
+        isbn = isbn.replace("-", "")
+        if isbn.isdigit() and len(isbn) <= 13:
+            values.append(int(isbn))
+    return values
+
+
+def save_isbns(isbns, fp):
+    """Save isbns (uint64 array, duplicates are kept) sorted"""
+    isbns = np.sort(np.asarray(isbns, dtype=np.uint64))
+    tmp = fp + ".tmp.npy"
+    np.save(tmp, isbns)
+    os.replace(tmp, fp)
+
+
+def load_isbns(reader, data_dir=None):
+    """Sorted (memory-mapped) uint64 array of all isbns of a reader.
 
-        print("######### Dumping {}.isbns".format(name))
-        with open(fp, "w") as outf:
-            for entry in reader:
-                if entry.isbn:
-                    outf.write("{}\n".format(entry.isbn))
+    Text dumps of earlier versions (`<reader>.isbns`) are converted once.
+    """
+    fp = isbns_path(reader, data_dir)
+    legacy = fp[: -len(".npy")]
+    if not os.path.exists(fp) and os.path.exists(legacy):
+        with open(legacy) as f:
+            save_isbns(isbn_array(line.strip() for line in f), fp)
+    return np.load(fp, mmap_mode="r")
+
+
+def unique_sorted(isbns):
+    """Unique values of a sorted array (without sorting again)"""
+    isbns = np.asarray(isbns)
+    if not len(isbns):
+        return isbns
+    return isbns[np.concatenate(([True], isbns[1:] != isbns[:-1]))]
+
+
+def unique_isbns(reader, data_dir=None):
+    return unique_sorted(load_isbns(reader, data_dir))
 
 
-def load_isbns(reader):
+def intersect_sorted(a, b):
+    """Intersection of two sorted unique uint64 arrays.
+
+    Similar sized arrays are merged (a stable sort of two sorted runs is a
+    linear merge), a much smaller array is binary searched in the larger one.
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    a, b = np.asarray(a), np.asarray(b)
+    if not len(a):
+        return a
+    if len(a) * 16 < len(b):
+        pos = np.searchsorted(b, a)
+        pos[pos == len(b)] = 0
+        return a[b[pos] == a]
+    merged = np.concatenate((a, b))
+    merged.sort(kind="stable")
+    return merged[:-1][merged[1:] == merged[:-1]]
 
-    if hasattr(reader, "__name__"):
-        name = reader.__name__
-    else:
-        name = reader
 
-    fp = os.path.join(iscc_bench.DATA_DIR, name + ".isbns")
-    with open(fp) as f:
-        return [int(line.strip()) for line in f]
+def union_sorted(a, b):
+    """Union of two sorted unique uint64 arrays"""
+    return np.union1d(a, b)
 
 
 def print_isbn_stats():
@@ -54,22 +153,18 @@ def print_isbn_stats():
     for reader in ALL_READERS:
         isbns = load_isbns(reader)
         total = len(isbns)
-        unique = len(set(isbns))
+        unique = len(unique_sorted(isbns))
         data.append([reader.__name__, total, unique])
     table = AsciiTable(data)
     print(table.table)
 
 
 def get_intersecting_isbns():
-
-    isbn_sets = []
-    for reader in ALL_READERS:
-        isbns = load_isbns(reader)
-        isbn_sets.append(set(isbns))
-    return set.intersection(*isbn_sets)
+    """Sorted uint64 array of the isbns that are in all readers"""
+    return reduce(intersect_sorted, (unique_isbns(r) for r in ALL_READERS))
 
 
-def build_metadata_pairs(samples=100):
+def build_metadata_pairs(samples=100, cached=False):
     """
     Build sample data in format:
         isbn, title_a, authors_a, title_b, authors_b
@@ -77,13 +172,17 @@ def build_metadata_pairs(samples=100):
     Where:
         isbn is in both datasets
         title_a + authors_a != title_b + authors_b
+
+    With cached=True the readers' columnar caches are used and only records of
+    relevant isbns are decoded.
     """
     from itertools import cycle
     import gc
 
     gc.enable()
 
-    combos = [c for c in combinations(ALL_READERS, 2)]
+    readers = cached_readers() if cached else ALL_READERS
+    combos = [c for c in combinations(readers, 2)]
     samples_per_combo = int(samples / len(combos))
     print("Creating ~%s samples per data source pair" % samples_per_combo)
 
@@ -95,12 +194,16 @@ def build_metadata_pairs(samples=100):
         for combo in combos:
             gc.collect()
             combo_name = "%s-%s" % (combo[0].__name__, combo[1].__name__)
-            a_isbns = set(load_isbns(combo[0]))
-            b_isbns = set(load_isbns(combo[1]))
-            relevant_isbns = a_isbns.intersection(b_isbns)
+            matches = intersect_sorted(unique_isbns(combo[0]), unique_isbns(combo[1]))
+            relevant_isbns = set(matches.tolist())
             data = {}
             counter = 0
-            reader_combo = cycle((combo[0](), combo[1]()))
+            if cached:
+                # only the relevant isbns are decoded from the columnar caches
+                isbns = list(relevant_isbns)
+                reader_combo = cycle((combo[0](isbns), combo[1](isbns)))
+            else:
+                reader_combo = cycle((combo[0](), combo[1]()))
             print("Collecting %s combo" % combo_name)
             for reader in reader_combo:
                 try:
@@ -160,7 +263,64 @@ def clean_dupes():
     print("Wrote %s lines." % wrote)
 
 
+def test_isbn_sets():
+    import tempfile
+
+    rand = np.random.RandomState(24)
+    pool = rand.randint(978 * 10**10, 980 * 10**10, 5000, dtype=np.uint64)
+    arrays = [unique_sorted(np.sort(rand.choice(pool, 3000))) for _ in range(3)]
+    sets = [set(a.tolist()) for a in arrays]
+    assert [len(a) for a in arrays] == [len(s) for s in sets]
+    for (a, sa), (b, sb) in combinations(zip(arrays, sets), 2):
+        assert intersect_sorted(a, b).tolist() == sorted(sa & sb)
+        assert union_sorted(a, b).tolist() == sorted(sa | sb)
+    assert len(intersect_sorted(arrays[0], arrays[0][:0])) == 0
+    small = arrays[1][::40]
+    assert intersect_sorted(arrays[0], small).tolist() == sorted(sets[0] & set(small))
+    assert list(isbn_array(["978-0-306-40615-7", "invalid", "0306406152", ""])) == [
+        9780306406157,
+        306406152,
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "sample.isbns"), "w") as f:
+            f.write("9780306406157\n9783161484100\n9780306406157\n")
+        isbns = load_isbns("sample", tmp)
+        assert isbns.tolist() == [9780306406157, 9780306406157, 9783161484100]
+        assert unique_isbns("sample", tmp).tolist() == [9780306406157, 9783161484100]
+        assert os.path.exists(isbns_path("sample", tmp))
+
+
+def benchmark_isbn_sets(n=2000000, readers=5):
+    """Memory and time of all pairwise intersections, python sets vs uint64"""
+    import tracemalloc
+
+    rand = np.random.RandomState(24)
+    pool = rand.randint(978 * 10**10, 980 * 10**10, n * 3, dtype=np.uint64)
+    arrays = [unique_sorted(np.sort(rand.choice(pool, n))) for _ in range(readers)]
+    total = sum(len(a) for a in arrays)
+
+    tracemalloc.start()
+    sets = [set(a.tolist()) for a in arrays]
+    set_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    start = time.time()
+    for a, b in combinations(sets, 2):
+        a.intersection(b)
+    set_time = time.time() - start
+    del sets
+
+    start = time.time()
+    for a, b in combinations(arrays, 2):
+        intersect_sorted(a, b)
+    array_time = time.time() - start
+    array_bytes = sum(a.nbytes for a in arrays)
+    print(f"python sets : {set_bytes / total:4.1f} bytes/isbn - {set_time:.2f} s")
+    print(f"uint64      : {array_bytes / total:4.1f} bytes/isbn - {array_time:.2f} s")
+
+
 if __name__ == "__main__":
+    test_isbn_sets()
+    # benchmark_isbn_sets()
     # dump_isbns()
     # print_isbn_stats()
     # print('Total all intersecting isbns: {}'.format(len(get_intersecting_isbns())))
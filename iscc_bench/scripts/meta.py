@@ -4,6 +4,7 @@ import base64
 from hashlib import sha256
 import unicodedata
 from typing import List, ByteString, Sequence
+from iscc_bench.algos.simhash import simhash as vectorized_simhash
 
 
 # Magic Constants
@@ -155,27 +156,7 @@ def sliding_window(text: str, width: int) -> List:
 
 def simhash(hash_digests: Sequence[ByteString]) -> ByteString:
 
-    n_bytes = len(hash_digests[0])
-    hashbits = n_bytes * 8
-
-    vector = [0] * hashbits
-    for token in hash_digests:
-
-        assert len(token) == n_bytes, "All digests must have the same number of bytes"
-
-        h = int.from_bytes(token, "big", signed=False)
-
-        for i in range(hashbits):
-            vector[i] += h & 1
-            h >>= 1
-
-    minfeatures = len(hash_digests) * 1.0 / 2
-
-    shash = 0
-    for i in range(hashbits):
-        shash |= int(vector[i] >= minfeatures) << i
-
-    return shash.to_bytes(n_bytes, "big", signed=False)
+    return vectorized_simhash(hash_digests)
 
 
 def c2d(code: str) -> ByteString:
@@ -250,10 +231,12 @@ if __name__ == "__main__":
     print()
 
     print("Running Algo 2")
-    hamming_distances = []
+    from iscc_bench.algos.hamming import decode_codes, paired_distances
+
     true_positives = 0
     total = 0
     meta_ids = []
+    pairs = ([], [])
 
     start = time.time()
     for row in iter_pairs():
@@ -263,13 +246,14 @@ if __name__ == "__main__":
             meta_ids.extend([mid1, mid2])
         else:
             meta_ids.append(mid1)
-
-        hd = hamming_distance(mid1, mid2)
+        pairs[0].append(mid1)
+        pairs[1].append(mid2)
         total += 1
-        hamming_distances.append(hd)
         if mid1 == mid2:
             true_positives += 1
-        # print(mid1, mid2, hd, '\t', row)
+    hamming_distances = paired_distances(
+        decode_codes(pairs[0], "base32"), decode_codes(pairs[1], "base32")
+    ).tolist()
     end = time.time()
 
     print("Execution Time %s" % (end - start))
@@ -0,0 +1,445 @@
+# -*- coding: utf-8 -*-
+"""Batch implementation of `scripts/meta.generate_meta_id`.
+
+- Normalization filters and lowercases the NFD text with a lazily filled
+  translation table (one `str.translate` instead of per character
+  `unicodedata.category` calls) and applies the title cuts with a single split.
+- compat mode keeps the sha256 features and yields identical codes. The lowest
+  8-byte splits are selected with numpy and only the rehashed splits enter
+  the simhash.
+- compat simhash of all records of a batch is a single vectorized bit count.
+- fast mode computes 64-bit xxh64 n-gram features (keyed by the n-gram width),
+  the lowest split selection, a splitmix64 rehash and the simhash of all
+  records in one compiled kernel call. Codes are not compatible with compat
+  mode.
+- rolling mode hashes the 2/3/4-grams with a polynomial rolling hash over the
+  code points (one multiply-add per gram, no utf-8 buffer), keeps the lowest
+  `SPLIT_MIN_LOWEST` features in a bounded max-heap instead of sorting all of
+  them and counts the simhash bits on the fly. Codes are not compatible with
+  the other modes.
+
+Results for 100000 synthetic records:
+
+generate_meta_id  :   6261 records/s
+compat            :  14275 records/s
+fast              :  83570 records/s
+rolling           : 101169 records/s
+
+Feature stage only (prepared input strings):
+
+fast              : 282602 records/s
+rolling           : 530128 records/s
+
+The TP/FP/FN rates of the modes are compared by `storage.compare_variants`
+(`iscc-bench compare --variant rolling ...` on the loaded datasets, the ES
+evaluation on the elastic backend). The rates in `storage` are from
+`benchmark_variants` on synthetic catalogs only.
+"""
+import base64
+import re
+import time
+import unicodedata
+from hashlib import sha256
+import numpy as np
+from xxhash import xxh64_intdigest
+from numba import njit
+from iscc_bench.algos.ngrams import ROLLING_BASE, encode_text, utf8_offsets, xxh64_buf
+from iscc_bench.algos.simhash import simhash_batch
+from iscc_bench.scripts import meta
+
+WIDTHS = (2, 3, 4)
+MODES = ("compat", "fast", "rolling")
+NGRAM_KEYS = np.array([xxh64_intdigest(b"ngram%d" % w) for w in WIDTHS], np.uint64)
+RGX_DIGITS = re.compile(r"\d+", flags=re.UNICODE)
+
+
+class _NormTable(dict):
+    """Translation table filled on demand: code point -> normalized chars"""
+
+    def __missing__(self, cp):
+        c = chr(cp)
+        cat = unicodedata.category(c)
+        if cat.startswith("Z"):
+            value = "" if meta.REMOVE_SPACES else " "
+        elif cat[0] in "LNS":
+            value = c.lower()
+        else:
+            value = None
+        self[cp] = value
+        return value
+
+
+NORM_TABLE = _NormTable()
+
+
+def _cut_pattern():
+    seps = [
+        sep
+        for sep, enabled in (
+            (":", meta.CUT_AFTER_COLON),
+            (";", meta.CUT_AFTER_SEMICOLON),
+            ("/", meta.CUT_AFTER_SLASH),
+            ("-", meta.CUT_AFTER_DASH),
+            (".", meta.CUT_AFTER_DOT),
+            (",", meta.CUT_AFTER_COMMA),
+        )
+        if enabled
+    ]
+    return re.compile("[%s]" % re.escape("".join(seps))) if seps else None
+
+
+RGX_CUT = _cut_pattern()
+
+
+def normalize_text(text):
+    """Same result as `meta.normalize_text` with a single translate pass"""
+    filtered = unicodedata.normalize("NFD", text).translate(NORM_TABLE)
+    if not meta.REMOVE_SPACES:
+        filtered = " ".join(filtered.split())
+    return unicodedata.normalize("NFC", filtered)
+
+
+def normalize_creators(text):
+    creators = []
+    for creator in RGX_DIGITS.sub("", text).split(";"):
+        if "," in creator:
+            creator = " ".join(reversed(creator.split(",")[:2]))
+        tokens = normalize_text(creator).split()
+        if not tokens:
+            continue
+        if tokens[0] == tokens[-1]:
+            creators.append(tokens[0])
+        else:
+            creators.append(tokens[0][0] + tokens[-1])
+    return " ".join(sorted(creators))
+
+
+def prepare(title, creators="", extra=""):
+    """Normalized and concatenated input string of a Meta-ID"""
+    title = unicodedata.normalize("NFKC", title)
+    creators = unicodedata.normalize("NFKC", creators)
+    extra = unicodedata.normalize("NFKC", extra)
+    if meta.REMOVE_PARANTHESE:
+        title = meta.RGX_PARANTHESE.sub("", title)
+        creators = meta.RGX_PARANTHESE.sub("", creators)
+    if meta.REMOVE_BRACKETS:
+        title = meta.RGX_BRACKETS.sub("", title)
+        creators = meta.RGX_BRACKETS.sub("", creators)
+    if RGX_CUT is not None:
+        title = RGX_CUT.split(title, 1)[0].strip()
+    title = normalize_text(title[: meta.INPUT_TRIM_TITLE])
+    creators = normalize_creators(creators)[: meta.INPUT_TRIM_CREATORS]
+    extra = normalize_text(extra[: meta.INPUT_TRIM_EXTRA])
+    return " ".join((title, creators, extra)).rstrip("|")
+
+
+def features_compat(concat):
+    """(n, 32) uint8 sha256 feature digests as in `meta.generate_meta_id`"""
+    ngrams = []
+    for w in WIDTHS:
+        ngrams.extend(meta.sliding_window(concat, w))
+    digests = b"".join(sha256(s.encode("utf-8")).digest() for s in ngrams)
+    if not meta.SPLIT_MIN_ALGO:
+        return np.frombuffer(digests, np.uint8).reshape(-1, 32)
+    splits = np.frombuffer(digests, dtype=">u8")
+    k = meta.SPLIT_MIN_LOWEST
+    if len(splits) > k:
+        splits = np.partition(splits, k - 1)[:k]
+    lowest = np.sort(splits).tobytes()
+    rehashed = b"".join(
+        sha256(lowest[i : i + 8]).digest() for i in range(0, len(lowest), 8)
+    )
+    return np.frombuffer(rehashed, np.uint8).reshape(-1, 32)
+
+
+@njit(cache=True)
+def _splitmix64(x):
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+@njit(cache=True)
+def _meta_ids_fast(buf, offsets, starts, keys, split_min, k, out):
+    """56-bit simhash of keyed xxh64 2/3/4-gram features for each record"""
+    for r in range(out.shape[0]):
+        s, e = starts[r], starts[r + 1]
+        n = 0
+        for w in range(2, 5):
+            n += max(e - s - w + 1, 1)
+        feats = np.empty(n, dtype=np.uint64)
+        n = 0
+        for w in range(2, 5):
+            key = keys[w - 2]
+            if e - s < w:
+                feats[n] = xxh64_buf(buf, offsets[s], offsets[e]) ^ key
+                n += 1
+            else:
+                for i in range(s, e - w + 1):
+                    feats[n] = xxh64_buf(buf, offsets[i], offsets[i + w]) ^ key
+                    n += 1
+        if split_min:
+            feats = np.sort(feats)[:k]
+            for i in range(feats.shape[0]):
+                feats[i] = _splitmix64(feats[i])
+        shash = np.uint64(0)
+        for bit in range(64):
+            count = 0
+            for i in range(feats.shape[0]):
+                count += (feats[i] >> np.uint64(bit)) & np.uint64(1)
+            if 2 * count >= feats.shape[0]:
+                shash |= np.uint64(1) << np.uint64(bit)
+        out[r] = shash >> np.uint64(8)
+
+
+@njit(cache=True)
+def _push_lowest(heap, n, value):
+    """Push value into a max-heap keeping the len(heap) lowest, returns size"""
+    if n < heap.shape[0]:
+        i = n
+        heap[i] = value
+        while i > 0:
+            parent = (i - 1) >> 1
+            if heap[parent] >= heap[i]:
+                break
+            heap[parent], heap[i] = heap[i], heap[parent]
+            i = parent
+        return n + 1
+    if value >= heap[0]:
+        return n
+    heap[0] = value
+    i = 0
+    while True:
+        child = 2 * i + 1
+        if child >= n:
+            break
+        if child + 1 < n and heap[child + 1] > heap[child]:
+            child += 1
+        if heap[i] >= heap[child]:
+            break
+        heap[child], heap[i] = heap[i], heap[child]
+        i = child
+    return n
+
+
+@njit(cache=True)
+def _add_bits(counts, value):
+    for bit in range(64):
+        counts[bit] += np.int64((value >> np.uint64(bit)) & np.uint64(1))
+
+
+@njit(cache=True)
+def _meta_ids_rolling(cps, starts, keys, split_min, k, out):
+    """56-bit simhash of rolling hash 2/3/4-gram features for each record"""
+    heap = np.empty(max(k, 1), dtype=np.uint64)
+    counts = np.empty(64, dtype=np.int64)
+    for r in range(out.shape[0]):
+        s, e = starts[r], starts[r + 1]
+        n_heap = 0
+        n_feats = 0
+        counts[:] = 0
+        for w in range(2, 5):
+            key = keys[w - 2]
+            span = min(w, e - s)
+            high = np.uint64(1)  # ROLLING_BASE ** (span - 1)
+            for _ in range(span - 1):
+                high *= ROLLING_BASE
+            h = np.uint64(0)
+            for i in range(s, s + span):
+                h = h * ROLLING_BASE + np.uint64(cps[i])
+            for i in range(s, max(e - w + 1, s + 1)):
+                if i > s:
+                    h = (h - np.uint64(cps[i - 1]) * high) * ROLLING_BASE
+                    h += np.uint64(cps[i + w - 1])
+                feature = _splitmix64(h ^ key)
+                if split_min:
+                    n_heap = _push_lowest(heap, n_heap, feature)
+                else:
+                    _add_bits(counts, feature)
+                n_feats += 1
+        if split_min:
+            n_feats = n_heap
+            for i in range(n_heap):
+                _add_bits(counts, _splitmix64(heap[i]))
+        shash = np.uint64(0)
+        for bit in range(64):
+            if 2 * counts[bit] >= n_feats:
+                shash |= np.uint64(1) << np.uint64(bit)
+        out[r] = shash >> np.uint64(8)
+
+
+def _concat_starts(concats):
+    starts = np.zeros(len(concats) + 1, dtype=np.int64)
+    np.cumsum([len(c) for c in concats], out=starts[1:])
+    return starts
+
+
+def meta_ids_rolling(concats):
+    """56-bit Meta-ID bodies with rolling hash features in one kernel call"""
+    out = np.empty(len(concats), dtype=np.uint64)
+    k = meta.SPLIT_MIN_LOWEST
+    _meta_ids_rolling(
+        encode_text("".join(concats)),
+        _concat_starts(concats),
+        NGRAM_KEYS,
+        meta.SPLIT_MIN_ALGO,
+        k,
+        out,
+    )
+    return out
+
+
+def meta_ids_fast(concats):
+    """56-bit Meta-ID bodies of prepared input strings in one kernel call"""
+    text = "".join(concats)
+    cps = encode_text(text)
+    buf = np.frombuffer(text.encode("utf8"), dtype=np.uint8)
+    starts = _concat_starts(concats)
+    out = np.empty(len(concats), dtype=np.uint64)
+    k = meta.SPLIT_MIN_LOWEST
+    _meta_ids_fast(
+        buf, utf8_offsets(cps), starts, NGRAM_KEYS, meta.SPLIT_MIN_ALGO, k, out
+    )
+    return out
+
+
+def generate_meta_ids(titles, creators=None, extras=None, compat=True, mode=None):
+    """Generate Meta-ID codes for a batch of records.
+
+    :param titles: list of titles
+    :param creators: list of creators (optional)
+    :param extras: list of extra metadata (optional)
+    :param bool compat: identical codes to `meta.generate_meta_id` (sha256
+        features) or fast xxh64 features
+    :param str mode: one of `MODES` (overrides compat)
+    :return: list of Meta-ID codes
+    """
+    mode = mode or ("compat" if compat else "fast")
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode {mode}")
+    creators = creators or [""] * len(titles)
+    extras = extras or [""] * len(titles)
+    concats = [prepare(t, c, e) for t, c, e in zip(titles, creators, extras)]
+    if not concats:
+        return []
+    if mode == "compat":
+        features = [features_compat(c)[:, :7] for c in concats]
+        digests = simhash_batch(features).tobytes()
+    else:
+        bodies = meta_ids_fast if mode == "fast" else meta_ids_rolling
+        digests = bodies(concats).astype(">u8").view(np.uint8)
+        digests = digests.reshape(-1, 8)[:, 1:].tobytes()
+    return [
+        base64.b32encode(b"\x00" + digests[i : i + 7]).rstrip(b"=").decode("ascii")
+        for i in range(0, len(digests), 7)
+    ]
+
+
+def synthetic_records(n, seed=13):
+    rand = np.random.RandomState(seed)
+    words = [
+        "Die",
+        "Geschichte",
+        "of",
+        "the",
+        "Iñtërnâtiônàlizætiøn",
+        "Βιβλίο",
+        "(2. Aufl.)",
+        "[Roman]",
+        "Part 1: Beginnings",
+        "Vol. 2",
+        "Æsop's",
+        "Fables/Fabeln",
+        "日本語",
+        "Ølsen",
+        "l'été",
+        "ISBN",
+    ]
+    names = ["Müller, Hans", "Smith, J.", "Dostoevsky", "Ørsted, H. C.", "李白"]
+    titles, creators = [], []
+    for _ in range(n):
+        titles.append(" ".join(rand.choice(words, rand.randint(1, 9))))
+        creators.append("; ".join(rand.choice(names, rand.randint(0, 3))))
+    return titles, creators
+
+
+def meta_id_rolling_ref(concat):
+    """Pure python reference of the rolling mode Meta-ID body (full sort)"""
+    mask, base = (1 << 64) - 1, int(ROLLING_BASE)
+
+    def splitmix64(x):
+        x = (x + 0x9E3779B97F4A7C15) & mask
+        x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & mask
+        x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & mask
+        return x ^ (x >> 31)
+
+    feats = []
+    for w, key in zip(WIDTHS, NGRAM_KEYS.tolist()):
+        grams = [concat[i : i + w] for i in range(len(concat) - w + 1)] or [concat]
+        for gram in grams:
+            h = 0
+            for c in gram:
+                h = (h * base + ord(c)) & mask
+            feats.append(splitmix64(h ^ key))
+    if meta.SPLIT_MIN_ALGO:
+        feats = [splitmix64(f) for f in sorted(feats)[: meta.SPLIT_MIN_LOWEST]]
+    bits = [sum((f >> b) & 1 for f in feats) * 2 >= len(feats) for b in range(64)]
+    return sum(1 << b for b in range(64) if bits[b]) >> 8
+
+
+def test_push_lowest():
+    rand = np.random.RandomState(seed=17)
+    for n, k in ((0, 10), (5, 10), (10, 10), (11, 10), (500, 10), (500, 1)):
+        values = rand.randint(0, 50, n).astype(np.uint64)  # with duplicates
+        heap = np.empty(k, dtype=np.uint64)
+        size = 0
+        for v in values:
+            size = _push_lowest(heap, size, v)
+        assert np.array_equal(np.sort(heap[:size]), np.sort(values)[:k])
+
+
+def compat():
+    titles, creators = synthetic_records(5000)
+    titles += ["", " ", "a", "ab", "(x)", "[a(b]c)", "Title: sub; more"]
+    creators += ["", "", "", "x", "Doe, John; 1999", "", "A, B; C, D"]
+    expected = [meta.generate_meta_id(t, c) for t, c in zip(titles, creators)]
+    assert generate_meta_ids(titles, creators) == expected
+    for t in titles[:200]:
+        assert normalize_text(t) == meta.normalize_text(t)
+    fast = generate_meta_ids(titles, creators, compat=False)
+    assert len(fast) == len(titles) and all(len(c) == 13 for c in fast)
+    test_push_lowest()
+    concats = [prepare(t, c) for t, c in zip(titles, creators)]
+    expected = [meta_id_rolling_ref(c) for c in concats]
+    assert meta_ids_rolling(concats).tolist() == expected
+    rolling = generate_meta_ids(titles, creators, mode="rolling")
+    assert len(rolling) == len(titles) and all(len(c) == 13 for c in rolling)
+    print("generate_meta_ids compatible")
+
+
+def benchmark(n=100000):
+    titles, creators = synthetic_records(n)
+    for mode in MODES:
+        generate_meta_ids(titles[:10], creators[:10], mode=mode)
+    start = time.time()
+    for t, c in zip(titles, creators):
+        meta.generate_meta_id(t, c)
+    rt = time.time() - start
+    print(f"{'generate_meta_id':<18}: {n / rt:6.0f} records/s")
+    for mode in MODES:
+        start = time.time()
+        generate_meta_ids(titles, creators, mode=mode)
+        rt = time.time() - start
+        print(f"{mode:<18}: {n / rt:6.0f} records/s")
+    concats = [prepare(t, c) for t, c in zip(titles, creators)]
+    for name, bodies in (("fast", meta_ids_fast), ("rolling", meta_ids_rolling)):
+        start = time.time()
+        bodies(concats)
+        rt = time.time() - start
+        print(f"{name + ' (features)':<18}: {n / rt:6.0f} records/s")
+
+
+if __name__ == "__main__":
+    compat()
+    benchmark()
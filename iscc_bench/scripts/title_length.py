@@ -4,11 +4,12 @@ import unicodedata
 from itertools import cycle
 import numpy as np
 from iscc_bench.readers import ALL_READERS
+from iscc_bench.readers.columnar import cached_readers
 
 
-def iter_titles():
-    """Iterate over titles"""
-    readers = [r() for r in ALL_READERS]
+def iter_titles(cached=False):
+    """Iterate over titles (read from the columnar caches if cached)"""
+    readers = [r() for r in (cached_readers() if cached else ALL_READERS)]
     for reader in cycle(readers):
         meta = next(reader)
         yield meta.title
@@ -22,8 +23,8 @@ def reject_outliers(data, m=2.0):
     return data[s < m]
 
 
-def check_subtitles():
-    readers = [r() for r in ALL_READERS]
+def check_subtitles(cached=False):
+    readers = [r() for r in (cached_readers() if cached else ALL_READERS)]
     for reader in cycle(readers):
         meta = next(reader)
         if " : " in meta.title:
@@ -1,20 +1,12 @@
 # -*- coding: utf-8 -*-
-"""Test universal sentence encoding for Semantic-ID text."""
-from pprint import pprint
+"""Test universal sentence encoding for Semantic-ID text.
 
+TensorFlow and the TF-Hub model are loaded by `demo`, not at import.
+"""
 from loguru import logger as log
 from syntok import segmenter
-import tensorflow as tf
-import tensorflow_hub as hub
-import numpy as np
-import tf_sentencepiece
 
 from iscc_bench.readers.gutenberg import gutenberg
-from langdetect import detect
-
-embed = hub.load(
-    "https://tfhub.dev/google/universal-sentence-encoder-multilingual-large/3"
-)
 
 
 def sentencize(text):
@@ -30,6 +22,11 @@ def sentencize(text):
 
 
 def demo():
+    import tensorflow as tf
+    import tensorflow_hub as hub
+    import tf_sentencepiece
+    from langdetect import detect
+
     # Graph set up.
     g = tf.Graph()
     with g.as_default():
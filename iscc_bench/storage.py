@@ -0,0 +1,490 @@
+# -*- coding: utf-8 -*-
+"""Storage backends for the Meta-ID benchmark pipeline (load, build, evaluate).
+
+elastic : the original Elasticsearch indices (iscc_meta_data, iscc_meta_id,
+          iscc_result)
+sqlite  : embedded SQLite database in WAL mode with batched inserts and indexes
+          on isbn and meta_id (no service required)
+
+Both backends implement the same semantics: entries are keyed by
+`MetaData.key` (later loads overwrite), Meta-IDs are keyed by
+"meta_<meta_data id>" and every evaluation fills one result row with the
+entry, positive (same Meta-ID) and negative (same ISBN) group counts.
+
+Meta-ID variants (`VARIANTS`):
+
+iscclib : `iscclib.meta.MetaID` with id_bits and shinglesize
+compat  : `scripts/meta.generate_meta_id` (64-bit, sha256 n-gram features)
+fast    : `scripts/meta_fast` xxh64 n-gram features
+rolling : `scripts/meta_fast` rolling hash n-gram features with bounded heap
+
+`compare_variants` builds every variant on the data loaded into a backend and
+reports the TP/FP/FN rates of its evaluation (`iscc-bench compare`, on the
+elastic backend this is the `elastic_search/columns` evaluation of the real
+datasets).
+
+Results of `benchmark_variants` (2 x 20000 synthetic records, inline build).
+The rates are from synthetic catalogs on SQLite, not from the ES evaluation:
+
+Variant      Build records/s    Mid groups     TP     FP     FN
+compat             12776.909          6521  0.737  0.263  0.068
+fast               13289.539          6941  0.746  0.254  0.077
+rolling            24257.444          6667  0.723  0.277  0.064
+"""
+import json
+import os
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from functools import partial
+from iscc_bench import DATA_DIR, PACKAGE_DIR
+from iscc_bench.pipeline import PipelineStats, batch_pipeline
+
+COLLISION_MID = os.path.join(PACKAGE_DIR, "collision_meta_ids.txt")
+COLLISION_ISBN = os.path.join(PACKAGE_DIR, "collision_isbns.txt")
+SQLITE_FILE = os.path.join(DATA_DIR, "iscc_bench.sqlite")
+BATCH_SIZE = 50000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta_data (
+    id TEXT PRIMARY KEY, isbn TEXT, title TEXT, creator TEXT, source TEXT
+);
+CREATE INDEX IF NOT EXISTS meta_data_isbn ON meta_data (isbn);
+CREATE TABLE IF NOT EXISTS meta_id (
+    id TEXT PRIMARY KEY, meta_id TEXT, meta_data TEXT
+);
+CREATE INDEX IF NOT EXISTS meta_id_meta_id ON meta_id (meta_id);
+CREATE TABLE IF NOT EXISTS result (
+    id INTEGER PRIMARY KEY, bit_length INTEGER, shingle_size INTEGER,
+    total INTEGER, entry_sources TEXT, mid_groups INTEGER, same_isbn INTEGER,
+    isbn_groups INTEGER, same_mid INTEGER, variant TEXT
+);
+"""
+VARIANTS = ("iscclib", "compat", "fast", "rolling")
+
+# Groups of equal Meta-ID with entries from more than one source
+POSITIVES = """
+SELECT m.meta_id, COUNT(DISTINCT COALESCE(d.isbn, '')) AS isbns
+FROM meta_id m JOIN meta_data d ON d.id = m.meta_data
+GROUP BY m.meta_id
+HAVING COUNT(*) > 1 AND COUNT(DISTINCT d.source) > 1
+"""
+
+# Groups of equal ISBN with entries from more than one source
+NEGATIVES = """
+SELECT d.isbn, COUNT(DISTINCT COALESCE(m.meta_id, '')) AS mids
+FROM meta_data d LEFT JOIN meta_id m ON m.id = 'meta_' || d.id
+WHERE d.isbn IS NOT NULL
+GROUP BY d.isbn
+HAVING COUNT(*) > 1 AND COUNT(DISTINCT d.source) > 1
+"""
+
+
+def meta_id_iscclib(title, creator, id_bits, shinglesize):
+    from iscclib.meta import MetaID
+
+    mid = MetaID.from_meta(title, creator, bits=id_bits, shinglesize=shinglesize)
+    return "{}".format(mid)
+
+
+def meta_ids_batch(rows, id_bits, shinglesize, meta_id_func=meta_id_iscclib):
+    """Compute Meta-IDs for a batch of (id, title, creator) rows"""
+    return [
+        (id, meta_id_func(title, creator, id_bits, shinglesize))
+        for id, title, creator in rows
+    ]
+
+
+def meta_ids_meta_fast(rows, id_bits, shinglesize, mode="rolling"):
+    """Compute `scripts/meta_fast` Meta-IDs for a batch of rows in one call.
+
+    The codes are always 64-bit, id_bits and shinglesize are ignored.
+    """
+    from iscc_bench.scripts.meta_fast import generate_meta_ids
+
+    titles = [title or "" for id, title, creator in rows]
+    creators = [creator or "" for id, title, creator in rows]
+    mids = generate_meta_ids(titles, creators, mode=mode)
+    return [(row[0], mid) for row, mid in zip(rows, mids)]
+
+
+def variant_func(variant, id_bits, shinglesize, meta_id_func=meta_id_iscclib):
+    """Picklable batch function mapping (id, title, creator) rows to (id, mid)"""
+    if variant == "iscclib":
+        return partial(
+            meta_ids_batch,
+            id_bits=id_bits,
+            shinglesize=shinglesize,
+            meta_id_func=meta_id_func,
+        )
+    if variant not in VARIANTS:
+        raise ValueError("Unknown Meta-ID variant {}".format(variant))
+    return partial(
+        meta_ids_meta_fast, id_bits=id_bits, shinglesize=shinglesize, mode=variant
+    )
+
+
+def rates(stats):
+    """Evaluation rates of the result statistics.
+
+    tp / fp: share of Meta-ID groups with one / more than one ISBN
+    fn: share of ISBN groups split over more than one Meta-ID
+    """
+    mid_groups, isbn_groups = stats["mid_groups"], stats["isbn_groups"]
+    tp = stats["same_isbn"] / mid_groups if mid_groups else 0.0
+    fn = 1.0 - stats["same_mid"] / isbn_groups if isbn_groups else 0.0
+    return dict(tp=tp, fp=1.0 - tp if mid_groups else 0.0, fn=fn)
+
+
+def write_collisions(collision_mids, collision_isbns):
+    with open(COLLISION_MID, "w") as collision_file:
+        collision_file.write("\n".join(collision_mids))
+    with open(COLLISION_ISBN, "w") as collision_file:
+        collision_file.write("\n".join(collision_isbns))
+
+
+class Backend(ABC):
+    """Interface of a storage backend for the Meta-ID benchmark"""
+
+    name = None
+
+    @abstractmethod
+    def reset_data(self):
+        """Delete all loaded meta data"""
+
+    @abstractmethod
+    def load(self, reader):
+        """Store all entries of a reader, returns (success, failed)"""
+
+    @abstractmethod
+    def build(
+        self, id_bits, shinglesize, workers=None, batch_size=1000, variant="iscclib"
+    ):
+        """Generate Meta-IDs for all stored meta data and open a result row.
+
+        Meta-IDs of the given variant (see `VARIANTS`) are computed in batches
+        of batch_size by a pool of workers processes (None: all cpus, 0: inline).
+        """
+
+    @abstractmethod
+    def evaluate(self):
+        """Fill the open result row with the evaluation statistics"""
+
+    @abstractmethod
+    def stats(self):
+        """Evaluation statistics of the stored meta data and Meta-IDs"""
+
+
+class ElasticBackend(Backend):
+    """Original pipeline on a live Elasticsearch"""
+
+    name = "elastic"
+
+    def reset_data(self):
+        from iscc_bench.elastic_search.new_index import new_data_index
+
+        new_data_index()
+
+    def load(self, reader):
+        from iscc_bench.elastic_search.fill_elasticsearch import populate_elastic
+
+        return populate_elastic(reader)
+
+    def build(
+        self, id_bits, shinglesize, workers=None, batch_size=1000, variant="iscclib"
+    ):
+        from iscc_bench.elastic_search.new_index import new_id_index
+        from iscc_bench.elastic_search.generate_meta_ids import generate_ids
+
+        new_id_index()
+        generate_ids(id_bits, shinglesize, workers, batch_size, variant)
+
+    def evaluate(self):
+        from iscc_bench.elastic_search.evaluate import evaluate
+
+        evaluate()
+
+    def stats(self):
+        from elasticsearch import Elasticsearch
+        from iscc_bench.elastic_search.columns import evaluate_index
+
+        return evaluate_index(Elasticsearch())
+
+
+class SqliteBackend(Backend):
+    """Embedded SQLite store with the same load, build and evaluate semantics"""
+
+    name = "sqlite"
+
+    def __init__(self, path=SQLITE_FILE, meta_id_func=meta_id_iscclib):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.meta_id_func = meta_id_func
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA cache_size=-262144")  # 256 MB
+        self.db.executescript(SCHEMA)
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(result)")]
+        if "variant" not in columns:  # database created before Meta-ID variants
+            self.db.execute("ALTER TABLE result ADD COLUMN variant TEXT")
+
+    def close(self):
+        self.db.close()
+
+    def _insert(self, sql, rows):
+        """Insert rows in batched transactions, returns number of rows"""
+        total = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == BATCH_SIZE:
+                with self.db:
+                    self.db.executemany(sql, batch)
+                total += len(batch)
+                batch.clear()
+        with self.db:
+            self.db.executemany(sql, batch)
+        return total + len(batch)
+
+    def reset_data(self):
+        with self.db:
+            self.db.execute("DELETE FROM meta_data")
+
+    def load(self, reader):
+        rows = (
+            (entry.key, entry.isbn, entry.title, entry.author, reader.__name__)
+            for entry in reader()
+        )
+        success = self._insert(
+            "INSERT OR REPLACE INTO meta_data VALUES (?, ?, ?, ?, ?)", rows
+        )
+        print("Successful: {}".format(success))
+        print("Failed: {}".format(0))
+        return success, 0
+
+    def build(
+        self, id_bits, shinglesize, workers=None, batch_size=1000, variant="iscclib"
+    ):
+        with self.db:
+            self.db.execute("DELETE FROM meta_id")
+        # Separate connection, the main one commits while the scan is open and
+        # the scan runs in the pipeline reader thread
+        reader = sqlite3.connect(self.path, check_same_thread=False)
+        entries = reader.execute("SELECT id, title, creator FROM meta_data")
+        func = variant_func(variant, id_bits, shinglesize, self.meta_id_func)
+        stats = PipelineStats()
+        rows = (
+            ("meta_{}".format(id), mid, id)
+            for id, mid in batch_pipeline(entries, func, workers, batch_size, stats=stats)
+        )
+        success = self._insert("INSERT OR REPLACE INTO meta_id VALUES (?, ?, ?)", rows)
+        reader.close()
+        print("Successful: {}".format(success))
+        print("Failed: {}".format(0))
+        stats.report()
+        with self.db:
+            self.db.execute("DELETE FROM result WHERE total IS NULL")
+            self.db.execute(
+                "INSERT INTO result (bit_length, shingle_size, variant) "
+                "VALUES (?, ?, ?)",
+                (id_bits, shinglesize, variant),
+            )
+        return success, 0
+
+    def stats(self):
+        """Evaluation statistics of the stored meta data and Meta-IDs"""
+        total = self.db.execute("SELECT COUNT(*) FROM meta_data").fetchone()[0]
+        sources = dict(
+            self.db.execute("SELECT source, COUNT(*) FROM meta_data GROUP BY source")
+        )
+        positives = self.db.execute(POSITIVES).fetchall()
+        negatives = self.db.execute(NEGATIVES).fetchall()
+        return dict(
+            total=total,
+            entry_sources=sources,
+            mid_groups=len(positives),
+            same_isbn=sum(1 for mid, isbns in positives if isbns == 1),
+            isbn_groups=len(negatives),
+            same_mid=sum(1 for isbn, mids in negatives if mids == 1),
+            collision_meta_ids=[mid for mid, isbns in positives if isbns > 1],
+            collision_isbns=[isbn for isbn, mids in negatives if mids > 1],
+        )
+
+    def evaluate(self):
+        row = self.db.execute("SELECT id FROM result WHERE total IS NULL").fetchone()
+        if row is None:
+            print("ID´s already tested.")
+            return
+        stats = self.stats()
+        write_collisions(stats["collision_meta_ids"], stats["collision_isbns"])
+        with self.db:
+            self.db.execute(
+                "UPDATE result SET total=?, entry_sources=?, mid_groups=?, "
+                "same_isbn=?, isbn_groups=?, same_mid=? WHERE id=?",
+                (
+                    stats["total"],
+                    json.dumps(stats["entry_sources"]),
+                    stats["mid_groups"],
+                    stats["same_isbn"],
+                    stats["isbn_groups"],
+                    stats["same_mid"],
+                    row[0],
+                ),
+            )
+
+    def results(self):
+        """All finished evaluation results as dicts"""
+        cursor = self.db.execute("SELECT * FROM result WHERE total IS NOT NULL")
+        names = [d[0] for d in cursor.description]
+        return [dict(zip(names, row)) for row in cursor]
+
+
+BACKENDS = {b.name: b for b in (ElasticBackend, SqliteBackend)}
+
+
+def get_backend(name="elastic"):
+    return BACKENDS[name]()
+
+
+def test_sqlite_backend():
+    import random
+    import tempfile
+    from iscc_bench import MetaData
+    from iscc_bench.elastic_search.columns import evaluate_ref
+
+    rand = random.Random(11)
+
+    def fake_mid(title, creator, id_bits, shinglesize):
+        return "mid{}".format(int(title.split()[1]) % 700)
+
+    def make_reader(name, n):
+        def reader():
+            for i in range(n):
+                isbn = None if i % 50 == 0 else str(rand.randint(0, 900))
+                yield MetaData(isbn, "title {}".format(rand.randint(0, 5000)), name)
+
+        reader.__name__ = name
+        return reader
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SqliteBackend(os.path.join(tmp, "test.sqlite"), fake_mid)
+        for reader in (make_reader("bxbooks", 2000), make_reader("harvard", 2000)):
+            store.load(reader)
+        store.build(64, 4, workers=0)
+        stats = store.stats()
+        data = {
+            id: (isbn, source)
+            for id, isbn, source in store.db.execute(
+                "SELECT id, isbn, source FROM meta_data"
+            )
+        }
+        mids = list(store.db.execute("SELECT meta_id, meta_data FROM meta_id"))
+        for key, value in evaluate_ref(data, mids).items():
+            assert stats[key] == value, (key, stats[key], value)
+        assert stats["total"] == len(data)
+        rows = compare_variants(store, ["iscclib", "rolling"], workers=0)
+        assert rows[0][2] == stats["mid_groups"]
+        assert rows[1][2] == store.stats()["mid_groups"]
+        assert store.db.execute("SELECT COUNT(*) FROM result").fetchone()[0] == 1
+        store.close()
+
+
+def benchmark_sqlite(n=1000000):
+    """Bulk load throughput of the SQLite backend"""
+    import tempfile
+    from iscc_bench import MetaData
+
+    def reader():
+        for i in range(n):
+            yield MetaData(str(9780000000000 + i), "title {}".format(i), "author")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SqliteBackend(os.path.join(tmp, "bench.sqlite"))
+        start = time.time()
+        store.load(reader)
+        rt = time.time() - start
+        store.close()
+    print(f"sqlite load: {n / rt:.0f} entries/s")
+
+
+def synthetic_catalogs(n=20000, seed=19):
+    """Two readers with the same works (same isbn) in differently styled records"""
+    import random
+    from iscc_bench import MetaData
+    from iscc_bench.scripts.meta_fast import synthetic_records
+
+    rand = random.Random(seed)
+    titles, creators = synthetic_records(n, seed)
+    styles = (
+        lambda t: t,
+        lambda t: t.upper(),
+        lambda t: t + ": A Novel",
+        lambda t: t + " (Reprint)",
+        lambda t: "  " + t.replace(" ", "  ") + ".",
+        lambda t: t + " Vol",
+    )
+
+    def make_reader(name, styled):
+        def reader():
+            for i, (title, creator) in enumerate(zip(titles, creators)):
+                if styled:
+                    title = rand.choice(styles)(title)
+                yield MetaData(str(9780000000000 + i), title, creator)
+
+        reader.__name__ = name
+        return reader
+
+    return make_reader("bxbooks", False), make_reader("harvard", True)
+
+
+def compare_variants(
+    store, variants=VARIANTS, id_bits=64, shinglesize=4, workers=None
+):
+    """Build speed and evaluation rates of Meta-ID variants on a backend.
+
+    Every variant is built over all meta data of the store and evaluated
+    without a result row. The store keeps the Meta-IDs of the last variant.
+
+    :return: rows of variant, build records/s, mid groups, tp, fp, fn
+    """
+    rows = []
+    for variant in variants:
+        start = time.time()
+        store.build(id_bits, shinglesize, workers=workers, variant=variant)
+        rt = time.time() - start
+        stats = store.stats()
+        r = rates(stats)
+        rows.append(
+            [variant, stats["total"] / rt, stats["mid_groups"], r["tp"], r["fp"], r["fn"]]
+        )
+    return rows
+
+
+def print_variants(rows):
+    from tabulate import tabulate
+
+    headers = ["Variant", "Build records/s", "Mid groups", "TP", "FP", "FN"]
+    print(tabulate(rows, headers=headers, floatfmt=".3f"))
+
+
+def benchmark_variants(variants=VARIANTS[1:], n=20000, readers=None, workers=0):
+    """Speed and evaluation rates of Meta-ID variants on synthetic catalogs"""
+    import tempfile
+
+    readers = readers or synthetic_catalogs(n)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SqliteBackend(os.path.join(tmp, "variants.sqlite"))
+        for reader in readers:
+            store.load(reader)
+        rows = compare_variants(store, variants, workers=workers)
+        store.close()
+    print_variants(rows)
+    return rows
+
+
+if __name__ == "__main__":
+    test_sqlite_backend()
+    benchmark_sqlite()
+    benchmark_variants()
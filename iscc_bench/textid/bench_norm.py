@@ -1,11 +1,18 @@
 # -*- coding: utf-8 -*-
 """Benchmark Text Normalization"""
+import subprocess
+import sys
 import time
 from statistics import mean
 import unicodedata
 import iscc
 from iscc_bench.readers.gutenberg import gutenberg
-from iscc_bench.textid.normalize import text_normalize, text_normalize_simple
+from iscc_bench.textid import normalize
+from iscc_bench.textid.normalize import (
+    text_normalize,
+    text_normalize_simple,
+    text_normalize_translate,
+)
 
 REMOVE_WHITESPACE = False
 REMOVE_ACCENTS = False
@@ -21,12 +28,16 @@ def benchmark(norm_func=iscc.text_normalize):
     rts_chr = []  # Runtimes per character
     ratios = []  # Size reduction ratios
     samples = []
+    total_chars = 0
+    total_time = 0
     for fp in fps:
         with open(fp, "r", encoding="utf-8") as infile:
             text = infile.read()
         start = time.time()
         text_norm = norm_func(text)
         end = time.time()
+        total_chars += len(text)
+        total_time += end - start
 
         rabs = (end - start) * 1000.0
         rts_abs.append(rabs)
@@ -47,6 +58,48 @@ def benchmark(norm_func=iscc.text_normalize):
     print(
         f"Size Ratio:       Avg {mean(ratios):.5f} - Min {min(ratios):.5f} - Max {max(ratios):.5f}"
     )
+    print(f"Throughput:       {total_chars / total_time / 1e6:.2f} M chars/s")
+    return samples
+
+
+def import_time(module="iscc_bench.textid.normalize", runs=5):
+    """Best wall time (ms) to import a module in a fresh interpreter"""
+    code = (
+        "import time; start = time.perf_counter(); import {}; "
+        "print((time.perf_counter() - start) * 1000)".format(module)
+    )
+    times = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True)
+        times.append(float(out.stdout))
+    return min(times)
+
+
+def benchmark_import():
+    """Compare the setup cost of the translate table and the fused tables"""
+    base = import_time("numpy, iscc_bench")
+    print(f"Import normalize:       {import_time() - base:.2f} ms (excl. numpy)")
+    start = time.time()
+    normalize.tr_table.cache_clear()
+    normalize.tr_table()
+    print(f"Build TR_TABLE:         {(time.time() - start) * 1000:.2f} ms")
+    start = time.time()
+    normalize.build_tables()
+    print(f"Build compact tables:   {(time.time() - start) * 1000:.2f} ms (once)")
+    normalize.norm_table.cache_clear()
+    start = time.time()
+    normalize.norm_table()
+    print(f"Load persisted tables:  {(time.time() - start) * 1000:.2f} ms")
+
+
+def compare():
+    """Throughput of the translate path against the fused table path"""
+    benchmark_import()
+    print("\n\nCurrent path (strip, lower, NFD, translate, split & join)\n")
+    reference = benchmark(text_normalize_translate)
+    print("\n\nFused table path\n")
+    fused = benchmark(text_normalize)
+    assert reference == fused
 
 
 def whitespace_norm(text):
@@ -102,4 +155,4 @@ if __name__ == "__main__":
     benchmark(text_normalize_simple)
 
     print("\n\nNew text normalization (v.1.1). Performance optimized implementation \n")
-    benchmark(text_normalize)
+    compare()
@@ -1,6 +1,24 @@
 # -*- coding: utf-8 -*-
-"""Text normalization"""
+"""Text normalization
+
+`text_normalize` maps the NFD code points of the text through one precomputed
+table that lowercases, filters (0) and normalizes whitespace (0x20) in a
+single gather, followed by a whitespace collapse on the mapped array. The table
+is built from a compact persisted form (bitset of filtered code points,
+lowercase exceptions and whitespace list) that ships with the package in
+`PACKAGE_TABLES_DIR` and is otherwise computed once per unicode version and
+filter set and stored in `TABLES_DIR`.
+
+`text_normalize_translate` is the previous implementation (strip, lower, NFD,
+translate with `TR_TABLE`, split & join). `TR_TABLE` is built on first use.
+"""
+import copy
+import hashlib
+import os
 import unicodedata
+from functools import lru_cache
+import numpy as np
+from iscc_bench import DATA_DIR
 from iscc_bench.textid.const import UNICODE_RANGES
 
 NFORM = "NFD"  # Unicode Normalization form
@@ -41,13 +59,301 @@ def blacklist(filtr=FILTR):
     return [c for c in chars() if unicodedata.category(c) in filtr]
 
 
-TR_TABLE = str.maketrans(dict.fromkeys(blacklist()))
+@lru_cache(maxsize=1)
+def tr_table():
+    return str.maketrans(dict.fromkeys(blacklist()))
+
+
+def __getattr__(name):
+    if name == "TR_TABLE":
+        return tr_table()
+    raise AttributeError(name)
+
+
+###############################################################################
+# Precomputed tables                                                          #
+###############################################################################
+
+N_CODEPOINTS = 0x110000
+SPACE = 0x20
+FINAL_SIGMA = "\u03a3"  # lowercase depends on context (handled by str.lower)
+TABLES_DIR = os.path.join(DATA_DIR, "tables")
+PACKAGE_TABLES_DIR = os.path.join(os.path.dirname(__file__), "tables")
+
+
+def tables_file(filtr=FILTR, path=TABLES_DIR):
+    """Table file name for the unicode version and filter set"""
+    key = hashlib.sha1(",".join(sorted(filtr)).encode("ascii")).hexdigest()[:8]
+    name = f"norm_{unicodedata.unidata_version}_{key}.npz"
+    return os.path.join(path, name)
+
+
+def build_tables(filtr=FILTR):
+    """Compact normalization tables.
+
+    :return: dict with `filtered` (packed bitset), `lower_src`/`lower_dst`
+        (single code point lowercase exceptions), `spaces` (whitespace code
+        points) and `expand` (code points with multi character lowercase)
+    """
+    filtered = np.zeros(N_CODEPOINTS, dtype=bool)
+    for c in blacklist(filtr):
+        filtered[ord(c)] = True
+    lower_src, lower_dst, expand = [], [], []
+    for cp in range(N_CODEPOINTS):
+        low = chr(cp).lower()
+        if len(low) > 1:
+            expand.append(cp)
+        elif low != chr(cp):
+            lower_src.append(cp)
+            lower_dst.append(ord(low))
+    spaces = [cp for cp in range(N_CODEPOINTS) if chr(cp).isspace()]
+    return dict(
+        filtered=np.packbits(filtered),
+        lower_src=np.array(lower_src, dtype=np.uint32),
+        lower_dst=np.array(lower_dst, dtype=np.uint32),
+        spaces=np.array(spaces, dtype=np.uint32),
+        expand=np.array(expand, dtype=np.uint32),
+    )
+
+
+def load_tables(filtr=FILTR):
+    """Load shipped or persisted compact tables (build and store if missing)"""
+    for path in (PACKAGE_TABLES_DIR, TABLES_DIR):
+        try:
+            with np.load(tables_file(filtr, path)) as data:
+                return {k: data[k] for k in data.files}
+        except (OSError, ValueError):
+            pass
+    tables = build_tables(filtr)
+    try:
+        save_tables(tables, filtr)
+    except OSError:
+        pass  # read-only data dir, tables stay in memory
+    return tables
+
+
+def save_tables(tables, filtr=FILTR, path=TABLES_DIR):
+    """Store compact tables (use `PACKAGE_TABLES_DIR` to ship a new version)"""
+    os.makedirs(path, exist_ok=True)
+    fp = tables_file(filtr, path)
+    tmp = fp + ".tmp.npz"
+    np.savez_compressed(tmp, **tables)
+    os.replace(tmp, fp)
+    return fp
+
+
+@lru_cache(maxsize=4)
+def norm_table(filtr=FILTR):
+    """Dense uint32 table: code point -> lowercase, 0 (filtered) or 0x20 (space)
+
+    :return: (table, expansions) where expansions maps characters with multi
+        character lowercase to their NFD lowercase form
+    """
+    tables = load_tables(filtr)
+    table = np.arange(N_CODEPOINTS, dtype=np.uint32)
+    table[tables["lower_src"]] = tables["lower_dst"]
+    filtered = np.unpackbits(tables["filtered"])[:N_CODEPOINTS].astype(bool)
+    space = np.zeros(N_CODEPOINTS, dtype=bool)
+    space[tables["spaces"]] = True
+    lowered = table.copy()
+    table[space[lowered]] = SPACE
+    table[filtered[lowered]] = 0
+    expansions = {
+        chr(cp): unicodedata.normalize(NFORM, chr(cp).lower())
+        for cp in tables["expand"].tolist()
+    }
+    return table, expansions
+
+
+###############################################################################
+# Fused normalization                                                         #
+###############################################################################
+
+
+def _prepare(text, expansions):
+    """Handle the few context dependent / expanding lowercase mappings"""
+    if FINAL_SIGMA in text:
+        text = text.lower()
+    for char, replacement in expansions.items():
+        if char in text:
+            text = text.replace(char, replacement)
+    return text
+
+
+def _mapped(text, filtr=FILTR):
+    """NFD code points mapped through the normalization table"""
+    table, expansions = norm_table(filtr)
+    text = unicodedata.normalize(NFORM, _prepare(text, expansions))
+    cps = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    return table[cps]
+
+
+def _decode(cps):
+    return cps.tobytes().decode("utf-32-le", "surrogatepass")
+
+
+def _collapse(mapped, leading_space=False):
+    """Collapse whitespace runs of mapped (nonzero) code points to one space.
+
+    A space is kept only if it follows a non space character, so leading
+    whitespace is dropped unless `leading_space` (a previous chunk ended with
+    text). Trailing whitespace is kept as a single space.
+    """
+    is_space = mapped == SPACE
+    prev_space = np.empty_like(is_space)
+    if len(is_space):
+        prev_space[0] = not leading_space
+        prev_space[1:] = is_space[:-1]
+    return mapped[~(is_space & prev_space)]
 
 
 def text_normalize(text: str, keep_ws: bool = False) -> str:
+    mapped = _mapped(text)
+    if not keep_ws:
+        return _decode(mapped[mapped > SPACE])
+    out = _collapse(mapped[mapped != 0])
+    if len(out) and out[-1] == SPACE:
+        out = out[:-1]
+    return _decode(out)
+
+
+class Normalizer:
+    """Incremental `text_normalize` over text chunks.
+
+    Whitespace runs spanning chunk boundaries are collapsed across chunks.
+    Chunks must be split outside of combining character sequences and not
+    directly after a capital sigma (see `StreamNormalizer` for arbitrary
+    chunks).
+    """
+
+    def __init__(self, keep_ws=False):
+        self.keep_ws = keep_ws
+        self.started = False  # any non space output so far
+        self.space = False  # pending space from the previous chunk
+
+    def update(self, chunk):
+        mapped = _mapped(chunk)
+        if not self.keep_ws:
+            return _decode(mapped[mapped > SPACE])
+        mapped = mapped[mapped != 0]
+        out = _collapse(mapped, leading_space=self.started and not self.space)
+        if len(out):
+            if self.space and out[0] != SPACE:
+                out = np.concatenate((np.array([SPACE], np.uint32), out))
+            # Hold back a trailing space until more text follows
+            self.space = bool(out[-1] == SPACE)
+            if self.space:
+                out = out[:-1]
+        self.started = self.started or bool(len(out))
+        return _decode(out)
+
+
+def normalize_chunks(chunks, keep_ws=False):
+    """Yield normalized text for each chunk of an iterable of text chunks"""
+    normalizer = Normalizer(keep_ws)
+    for chunk in chunks:
+        yield normalizer.update(chunk)
+
+
+###############################################################################
+# Streaming normalization of arbitrary chunks                                 #
+###############################################################################
+
+# Characters at which raw text can be cut without changing text_normalize output
+# (no combining sequence and no final sigma context spans the cut).
+SAFE_CUT_CATEGORIES = frozenset({"Lu", "Ll", "Lt", "Lo", "Nd"})
+MAX_PENDING = 1024 * 1024  # force a cut if no safe position is found
+
+
+def safe_cut_char(c):
+    if c.isspace():
+        return True
+    return c != FINAL_SIGMA and unicodedata.category(c) in SAFE_CUT_CATEGORIES
+
+
+def safe_cut(text, lower=1):
+    """Last position >= lower where text can be cut between two safe chars.
+
+    :return: cut position or 0 if there is none
+    """
+    cut = len(text) - 1
+    while cut >= lower and not (
+        safe_cut_char(text[cut]) and safe_cut_char(text[cut - 1])
+    ):
+        cut -= 1
+    return cut if cut >= lower else 0
+
+
+def _starter_cut(text):
+    """Last position before a starter (no combining sequence spans the cut)"""
+    for cut in range(len(text) - 1, 0, -1):
+        if (
+            not unicodedata.combining(text[cut])
+            and FINAL_SIGMA not in text[cut - 1 : cut + 1]
+        ):
+            return cut
+    return len(text)
+
+
+class StreamNormalizer:
+    """`text_normalize` over arbitrary chunks of raw text.
+
+    Raw text after the last safe cut position is held back until more text
+    arrives, so combining character sequences, final sigma contexts and
+    whitespace runs that span chunk boundaries are normalized as in the whole
+    text. The held back text is bounded by `max_pending` characters (beyond
+    that it is cut before the last starter character).
+    """
+
+    def __init__(self, keep_ws=False, max_pending=MAX_PENDING):
+        self.normalizer = Normalizer(keep_ws)
+        self.max_pending = max_pending
+        self.pending = ""  # raw text not yet normalized
+
+    def update(self, chunk):
+        """Normalize chunk, returns the normalized text that is final so far"""
+        text = self.pending + chunk
+        # pending has no safe cut position (except at its very start)
+        cut = safe_cut(text, max(len(self.pending), 1))
+        if not cut:
+            if len(text) <= self.max_pending:
+                self.pending = text
+                return ""
+            cut = _starter_cut(text)
+        self.pending = text[cut:]
+        return self.normalizer.update(text[:cut])
+
+    def preview(self):
+        """Normalized held back text (without consuming it)"""
+        return copy.copy(self.normalizer).update(self.pending)
+
+    def flush(self):
+        """Normalize and return the held back text"""
+        out = self.normalizer.update(self.pending)
+        self.pending = ""
+        return out
+
+
+def iter_normalize(chunks, keep_ws=False, max_pending=MAX_PENDING):
+    """Yield normalized text from an iterable of raw text chunks.
+
+    Equivalent to `text_normalize("".join(chunks), keep_ws)` with memory
+    bounded by the chunk size (plus held back text).
+    """
+    normalizer = StreamNormalizer(keep_ws, max_pending)
+    for chunk in chunks:
+        out = normalizer.update(chunk)
+        if out:
+            yield out
+    out = normalizer.flush()
+    if out:
+        yield out
+
+
+def text_normalize_translate(text: str, keep_ws: bool = False) -> str:
     text = text.strip().lower()
     text = unicodedata.normalize(NFORM, text)
-    text = text.translate(TR_TABLE)
+    text = text.translate(tr_table())
 
     if keep_ws:
         text = " ".join(text.split())
@@ -87,8 +393,38 @@ Optional remove all whitespace
 """
 
 
+def test_text_normalize():
+    import random
+
+    rand = random.Random(15)
+    specials = list("aΣσİ \n\t\u00a0\u0308\u0323-") + ["\ud800", "💩"]
+    for _ in range(2000):
+        text = "".join(
+            (
+                chr(rand.randrange(N_CODEPOINTS))
+                if rand.random() < 0.3
+                else rand.choice(specials)
+            )
+            for _ in range(rand.randint(0, 50))
+        )
+        for keep_ws in (False, True):
+            expected = text_normalize_translate(text, keep_ws)
+            assert text_normalize(text, keep_ws) == expected
+            # chunks split on whitespace are safe boundaries
+            chunks = [c + " " for c in text.split(" ")]
+            chunks[-1] = chunks[-1][:-1]
+            assert "".join(normalize_chunks(chunks, keep_ws)) == expected
+            # arbitrary chunks
+            cuts = sorted(rand.randint(0, len(text)) for _ in range(4))
+            chunks = [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+            assert "".join(iter_normalize(chunks, keep_ws)) == expected
+            chunks = [text[i : i + 1] for i in range(len(text))]
+            assert "".join(iter_normalize(chunks, keep_ws)) == expected
+
+
 if __name__ == "__main__":
-    text = "  Iñtërnâtiôn\nàlizætiøn☃💩 –  is a tric\t ky \u00A0 thing!\r"
+    test_text_normalize()
+    text = "  Iñtërnâtiôn\nàlizætiøn☃💩 –  is a tric\t ky \u00a0 thing!\r"
 
     norm = text_normalize(text, keep_ws=False)
     norms = text_normalize_simple(text, keep_ws=False)
@@ -22,8 +22,11 @@ filter_ws_stream4 function took 834.768 ms
 """
 import unicodedata
 from iscc_bench.readers.gutenberg import gutenberg
+from iscc_bench.textid.normalize import iter_normalize, text_normalize
 from iscc_bench.utils import timing
 
+CHUNK_SIZE = 64 * 1024
+
 whitespace = {
     "\u0009",
     "\u000A",
@@ -149,6 +152,26 @@ def norm_nfkd():
     print(f"Normalized character count {sum(tl)}")
 
 
+@timing
+def norm_text_whole():
+    tl = []
+    for fp in list(gutenberg()):
+        text = open(fp, "r", encoding="utf-8").read()
+        tl.append(len(text_normalize(text)))
+    print(f"Normalized character count {sum(tl)}")
+
+
+@timing
+def norm_text_stream():
+    """Chunked text_normalize with memory bounded by CHUNK_SIZE"""
+    tl = []
+    for fp in list(gutenberg()):
+        with open(fp, "r", encoding="utf-8") as stream:
+            chunks = iter(lambda: stream.read(CHUNK_SIZE), "")
+            tl.append(sum(len(c) for c in iter_normalize(chunks)))
+    print(f"Normalized character count {sum(tl)}")
+
+
 if __name__ == "__main__":
     norm_nfc()
     norm_nfd()
@@ -158,3 +181,5 @@ if __name__ == "__main__":
     filter_ws_stream2()
     filter_ws_stream3()
     filter_ws_stream4()
+    norm_text_whole()
+    norm_text_stream()
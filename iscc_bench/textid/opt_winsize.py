@@ -16,6 +16,7 @@ Loss @ wsize 13: Mean 0.00048059458498185445 - Min 0.0001 - Max 0.015625
 Loss @ wsize 14: Mean 0.00204982670505105 - Min 0.0001 - Max 0.017543859649122806
 """
 from iscc_bench.algos.metrics import containment
+from iscc_bench.cache import cached
 from iscc_bench.algos.slide import sliding_window
 from iscc_bench.readers.mltext import mltext
 from iscc_bench.textid.normalize import text_normalize
@@ -26,16 +27,23 @@ from statistics import mean
 WINDOW_SIZES = range(3, 40)
 
 
+@cached("text_normalized")
+def normalized_text(fp):
+    return text_normalize(load_text_file(fp))
+
+
+@cached("minhash_text")
+def text_minhash(fp, ws):
+    return minimum_hash_text(normalized_text(fp), ws)
+
+
 def test_with(ws=13, dataset=mltext, n_samples=100000):
     fps = list(dataset())[:n_samples]
     losses = []
     for a, b, c in sliding_window(fps, 3, 2, fillvalue=None):
         if c is None:
             continue
-        ta, tb, tc = load_text_file(a), load_text_file(b), load_text_file(c)
-        mha = minimum_hash_text(text_normalize(ta), ws)
-        mhb = minimum_hash_text(text_normalize(tb), ws)
-        mhc = minimum_hash_text(text_normalize(tc), ws)
+        mha, mhb, mhc = text_minhash(a, ws), text_minhash(b, ws), text_minhash(c, ws)
         sim = containment(mha, mhb)
         dis = containment(mha, mhc)
         loss = (dis or 0.0001) / (sim or 0.0001)
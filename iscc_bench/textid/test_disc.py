@@ -2,8 +2,9 @@
 """Benchmark Text-ID for discriminative quality"""
 import logging
 import time
-import iscc
 from statistics import mean
+from iscc_bench.algos.hamming import decode_codes, paired_distances
+from iscc_bench.cache import cached
 from iscc_bench.algos.slide import sliding_window
 from iscc_bench.readers.gutenberg import gutenberg
 from os.path import basename
@@ -13,45 +14,67 @@ from iscc_bench.utils import load_text_file
 logr = logging.getLogger(__name__)
 
 
-def benchmark():
+@cached("content_id_text", version=1)
+def cached_content_id(fp):
+    """Content-ID-Text of a text file"""
+    return textid.content_id_text(load_text_file(fp))
+
+
+def timed_content_id(fp):
+    """(Content-ID-Text, runtime in ms, number of characters) of a text file"""
+    text = load_text_file(fp)
+    start = time.time()
+    cid = textid.content_id_text(text)
+    end = time.time()
+    return cid, (end - start) * 1000.0, len(text)
+
+
+def benchmark(cache=False):
+    """Discriminative quality and runtimes of Content-ID-Text on gutenberg.
+
+    :param bool cache: reuse Content-IDs of earlier runs and skip the runtimes
+        (bump the version of `cached_content_id` when textid changes its results)
+    """
     fps = list(gutenberg())
     cids = []  # Content IDs
     rts_abs = []  # Absolute runtimes
     rts_chr = []  # Runtimes per character
-    matches = []
-    sims = []
-    diss = []
-    losses = []
+    names = []
     for a, b, c in sliding_window(fps, 3, 2, fillvalue=None):
         if c is None:
             continue
-        ta, tb, tc = load_text_file(a), load_text_file(b), load_text_file(c)
-        for t in (ta, tb, tc):
-            start = time.time()
-            cid = textid.content_id_text(t)
-            end = time.time()
+        for fp in (a, b, c):
+            if cache:
+                cids.append(cached_content_id(fp))
+                continue
+            cid, rabs, chars = timed_content_id(fp)
 
             cids.append(cid)
-            rabs = (end - start) * 1000.0
             rts_abs.append(rabs)
-            rchar = rabs / len(t)
+            rchar = rabs / chars
             rts_chr.append(rchar)
 
-        matches.append(cids[-3] == cids[-2])
-        sim_sim = iscc.distance(cids[-3], cids[-2])
-        sim_dif = iscc.distance(cids[-3], cids[-1])
-        sims.append(sim_sim)
-        diss.append(sim_dif)
+        names.append(basename(a))
+
+    codes = decode_codes(cids).reshape(-1, 3)
+    matches = (codes[:, 0] == codes[:, 1]).tolist()
+    sims = paired_distances(codes[:, 0], codes[:, 1]).tolist()
+    diss = paired_distances(codes[:, 0], codes[:, 2]).tolist()
+    losses = []
+    for name, sim_sim, sim_dif in zip(names, sims, diss):
         loss = sim_sim / (sim_dif or 0.00001)
         losses.append(loss)
-        logr.debug(f"Loss: {loss:.8f} Sim: {sim_sim} Dif: {sim_dif} ({basename(a)})")
+        logr.debug(f"Loss: {loss:.8f} Sim: {sim_sim} Dif: {sim_dif} ({name})")
 
-    print(
-        f"Runtime Absolute: Avg {mean(rts_abs):.5f} - Min {min(rts_abs):.5f} - Max {max(rts_abs):.5f}"
-    )
-    print(
-        f"Runtime / Char:   Avg {mean(rts_chr):.5f} - Min {min(rts_chr):.5f} - Max {max(rts_chr):.5f}"
-    )
+    if rts_abs:
+        print(
+            f"Runtime Absolute: Avg {mean(rts_abs):.5f} - Min {min(rts_abs):.5f} - Max {max(rts_abs):.5f}"
+        )
+        print(
+            f"Runtime / Char:   Avg {mean(rts_chr):.5f} - Min {min(rts_chr):.5f} - Max {max(rts_chr):.5f}"
+        )
+    else:
+        print("Runtimes: not measured (cached Content-IDs)")
     print(f"Matches {matches.count(True)} - Non-Matches {matches.count(False)}")
     print(
         f"Similarities:     Avg {mean(sims):.5f} - Min {min(sims):.5f} - Max {max(sims):.5f}"
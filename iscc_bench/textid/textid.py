@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 from xxhash import xxh64_intdigest
 
+from iscc_bench.algos.ngrams import ngram_features
+from iscc_bench.algos.simhash import simhash_int64
 from iscc_bench.algos.slide import sliding_window
-from iscc_bench.textid.normalize import text_normalize
+from iscc_bench.textid.normalize import StreamNormalizer, text_normalize
 import numpy as np
 
 R = np.random.RandomState(seed=74)
@@ -157,15 +159,26 @@ def content_id_text(text, partial=False):
 
     text = text_normalize(text)
 
-    shingles = ("".join(s) for s in sliding_window(text, WINDOW_SIZE_CID_T, 1))
-
-    # 5. Create 32-bit features with xxHash32
-    features = [xxh64_intdigest(s.encode("utf8")) for s in shingles]
+    # 5. Create 64-bit features with xxHash64 over all shingles
+    features = ngram_features(text, WINDOW_SIZE_CID_T, "xxh64")
 
     # 6. Apply minimum_hash
 
     minhash = minimum_hash(features)
 
+    return minhash_to_code(minhash, partial)
+
+
+def content_id_text_stream(chunks, partial=False):
+    """Streaming Content-ID-Text from an iterable of raw text chunks."""
+    hasher = MinHasher(WINDOW_SIZE_CID_T)
+    for chunk in chunks:
+        hasher.update(chunk)
+    return minhash_to_code(hasher.digest(), partial)
+
+
+def minhash_to_code(minhash, partial=False):
+
     # # 7. Collect least significant bits
     lsb = "".join([str(x & 1) for x in minhash])
 
@@ -181,16 +194,25 @@ def content_id_text(text, partial=False):
     return encode(content_id_text_digest)
 
 
+#: Number of features hashed per vectorized minhash step
+MINHASH_BLOCK_SIZE = 4096
+
+
 def minimum_hash(features):
 
     hashes = np.empty(64, dtype=np.uint64)
     hashes.fill(2 ** 64 - 1)
-
-    for f in features:
-        hashes = np.minimum(hashes, np.bitwise_xor(MASKS, f))
+    minimum_hash_update(hashes, np.asarray(features, dtype=np.uint64))
     return hashes.tolist()
 
 
+def minimum_hash_update(hashes, features):
+    """Update minhash vector in place with a uint64 feature array"""
+    for i in range(0, len(features), MINHASH_BLOCK_SIZE):
+        block = features[i : i + MINHASH_BLOCK_SIZE]
+        np.minimum(hashes, np.bitwise_xor.outer(block, MASKS).min(axis=0), out=hashes)
+
+
 def minimum_hash_text(text, w=13):
     chunks = ("".join(c) for c in sliding_window(text, w))
     features = (xxh64_intdigest(s.encode("utf8")) for s in chunks)
@@ -202,25 +224,55 @@ def minimum_hash_text(text, w=13):
     return hashes.tolist()
 
 
-def similarity_hash(hash_digests):
-
-    n_bytes = 8
-    n_bits = 64
-    vector = [0] * n_bits
-
-    for h in hash_digests:
+class MinHasher:
+    """Incremental minimum_hash_text over chunks of raw text.
+
+    Feeding a text in arbitrary chunks via `update` gives the same `digest` as
+    `minimum_hash_text(text_normalize(text), w)` with constant memory. Raw text
+    is normalized by a `StreamNormalizer` and the last w - 1 normalized
+    characters are kept as window overlap.
+
+    Texts that normalize to less than w characters are hashed as one feature.
+    """
+
+    def __init__(self, w=13, normalize=True):
+        self.w = w
+        self.normalize = normalize
+        self.hashes = np.full(64, 2 ** 64 - 1, dtype=np.uint64)
+        self.normalizer = StreamNormalizer() if normalize else None
+        self.tail = ""  # last w - 1 normalized characters
+        self.n_features = 0
+
+    def update(self, chunk):
+        if self.normalizer is not None:
+            chunk = self.normalizer.update(chunk)
+        self._update_normalized(chunk)
+
+    def _update_normalized(self, text):
+        text = self.tail + text
+        w = self.w
+        n_windows = len(text) - w + 1
+        if n_windows <= 0:
+            self.tail = text
+            return
+        minimum_hash_update(self.hashes, ngram_features(text, w, "xxh64"))
+        self.n_features += n_windows
+        self.tail = text[n_windows:]
+
+    def digest(self):
+        """Minimum hash of all text fed so far (does not reset state)"""
+        hashes = self.hashes.copy()
+        tail = self.tail
+        if self.normalizer is not None:
+            tail += self.normalizer.preview()
+        if len(tail) >= self.w or (tail and not self.n_features):
+            minimum_hash_update(hashes, ngram_features(tail, self.w, "xxh64"))
+        return hashes.tolist()
 
-        for i in range(n_bits):
-            vector[i] += h & 1
-            h >>= 1
 
-    minfeatures = len(hash_digests) * 1.0 / 2
-    shash = 0
-
-    for i in range(n_bits):
-        shash |= int(vector[i] >= minfeatures) << i
-
-    return shash.to_bytes(n_bytes, "big", signed=False)
+def similarity_hash(hash_digests):
+    """Simhash of 64-bit integer features as 8 bytes"""
+    return simhash_int64(hash_digests)
 
 
 def encode(digest):
@@ -243,5 +295,18 @@ def encode(digest):
     return str.translate("".join([chr(c) for c in reversed(chars)]), V2CTABLE)
 
 
+def test_min_hasher():
+    text = "  Iñtërnâtiôn\nàlizætiøn☃💩 –  is a tric\t ky \u00A0 thing! ΟΔΟΣ ΣΑΣ " * 50
+    expected = minimum_hash_text(text_normalize(text))
+    for size in (1, 2, 7, 13, 100, 4096):
+        hasher = MinHasher()
+        for i in range(0, len(text), size):
+            hasher.update(text[i : i + size])
+        assert hasher.digest() == expected, size
+    cid = content_id_text(text)
+    assert content_id_text_stream(text[i : i + 10] for i in range(0, len(text), 10)) == cid
+
+
 if __name__ == "__main__":
     print(content_id_text("Hello World"))
+    test_min_hasher()
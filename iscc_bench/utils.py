@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 import contextlib
 import io
+import mmap
 import os
+import stat
 import time
 from datetime import datetime
 from functools import lru_cache
@@ -41,6 +43,152 @@ def stream_binary(f):
         return f
 
 
+READ_SIZE = 1024 * 512
+
+
+def _fileno(f):
+    """File descriptor of a regular (mappable) file object or None"""
+    try:
+        fileno = f.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+    return fileno if stat.S_ISREG(os.fstat(fileno).st_mode) else None
+
+
+def is_stream(f):
+    """True for streams that can not be memory-mapped (text or non file streams)"""
+    if not hasattr(f, "read") or isinstance(f, io.BytesIO):
+        return False
+    return isinstance(f, io.TextIOBase) or _fileno(f) is None
+
+
+def _close_quietly(obj):
+    # Consumers may still hold slices of the buffer, leave those to the GC.
+    try:
+        obj.release() if isinstance(obj, memoryview) else obj.close()
+    except BufferError:
+        pass
+
+
+@contextlib.contextmanager
+def map_file(f):
+    """
+    Read-only mmap of a local file path or file object.
+
+    File objects are mapped from their current position. Yields an object with
+    a stream interface (read/seek) positioned at the start of the data, so it
+    can be passed to functions that accept streams. Empty data yields an empty
+    BytesIO.
+    """
+    infile = open(f, "rb") if isinstance(f, str) else f
+    try:
+        start = infile.tell()
+        size = os.fstat(infile.fileno()).st_size
+        if size <= start:
+            yield io.BytesIO(b"")
+            return
+        offset = start - start % mmap.ALLOCATIONGRANULARITY
+        mm = mmap.mmap(
+            infile.fileno(), size - offset, offset=offset, access=mmap.ACCESS_READ
+        )
+        mm.seek(start - offset)
+        try:
+            yield mm
+        finally:
+            _close_quietly(mm)
+    finally:
+        if infile is not f:
+            infile.close()
+
+
+@contextlib.contextmanager
+def map_binary(f):
+    """
+    Zero-copy memoryview from a file path, file object or bytes-like object.
+
+    Files are memory-mapped and file objects or BytesIO viewed from their
+    current position. Streams that can not be mapped raise a TypeError, read
+    them with `iter_binary` or `iter_cuts`.
+    """
+    if is_stream(f):
+        raise TypeError("Can not map {}, use buffered reads".format(type(f).__name__))
+    if isinstance(f, io.BytesIO):
+        base = f.getbuffer()
+        view = base[f.tell() :]
+        try:
+            yield view
+        finally:
+            _close_quietly(view)
+            _close_quietly(base)
+    elif isinstance(f, str) or hasattr(f, "read"):
+        with map_file(f) as mm:
+            if isinstance(mm, io.BytesIO):
+                base = mm.getbuffer()
+                view = base
+            else:
+                base = memoryview(mm)
+                view = base[mm.tell() :]
+            try:
+                yield view
+            finally:
+                _close_quietly(view)
+                _close_quietly(base)
+    else:
+        yield memoryview(f).cast("B")
+
+
+def iter_binary(f, chunksize=READ_SIZE):
+    """
+    Iterate over memoryview chunks of a file path, bytes-like object or stream.
+
+    Local files and in memory data are sliced without copying, other streams
+    fall back to buffered reads of chunksize bytes from their current position.
+    """
+    if is_stream(f):
+        while True:
+            chunk = f.read(chunksize)
+            if not chunk:
+                break
+            yield memoryview(chunk)
+        return
+    with map_binary(f) as data:
+        for i in range(0, len(data), chunksize):
+            yield data[i : i + chunksize]
+
+
+def iter_cuts(data, cut, size, chunksize=READ_SIZE):
+    """
+    Iterate over consecutive chunks of a sequence or a text / binary stream.
+
+    `cut(section)` returns the length of the chunk at the start of a section of
+    `size` items (shorter only at the end of data). Sequences (str, bytes,
+    memoryview) are sliced by offset. Streams are read from their current
+    position in buffers of chunksize items, only the unconsumed tail of a
+    buffer is carried over.
+    """
+    if not hasattr(data, "read"):
+        pos = 0
+        while pos < len(data):
+            section = data[pos : pos + size]
+            boundary = cut(section)
+            yield section[:boundary]
+            pos += boundary
+        return
+    buffer, pos, eof = data.read(0), 0, False
+    while True:
+        while not eof and len(buffer) - pos < size:
+            chunk = data.read(chunksize)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+        if pos >= len(buffer):
+            return
+        section = buffer[pos : pos + size]
+        boundary = cut(section)
+        yield section[:boundary]
+        pos += boundary
+
+
 class cd:
     """Context manager for changing the current working directory"""
 
@@ -10,6 +10,7 @@ import imageio_ffmpeg
 import iscc
 from loguru import logger as log
 from lxml import etree
+from iscc_bench.cache import cached
 from iscc_bench.utils import cd
 from iscc_bench.videoid.const import WTA_PERMUTATIONS
 
@@ -21,6 +22,7 @@ NSMAP = {
 }
 
 
+@cached("mp7v2_segments")
 def get_segments(file):
     """Get Video Segment Signatures (90 Frames).
 
@@ -4,7 +4,7 @@ v1 Winner Seed 10: AvgSim 3.75, AvgDis 29.833333333333332, AvgSpread 26.08333333
 V2 Winner Seed 70: AvgSim 8.590909090909092, AvgDis 31.59090909090909, AvgSpread 23
 """
 from os.path import basename
-import iscc
+from iscc_bench.algos.hamming import decode_codes, paired_distances
 from iscc_bench.readers.web_video import triplets
 from iscc_bench.videoid.mp7 import content_id_video
 from iscc_bench.videoid import mp7
@@ -14,17 +14,25 @@ from loguru import logger as log
 from statistics import mean
 
 
+def triplet_distances(bids, sids, uids):
+    """Similar and unrelated distances of all triplets in one call each"""
+    base = decode_codes(bids)
+    sims = paired_distances(base, decode_codes(sids)).tolist()
+    diss = paired_distances(base, decode_codes(uids)).tolist()
+    return sims, diss
+
+
 def score_v1():
     for seed in range(9, 12):
         mp7.WTA_SEED = seed
-        stats = []
+        qids, bids, sids, uids = [], [], [], []
         for base, similar, unrelated in triplets():
-            bid = content_id_video(base)
-            sid = content_id_video(similar)
-            uid = content_id_video(unrelated)
-            sim = iscc.distance(bid, sid)
-            dis = iscc.distance(bid, uid)
-            qid = basename(base).split("_")[0]
+            qids.append(basename(base).split("_")[0])
+            bids.append(content_id_video(base))
+            sids.append(content_id_video(similar))
+            uids.append(content_id_video(unrelated))
+        stats = []
+        for qid, sim, dis in zip(qids, *triplet_distances(bids, sids, uids)):
             r = dict(qid=qid, sim=sim, dis=dis, spr=dis - sim)
             stats.append(r)
             log.info(r)
@@ -39,7 +47,7 @@ def score_v1():
 def score_v2():
     for seed in range(0, 100):
         mp7_v2.WTA_SEED = seed
-        stats = []
+        qids, bids, sids, uids = [], [], [], []
         for base, similar, unrelated in triplets():
             try:
                 bid = cid_v2(base)
@@ -48,9 +56,12 @@ def score_v2():
             except Exception:
                 # log.error('failed signature creation')
                 continue
-            sim = iscc.distance(bid, sid)
-            dis = iscc.distance(bid, uid)
-            qid = basename(base).split("_")[0]
+            qids.append(basename(base).split("_")[0])
+            bids.append(bid)
+            sids.append(sid)
+            uids.append(uid)
+        stats = []
+        for qid, sim, dis in zip(qids, *triplet_distances(bids, sids, uids)):
             r = dict(qid=qid, sim=sim, dis=dis, spr=dis - sim)
             stats.append(r)
             # log.info(r)
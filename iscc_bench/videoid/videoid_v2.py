@@ -22,6 +22,7 @@ import xxhash
 from loguru import logger as log
 from lxml import etree
 
+from iscc_bench.algos.simhash import simhash
 from iscc_bench.algos.slide import sliding_window
 from iscc_bench.utils import cd
 
@@ -131,7 +132,7 @@ def segmet_to_simh(seg):
         print(hash_.hex())
         hashes.append(hash_)
     # print([s.hex() for s in hashes])
-    result = iscc.similarity_hash(hashes)
+    result = simhash(hashes)
     return result
 
 
@@ -140,7 +141,7 @@ def content_id_video(file, partial=False):
     segment_signatures = get_segments(file)
     segment_simhashes = [segmet_to_simh(seg) for seg in segment_signatures]
     print([s.hex() for s in segment_simhashes])
-    sh = iscc.similarity_hash(segment_simhashes)
+    sh = simhash(segment_simhashes)
     if partial:
         content_id_video_digest = iscc.HEAD_CID_V_PCF + sh
     else:
@@ -13,6 +13,7 @@ setup(
     long_description=__doc__,
     packages=find_packages(exclude=["tests"]),
     include_package_data=True,
+    package_data={"iscc_bench.textid": ["tables/*.npz"]},
     zip_safe=False,
     platforms="any",
     install_requires=dependencies,